@@ -0,0 +1,160 @@
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+import multiprocessing
+from pathlib import Path
+import cv2
+from pipeline import MatchingPipeline
+from timing import latency_percentiles, format_percentiles
+from store import ResultStore
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff'}
+
+# Built once per worker process by _init_worker
+_worker_pipeline = None
+
+
+def load_pairs(source: str) -> list:
+    """
+    Build list of (img1_path, img2_path) pairs
+
+    source can be:
+      - a directory: every unordered pair of images inside it
+      - a manifest file: one "img1,img2" pair per line (tab also accepted),
+        relative paths are resolved against the manifest's folder
+
+    Raises ValueError listing every manifest line without two image paths
+    """
+    source = Path(source)
+
+    if source.is_dir():
+        images = sorted(p for p in source.iterdir()
+                        if p.suffix.lower() in IMAGE_EXTENSIONS)
+        return [(str(a), str(b)) for a, b in itertools.combinations(images, 2)]
+
+    pairs = []
+    bad_lines = []
+    with open(source) as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            # Skip blank lines and comments
+            if not line or line.startswith('#'):
+                continue
+            parts = [part.strip() for part in line.replace('\t', ',').split(',')[:2]]
+            if len(parts) < 2 or not all(parts):
+                bad_lines.append(f"  line {number}: {line!r}")
+                continue
+            img1, img2 = parts
+            pairs.append((str(source.parent / img1), str(source.parent / img2)))
+
+    if bad_lines:
+        raise ValueError(f"{source}: {len(bad_lines)} manifest line(s) need "
+                         f"\"img1,img2\":\n" + "\n".join(bad_lines))
+    return pairs
+
+
+def _init_worker(cache_dir):
+    """Create extractors and matchers once per worker process"""
+    global _worker_pipeline
+    # One OpenCV thread per process, the pool already uses every core
+    cv2.setNumThreads(1)
+    _worker_pipeline = MatchingPipeline(cache_dir=cache_dir)
+
+
+def _match_pair(pair) -> dict:
+    """Worker task: run all methods on one pair, return picklable summary"""
+    img1_path, img2_path = pair
+    record = {'img1': img1_path, 'img2': img2_path}
+
+    try:
+        results = _worker_pipeline.match_pair(img1_path, img2_path)
+        record['results'] = [result.get_summary() for result in results]
+    except (ValueError, cv2.error) as e:
+        # Unreadable image or OpenCV failure should not abort the whole batch
+        record['error'] = str(e)
+
+    return record
+
+
+def run_batch(pairs, workers: int = None, cache_dir: str = None,
+              chunksize: int = 4):
+    """
+    Match many pairs on a process pool
+    Yields one record per pair as soon as it finishes (unordered)
+    """
+    workers = workers or os.cpu_count()
+
+    with multiprocessing.Pool(workers, initializer=_init_worker,
+                              initargs=(cache_dir,)) as pool:
+        for record in pool.imap_unordered(_match_pair, pairs, chunksize=chunksize):
+            yield record
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch fingerprint matching")
+    parser.add_argument('source', help="image directory or pair manifest file")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="worker processes (default: all cores)")
+    parser.add_argument('--cache-dir', default=None,
+                        help="descriptor cache directory (disabled by default)")
+    parser.add_argument('--output', default=None,
+                        help="write one JSON record per pair to this file")
+    parser.add_argument('--results-dir', default=None,
+                        help="append every result to a run file in this store")
+    args = parser.parse_args()
+
+    try:
+        pairs = load_pairs(args.source)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    print(f"Matching {len(pairs)} pairs with {args.workers or os.cpu_count()} workers")
+
+    output = open(args.output, 'w') if args.output else None
+    store = ResultStore(args.results_dir) if args.results_dir else None
+    start_time = time.perf_counter()
+    done = failed = 0
+    summaries = []
+
+    try:
+        for record in run_batch(pairs, args.workers, args.cache_dir):
+            done += 1
+            name = f"{Path(record['img1']).name} vs {Path(record['img2']).name}"
+
+            if 'error' in record:
+                failed += 1
+                print(f"[{done}/{len(pairs)}] {name}: ERROR {record['error']}")
+                if store:
+                    store.append_error(record['img1'], record['img2'], record['error'])
+            else:
+                summaries.extend(record['results'])
+                matches = ", ".join(f"{r['method']}={r['matches']}"
+                                    for r in record['results'])
+                print(f"[{done}/{len(pairs)}] {name}: {matches}")
+                if store:
+                    for summary in record['results']:
+                        store.append(summary, record['img1'], record['img2'])
+
+            if output:
+                output.write(json.dumps(record) + "\n")
+    finally:
+        if output:
+            output.close()
+        if store:
+            store.close()
+            print(f"Results stored in: {store.path}")
+
+    elapsed = time.perf_counter() - start_time
+    print(f"\nDone: {done} pairs ({failed} failed) in {elapsed:.2f}s "
+          f"({done / elapsed if elapsed else 0:.1f} pairs/s)")
+    if summaries:
+        print("\nLatency percentiles:")
+        print(format_percentiles(latency_percentiles(summaries)))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,443 @@
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import itertools
+import tracemalloc
+from pathlib import Path
+from datetime import datetime
+import cv2
+import numpy as np
+from extractors import ORBExtractor, SIFTExtractor
+from matchers import BFMatcher, FLANNMatcher, LSHMatcher, PopcountMatcher, BruteForceIndex
+from minutiae import MinutiaeExtractor, MinutiaeMatcher
+from compression import CompressedMatcher, UInt8Codec, PCACodec, PQCodec
+from image_matcher import ImageMatcher
+from preprocessor import ImagePreprocessor
+from timing import latency_percentiles
+from verification import GeometricVerifier
+
+EXTRACTORS = {'ORB': ORBExtractor, 'SIFT': SIFTExtractor, 'MINUTIAE': MinutiaeExtractor}
+MATCHERS = {
+    'BF': BFMatcher,
+    'FLANN': FLANNMatcher,
+    'LSH': LSHMatcher,
+    'POPCOUNT': PopcountMatcher,
+    # Compressed float descriptors, a fresh codec per configuration
+    'U8': lambda ratio_threshold=0.7: CompressedMatcher(UInt8Codec(), ratio_threshold),
+    'PCA': lambda ratio_threshold=0.7: CompressedMatcher(PCACodec(), ratio_threshold),
+    'PQ': lambda ratio_threshold=0.7: CompressedMatcher(PQCodec(), ratio_threshold),
+    # Minutiae alignment, pairs only with the MINUTIAE extractor
+    'HOUGH': MinutiaeMatcher,
+}
+
+# Same decision rule as main.py
+MATCH_THRESHOLD = 10
+
+# Held-out training prints use seed + this, never the evaluated prints
+TRAINING_SEED_OFFSET = 1000
+
+
+def synthetic_fingerprint(rng: np.random.Generator, size: int = 320) -> np.ndarray:
+    """
+    Fingerprint-like grayscale image: dark ridges on white paper
+
+    Ridges follow the phase of a distorted radial pattern around a random
+    core, with smooth random warping so every seed gives a distinct print.
+    """
+    y, x = np.mgrid[0:size, 0:size].astype(np.float32)
+    cx, cy = rng.uniform(0.35, 0.65, 2) * size
+
+    # Radial rings, bent by angle-dependent terms (loop/whorl-like flow)
+    radius = np.hypot(x - cx, y - cy)
+    angle = np.arctan2(y - cy, x - cx)
+    period = rng.uniform(7.0, 10.0)
+    phase = (2 * np.pi * radius / period
+             + rng.uniform(2, 5) * np.sin(angle * rng.integers(1, 4) + rng.uniform(0, np.pi)))
+
+    # Low frequency warp makes ridge flow irregular
+    warp = rng.normal(0, 1, (size, size)).astype(np.float32)
+    warp = cv2.GaussianBlur(warp, (0, 0), size / 12)
+    phase += warp / (warp.std() + 1e-6) * 3.0
+
+    ridges = 0.5 + 0.5 * np.cos(phase)
+
+    # Elliptical finger contact area, paper white outside
+    ax, ay = rng.uniform(0.32, 0.42) * size, rng.uniform(0.40, 0.48) * size
+    inside = ((x - size / 2) / ax) ** 2 + ((y - size / 2) / ay) ** 2 <= 1.0
+
+    img = np.where(inside, 255 - ridges * 200, 255).astype(np.float32)
+    img += rng.normal(0, 8, img.shape)
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+
+def random_affine(rng: np.random.Generator, size: int, max_angle: float = 15,
+                  max_shift: float = 15, max_scale: float = 0.05) -> np.ndarray:
+    """Random rotation + scale + shift as 2x3 matrix (img1 → img2 coords)"""
+    matrix = cv2.getRotationMatrix2D(
+        (size / 2, size / 2),
+        rng.uniform(-max_angle, max_angle),
+        1.0 + rng.uniform(-max_scale, max_scale)
+    )
+    matrix[:, 2] += rng.uniform(-max_shift, max_shift, 2)
+    return matrix
+
+
+def make_dataset(directory: str, num_prints: int = 10, size: int = 320,
+                 seed: int = 0) -> list:
+    """
+    Write synthetic prints and transformed impressions to directory
+
+    Returns list of dicts: {'id', 'base', 'probe', 'transform'}
+    where transform maps base coordinates to probe coordinates
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+
+    dataset = []
+    for i in range(num_prints):
+        base = synthetic_fingerprint(rng, size)
+        matrix = random_affine(rng, size)
+
+        # Second impression: moved finger, slightly different pressure/noise
+        probe = cv2.warpAffine(base, matrix, (size, size), borderValue=255)
+        probe = cv2.GaussianBlur(probe, (3, 3), 0)
+        noisy = probe.astype(np.float32) + rng.normal(0, 6, probe.shape)
+        probe = np.clip(noisy, 0, 255).astype(np.uint8)
+
+        base_path = directory / f"print_{i:04d}_a.png"
+        probe_path = directory / f"print_{i:04d}_b.png"
+        cv2.imwrite(str(base_path), base)
+        cv2.imwrite(str(probe_path), probe)
+        dataset.append({'id': f"print_{i:04d}", 'base': str(base_path),
+                        'probe': str(probe_path), 'transform': matrix})
+
+    return dataset
+
+
+def match_precision(image_matcher: ImageMatcher, entry: dict,
+                    tolerance: float = 8.0) -> tuple:
+    """
+    Fraction of ratio-test matches consistent with the known transform
+    Returns (correct, total)
+    """
+    result = image_matcher.match_images(entry['base'], entry['probe'])
+    if result.num_matches == 0:
+        return 0, 0
+    pts1, pts2 = result.pts1, result.pts2
+
+    # Project base keypoints with the ground-truth transform
+    projected = pts1 @ entry['transform'][:, :2].T + entry['transform'][:, 2]
+    errors = np.linalg.norm(projected - pts2, axis=1)
+    return int((errors < tolerance).sum()), result.num_matches
+
+
+def match_recall(image_matcher: ImageMatcher, entry: dict) -> tuple:
+    """
+    Ratio-test matches of an exact uncompressed search that the configured
+    matcher also finds (approximate search and compression lose some)
+    Returns (found, total)
+    """
+    _, des1 = image_matcher.extract_features(entry['base'])
+    _, des2 = image_matcher.extract_features(entry['probe'])
+    if des1 is None or des2 is None or len(des2) < 2:
+        return 0, 0
+    if isinstance(image_matcher.matcher, MinutiaeMatcher):
+        # Alignment based pairing has no exact knn reference
+        return 0, 0
+
+    matcher = image_matcher.matcher
+    norm_type = cv2.NORM_HAMMING if image_matcher.extractor.binary else cv2.NORM_L2
+    indices, distances = BruteForceIndex(des2, norm_type).knn_search(des1, 2)
+    exact_query, exact_train, _ = matcher.ratio_test(indices, distances)
+    query_idx, train_idx, _ = matcher.match_arrays(des1, des2)
+
+    # (query, train) pairs as single integers for the set intersection
+    exact = exact_query.astype(np.int64) * len(des2) + exact_train
+    found = query_idx.astype(np.int64) * len(des2) + train_idx
+    return int(np.intersect1d(exact, found).size), len(exact)
+
+
+def roc_auc(genuine: list, impostor: list) -> float:
+    """Probability that a genuine pair scores above an impostor pair"""
+    genuine = np.asarray(genuine, dtype=np.float64)[:, None]
+    impostor = np.asarray(impostor, dtype=np.float64)[None, :]
+    wins = (genuine > impostor).sum() + 0.5 * (genuine == impostor).sum()
+    return float(wins / (genuine.size * impostor.size))
+
+
+def run_config(extractor_name: str, matcher_name: str, nfeatures: int,
+               ratio: float, dataset: list, repeats: int = 1,
+               verify: bool = False, segment: bool = False,
+               reduce_factor: int = 1, ridge_period: float = None,
+               training: list = None) -> dict:
+    """
+    Benchmark one extractor/matcher configuration on the dataset
+    training: held-out prints (make_dataset with another seed) that
+              compressed matchers fit their codebooks on
+    """
+    image_matcher = ImageMatcher(
+        extractor=EXTRACTORS[extractor_name](nfeatures=nfeatures),
+        matcher=MATCHERS[matcher_name](ratio_threshold=ratio),
+        verifier=GeometricVerifier() if verify else None,
+        preprocessor=ImagePreprocessor(segment=segment, reduce_factor=reduce_factor,
+                                       target_ridge_period=ridge_period)
+    )
+
+    # Codebooks fit on the evaluated prints would overstate recall
+    if isinstance(image_matcher.matcher, CompressedMatcher):
+        if not training:
+            raise ValueError("Compressed matchers need held-out training prints")
+        image_matcher.matcher.fit(_base_descriptors(image_matcher, training))
+    encoded = image_matcher.matcher.encode(_base_descriptors(image_matcher, dataset))
+
+    # Genuine: both impressions of a print, impostor: neighbouring prints
+    genuine_pairs = [(e['base'], e['probe']) for e in dataset]
+    impostor_pairs = [(dataset[i]['base'], dataset[(i + 1) % len(dataset)]['probe'])
+                      for i in range(len(dataset))]
+
+    # Warm-up so one-time OpenCV initialization is not measured
+    image_matcher.match_images(*genuine_pairs[0])
+
+    summaries = []
+    genuine_scores, impostor_scores = [], []
+    start_time = time.perf_counter()
+
+    for _ in range(repeats):
+        for pairs, scores in ((genuine_pairs, genuine_scores),
+                              (impostor_pairs, impostor_scores)):
+            for img1, img2 in pairs:
+                result = image_matcher.match_images(img1, img2)
+                summaries.append(result.get_summary())
+                scores.append(result.score)
+
+    elapsed = time.perf_counter() - start_time
+
+    # Peak memory of one comparison, traced outside the timed loop
+    # (tracemalloc slows down every allocation)
+    tracemalloc.start()
+    image_matcher.match_images(*genuine_pairs[0])
+    _, peak_traced = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # Accuracy against ground truth (outside the timed loop)
+    correct = total = 0
+    found = exact = 0
+    for entry in dataset:
+        c, t = match_precision(image_matcher, entry)
+        correct += c
+        total += t
+        f, e = match_recall(image_matcher, entry)
+        found += f
+        exact += e
+
+    latency = latency_percentiles(summaries)[image_matcher.extractor.name + "+"
+                                             + image_matcher.matcher.name]
+    return {
+        'extractor': extractor_name,
+        'matcher': matcher_name,
+        'nfeatures': nfeatures,
+        'ratio_threshold': ratio,
+        'verify': verify,
+        'segment': segment,
+        'reduce_factor': reduce_factor,
+        'ridge_period': ridge_period,
+        'comparisons': len(summaries),
+        'throughput_per_s': len(summaries) / elapsed if elapsed else 0.0,
+        'latency': latency,
+        'peak_traced_mb': peak_traced / 1e6,
+        'max_rss_mb': _max_rss_mb(),
+        'match_precision': correct / total if total else 0.0,
+        'match_recall': found / exact if exact else 0.0,
+        'bytes_per_descriptor': encoded.nbytes / len(encoded) if len(encoded) else 0.0,
+        'tar': float(np.mean(np.asarray(genuine_scores) > MATCH_THRESHOLD)),
+        'far': float(np.mean(np.asarray(impostor_scores) > MATCH_THRESHOLD)),
+        'auc': roc_auc(genuine_scores, impostor_scores),
+        'mean_genuine_matches': float(np.mean(genuine_scores)),
+        'mean_impostor_matches': float(np.mean(impostor_scores))
+    }
+
+
+def _base_descriptors(image_matcher: ImageMatcher, dataset: list) -> np.ndarray:
+    """Descriptors of every base impression, stacked"""
+    descriptors = [image_matcher.extract_features(e['base'])[1] for e in dataset]
+    return np.concatenate([d for d in descriptors if d is not None])
+
+
+def compare_runs(current: dict, baseline: dict, tolerance: float = 0.2) -> list:
+    """
+    Flag configurations that got slower or less accurate than the baseline
+    tolerance: allowed relative slowdown (0.2 → 20%)
+    """
+    def key(r):
+        return (r['extractor'], r['matcher'], r['nfeatures'], r['ratio_threshold'],
+                r.get('verify', False), r.get('segment', False),
+                r.get('reduce_factor', 1), r.get('ridge_period'))
+
+    baseline_results = {key(r): r for r in baseline['results']}
+    regressions = []
+
+    for result in current['results']:
+        old = baseline_results.get(key(result))
+        if old is None:
+            continue
+        name = "{}+{} n={} r={} verify={} segment={} reduce={} period={}".format(*key(result))
+
+        old_p50 = old['latency']['total']['p50']
+        new_p50 = result['latency']['total']['p50']
+        if old_p50 > 0 and new_p50 > old_p50 * (1 + tolerance):
+            regressions.append(f"{name}: p50 latency {old_p50 * 1000:.2f}ms "
+                               f"→ {new_p50 * 1000:.2f}ms")
+
+        if result['throughput_per_s'] < old['throughput_per_s'] / (1 + tolerance):
+            regressions.append(f"{name}: throughput {old['throughput_per_s']:.1f}/s "
+                               f"→ {result['throughput_per_s']:.1f}/s")
+
+        # FLANN trees are randomized, allow small accuracy drift
+        if result['auc'] < old['auc'] - 0.05:
+            regressions.append(f"{name}: AUC {old['auc']:.3f} → {result['auc']:.3f}")
+        if 'match_recall' in old and result['match_recall'] < old['match_recall'] - 0.05:
+            regressions.append(f"{name}: recall {old['match_recall']:.3f} "
+                               f"→ {result['match_recall']:.3f}")
+
+    # Interpreter start of the CLI, not part of any configuration
+    old_start = baseline.get('cold_start', {}).get('wall_seconds')
+    new_start = current.get('cold_start', {}).get('wall_seconds')
+    if old_start and new_start and new_start > old_start * (1 + tolerance):
+        regressions.append(f"cold start {old_start * 1000:.0f}ms → {new_start * 1000:.0f}ms")
+
+    return regressions
+
+
+def cold_start(repeats: int = 3) -> dict:
+    """
+    Fresh-interpreter start of the headless CLI (imports + argument parsing)
+    Best of repeats, also records whether matplotlib got imported
+    """
+    code = ("import sys, time; start = time.perf_counter(); import cli; "
+            "cli.build_parser(); print(time.perf_counter() - start, "
+            "'matplotlib' in sys.modules)")
+    import_times, wall_times = [], []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', code], check=True,
+                                capture_output=True, text=True,
+                                cwd=Path(__file__).parent).stdout.split()
+        wall_times.append(time.perf_counter() - start)
+        import_times.append(float(output[0]))
+
+    return {
+        'wall_seconds': min(wall_times),
+        'import_seconds': min(import_times),
+        'matplotlib_loaded': output[1] == 'True'
+    }
+
+
+def _max_rss_mb() -> float:
+    # ru_maxrss is KB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1e6 if sys.platform == 'darwin' else rss / 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extractor/matcher benchmark")
+    parser.add_argument('--prints', type=int, default=10, help="synthetic prints")
+    parser.add_argument('--size', type=int, default=320, help="image size in pixels")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeats', type=int, default=1)
+    # Synthetic prints are smooth ridge flows with almost no minutiae,
+    # so MINUTIAE only runs when asked for
+    parser.add_argument('--extractors', nargs='+', default=['ORB', 'SIFT'],
+                        choices=list(EXTRACTORS))
+    parser.add_argument('--matchers', nargs='+', default=list(MATCHERS))
+    parser.add_argument('--nfeatures', nargs='+', type=int, default=[500, 1000])
+    parser.add_argument('--ratios', nargs='+', type=float, default=[0.7, 0.8])
+    parser.add_argument('--verify', action='store_true',
+                        help="score pairs by RANSAC inliers instead of matches")
+    parser.add_argument('--segment', action='store_true',
+                        help="restrict extraction to the foreground mask")
+    parser.add_argument('--reduce', type=int, default=1, choices=(1, 2, 4, 8),
+                        help="decode images at 1/reduce resolution")
+    parser.add_argument('--ridge-period', type=float, default=None,
+                        help="downsample until ridges repeat every N pixels")
+    parser.add_argument('--threads', type=int, default=1,
+                        help="OpenCV threads (1 keeps runs comparable)")
+    parser.add_argument('--output', default=None, help="write JSON results here")
+    parser.add_argument('--compare', default=None, help="baseline JSON to compare")
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    # Reproducible: fixed seeds and thread count
+    cv2.setNumThreads(args.threads)
+    cv2.setRNGSeed(args.seed)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'opencv': cv2.__version__,
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'args': vars(args)
+        },
+        'cold_start': cold_start(),
+        'results': []
+    }
+    print(f"Cold start: {report['cold_start']['wall_seconds'] * 1000:.0f}ms "
+          f"(imports {report['cold_start']['import_seconds'] * 1000:.0f}ms, "
+          f"matplotlib loaded: {report['cold_start']['matplotlib_loaded']})")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        dataset = make_dataset(Path(tmp_dir) / "eval", args.prints, args.size, args.seed)
+        # Codebook training prints, only generated when a sweep needs them
+        training = None
+        if any(isinstance(MATCHERS[name](), CompressedMatcher) for name in args.matchers):
+            training = make_dataset(Path(tmp_dir) / "train", args.prints, args.size,
+                                    args.seed + TRAINING_SEED_OFFSET)
+
+        for extractor_name, matcher_name, nfeatures, ratio in itertools.product(
+                args.extractors, args.matchers, args.nfeatures, args.ratios):
+            # Binary descriptors need Hamming matchers, float ones need L2,
+            # minutiae arrays (binary None) need the HOUGH matcher
+            extractor_binary = EXTRACTORS[extractor_name](nfeatures=1).binary
+            if extractor_binary != MATCHERS[matcher_name]().binary:
+                continue
+
+            result = run_config(extractor_name, matcher_name, nfeatures, ratio,
+                                dataset, args.repeats, args.verify, args.segment,
+                                args.reduce, args.ridge_period, training)
+            report['results'].append(result)
+            print(f"{extractor_name}+{matcher_name} n={nfeatures} r={ratio}: "
+                  f"{result['throughput_per_s']:.1f} cmp/s, "
+                  f"p50={result['latency']['total']['p50'] * 1000:.2f}ms, "
+                  f"p95={result['latency']['total']['p95'] * 1000:.2f}ms, "
+                  f"AUC={result['auc']:.3f}, precision={result['match_precision']:.2f}, "
+                  f"recall={result['match_recall']:.2f}, "
+                  f"{result['bytes_per_descriptor']:.0f}B/desc, "
+                  f"peak={result['peak_traced_mb']:.1f}MB")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBenchmark saved to: {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare_runs(report, json.load(f), args.tolerance)
+        if regressions:
+            print("\nREGRESSIONS:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("\nNo regressions against baseline")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,195 @@
+import os
+import json
+import struct
+import hashlib
+import threading
+import cv2
+import numpy as np
+from pathlib import Path
+
+
+class DescriptorCache:
+    """
+    Persistent on-disk cache of (keypoints, descriptors)
+
+    Entries are keyed by the image content hash plus the extractor,
+    preprocessing and quality gate configuration, so a hit skips decoding,
+    binarization and detection entirely. The directory is size bounded: once it grows past
+    max_bytes the least recently used entries are deleted.
+    """
+
+    # File layout: header, keypoint floats, keypoint ints, descriptor bytes
+    MAGIC = b"FPDC"
+    VERSION = 1
+    HEADER = struct.Struct("<4sHHIII")  # magic, version, dtype, n_kp, rows, cols
+    DTYPES = {0: np.uint8, 1: np.float32}
+
+    def __init__(self, cache_dir: str = "cache",
+                 max_bytes: int = 512 * 1024 * 1024):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+        # Content hashes memoized per (path, mtime, size) within this process
+        self._hashes = {}
+        self._total_bytes = sum(p.stat().st_size for p in self._entries())
+
+        self.hits = 0
+        self.misses = 0
+
+    def make_key(self, image_path: str, extractor, preprocessor,
+                 quality_gate=None) -> str:
+        """
+        Build cache key from file content and extraction settings
+        Gated runs key on the gate thresholds, so they never reuse entries
+        of captures cached by an ungated run or a looser gate
+        """
+        config = {
+            'extractor': extractor.name,
+            'nfeatures': extractor.nfeatures,
+            'preprocess': preprocessor.get_params()
+        }
+        if quality_gate is not None:
+            config['quality'] = quality_gate.get_params()
+        config_hash = hashlib.blake2b(
+            json.dumps(config, sort_keys=True).encode(), digest_size=8
+        ).hexdigest()
+        return f"{self._content_hash(image_path)}-{config_hash}"
+
+    def get(self, key: str):
+        """Return (keypoints, descriptors) or None on a miss"""
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+
+        # Truncated or corrupt entries (writer killed mid-write on a shared
+        # directory) are misses, the caller's put() rewrites them
+        features = self._decode(data)
+        if features is None:
+            self.misses += 1
+            return None
+
+        # Touch entry so eviction treats it as recently used
+        os.utime(path)
+        self.hits += 1
+        return features
+
+    def put(self, key: str, keypoints, descriptors):
+        """Store features and evict old entries if over the size limit"""
+        data = self._encode(keypoints, descriptors)
+        path = self._path(key)
+        # Overwriting an entry replaces its bytes instead of adding to them
+        try:
+            previous = path.stat().st_size
+        except FileNotFoundError:
+            previous = 0
+
+        # Write to temp file first so readers never see partial entries,
+        # named per thread so writers in one process never share it
+        tmp_path = path.with_suffix(f".tmp{os.getpid()}-{threading.get_ident()}")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+
+        self._total_bytes += len(data) - previous
+        if self._total_bytes > self.max_bytes:
+            self._evict()
+
+    def clear(self):
+        """Delete all cached entries"""
+        for path in self._entries():
+            path.unlink(missing_ok=True)
+        self._total_bytes = 0
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.fpdc"
+
+    def _entries(self) -> list:
+        return list(self.cache_dir.glob("*.fpdc"))
+
+    def _content_hash(self, image_path: str) -> str:
+        stat = os.stat(image_path)
+        memo_key = (str(image_path), stat.st_mtime_ns, stat.st_size)
+
+        if memo_key not in self._hashes:
+            digest = hashlib.blake2b(digest_size=16)
+            with open(image_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+            self._hashes[memo_key] = digest.hexdigest()
+
+        return self._hashes[memo_key]
+
+    def _evict(self):
+        """Delete least recently used entries down to 80% of max_bytes"""
+        entries = []
+        for path in self._entries():
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        total = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * 0.8)
+        for _, size, path in entries:
+            if total <= target:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+        self._total_bytes = total
+
+    def _encode(self, keypoints, descriptors) -> bytes:
+        """Pack keypoints and descriptors into the binary entry format"""
+        kp_floats = np.array(
+            [(kp.pt[0], kp.pt[1], kp.size, kp.angle, kp.response) for kp in keypoints],
+            dtype=np.float32
+        ).reshape(-1, 5)
+        kp_ints = np.array(
+            [(kp.octave, kp.class_id) for kp in keypoints], dtype=np.int32
+        ).reshape(-1, 2)
+
+        if descriptors is None:
+            descriptors = np.empty((0, 0), dtype=np.uint8)
+        dtype_code = 0 if descriptors.dtype == np.uint8 else 1
+        descriptors = np.ascontiguousarray(descriptors, dtype=self.DTYPES[dtype_code])
+
+        header = self.HEADER.pack(self.MAGIC, self.VERSION, dtype_code,
+                                  len(kp_floats), *descriptors.shape)
+        return header + kp_floats.tobytes() + kp_ints.tobytes() + descriptors.tobytes()
+
+    def _decode(self, data: bytes) -> tuple:
+        """Unpack an entry back into (KeyPoint list, descriptors), None if invalid"""
+        if len(data) < self.HEADER.size:
+            return None
+        magic, version, dtype_code, n_kp, rows, cols = self.HEADER.unpack_from(data)
+        if (magic != self.MAGIC or version != self.VERSION
+                or dtype_code not in self.DTYPES):
+            return None
+        itemsize = np.dtype(self.DTYPES[dtype_code]).itemsize
+        if len(data) != self.HEADER.size + n_kp * 7 * 4 + rows * cols * itemsize:
+            return None
+
+        offset = self.HEADER.size
+        kp_floats = np.frombuffer(data, np.float32, n_kp * 5, offset).reshape(-1, 5)
+        offset += kp_floats.nbytes
+        kp_ints = np.frombuffer(data, np.int32, n_kp * 2, offset).reshape(-1, 2)
+        offset += kp_ints.nbytes
+
+        keypoints = tuple(
+            cv2.KeyPoint(float(x), float(y), float(size), float(angle),
+                         float(response), int(octave), int(class_id))
+            for (x, y, size, angle, response), (octave, class_id)
+            in zip(kp_floats, kp_ints)
+        )
+
+        descriptors = None
+        if rows > 0:
+            dtype = self.DTYPES[dtype_code]
+            descriptors = np.frombuffer(data, dtype, rows * cols, offset).reshape(rows, cols)
+
+        return keypoints, descriptors
@@ -0,0 +1,150 @@
+import time
+import numpy as np
+from extractors import ORBExtractor, SIFTExtractor
+from matchers import BFMatcher, FLANNMatcher
+from gallery import Gallery
+from results import Candidate, CascadeResult
+from timing import new_stage_times, stage
+
+
+class CascadeIdentifier:
+    """
+    Coarse-to-fine identification
+
+    Stage 1 (screen): cheap ORB + Hamming gallery search over every print.
+    Stage 2 (refine): expensive SIFT + FLANN matching only on the survivors.
+
+    Survivors of the screen are the top keep_fraction of the gallery,
+    clamped to [min_keep, max_keep], and must have at least
+    min_screen_matches votes.
+    """
+
+    def __init__(self, keep_fraction: float = 0.1, min_keep: int = 5,
+                 max_keep: int = 50, min_screen_matches: int = 1,
+                 screen_nfeatures: int = 500, refine_nfeatures: int = 1000,
+                 ratio_threshold: float = 0.7, cache=None, verifier=None,
+                 preprocessor=None):
+        self.keep_fraction = keep_fraction
+        self.min_keep = min_keep
+        self.max_keep = max_keep
+        self.min_screen_matches = min_screen_matches
+
+        # Every print is enrolled in both galleries
+        self.screen = Gallery(ORBExtractor(nfeatures=screen_nfeatures),
+                              BFMatcher(ratio_threshold=ratio_threshold),
+                              cache=cache, preprocessor=preprocessor)
+        self.refine = Gallery(SIFTExtractor(nfeatures=refine_nfeatures),
+                              FLANNMatcher(ratio_threshold=ratio_threshold),
+                              cache=cache, preprocessor=preprocessor)
+
+        # Optional GeometricVerifier for the refine stage score
+        self.verifier = verifier
+
+    def __len__(self) -> int:
+        return len(self.screen)
+
+    def enroll(self, print_id: str, image_path: str):
+        """Enroll one print in the screen and refine galleries"""
+        self.screen.enroll(print_id, image_path)
+        self.refine.enroll(print_id, image_path)
+
+    def enroll_many(self, items) -> int:
+        """Enroll an iterable of (print_id, image_path) pairs"""
+        count = 0
+        for print_id, image_path in items:
+            self.enroll(print_id, image_path)
+            count += 1
+        return count
+
+    def num_survivors(self) -> int:
+        """How many screen candidates go on to the refine stage"""
+        keep = int(np.ceil(len(self) * self.keep_fraction))
+        return min(len(self), max(self.min_keep, min(self.max_keep, keep)))
+
+    def identify(self, probe_path: str, top_k: int = 5) -> CascadeResult:
+        """Screen all prints with ORB, re-rank survivors with SIFT"""
+        start_time = time.perf_counter()
+        stage_times = new_stage_times()
+        gallery_size = len(self)
+
+        # === Stage 1: ORB screen over the whole gallery ===
+        screen_start = time.perf_counter()
+        _, screen_des = self.screen.image_matcher.extract_features(probe_path, stage_times)
+        with stage(stage_times, 'match'):
+            ranked = self.screen.search(screen_des, top_k=self.num_survivors())
+        survivors = [c for c in ranked if c.num_matches >= self.min_screen_matches]
+        screen_time = time.perf_counter() - screen_start
+
+        # === Stage 2: SIFT + FLANN on survivors only ===
+        refine_start = time.perf_counter()
+        candidates = []
+        num_kp_probe = 0
+        compare_time = 0.0
+        if survivors:
+            probe_kp, probe_des = self.refine.image_matcher.extract_features(
+                probe_path, stage_times)
+            num_kp_probe = len(probe_kp) if probe_kp else 0
+
+            compare_start = time.perf_counter()
+            candidates = self._refine(probe_kp, probe_des, survivors, stage_times)
+            compare_time = time.perf_counter() - compare_start
+        refine_time = time.perf_counter() - refine_start
+
+        candidates.sort(key=lambda c: c.num_matches, reverse=True)
+
+        # Dropped candidates would each have cost one refine comparison,
+        # the screen that dropped them is paid on every probe
+        dropped = gallery_size - len(survivors)
+        per_candidate = compare_time / len(survivors) if survivors else 0.0
+
+        stage_stats = [
+            {'name': f"screen {self.screen.extractor.name}+{self.screen.matcher.name}",
+             'candidates_in': gallery_size, 'kept': len(survivors),
+             'dropped': dropped, 'time': screen_time},
+            {'name': f"refine {self.refine.extractor.name}+{self.refine.matcher.name}",
+             'candidates_in': len(survivors), 'kept': min(top_k, len(candidates)),
+             'dropped': max(0, len(candidates) - top_k), 'time': refine_time},
+        ]
+
+        return CascadeResult(
+            method_name="Cascade",
+            candidates=candidates[:top_k],
+            num_kp_probe=num_kp_probe,
+            gallery_size=gallery_size,
+            processing_time=time.perf_counter() - start_time,
+            stage_times=stage_times,
+            stage_stats=stage_stats,
+            time_saved=per_candidate * dropped - screen_time
+        )
+
+    def _refine(self, probe_kp, probe_des, survivors: list, stage_times: dict) -> list:
+        """Score each survivor with SIFT ratio-test matches (or RANSAC inliers)"""
+        if probe_des is None or len(probe_des) < 2:
+            return [Candidate(c.print_id, 0) for c in survivors]
+
+        # Index the probe once, query it with each survivor's descriptors
+        matcher = self.refine.matcher
+        with stage(stage_times, 'match'):
+            probe_index = matcher.create_index(probe_des)
+        probe_pts = np.array([kp.pt for kp in probe_kp], dtype=np.float32)
+
+        candidates = []
+        for survivor in survivors:
+            gallery_pts, gallery_des = self.refine.get_features(survivor.print_id)
+            if len(gallery_des) == 0:
+                candidates.append(Candidate(survivor.print_id, 0))
+                continue
+
+            with stage(stage_times, 'match'):
+                indices, distances = probe_index.knn_search(gallery_des, 2)
+                query_idx, train_idx, _ = matcher.ratio_test(indices, distances)
+            score = len(query_idx)
+
+            if self.verifier is not None:
+                with stage(stage_times, 'verify'):
+                    score, _, _, _ = self.verifier.verify(gallery_pts[query_idx],
+                                                          probe_pts[train_idx])
+
+            candidates.append(Candidate(survivor.print_id, score))
+
+        return candidates
@@ -0,0 +1,117 @@
+import sys
+import json
+import argparse
+from pipeline import MatchingPipeline
+from verification import GeometricVerifier
+from quality import QualityGate
+
+# Same decision rule as main.py
+MATCH_THRESHOLD = 10
+
+METHODS = ('ORB+BF', 'SIFT+FLANN')
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Headless fingerprint matching "
+                    "(exit code 0 = match, 1 = no match, 2 = error or rejected capture)")
+    parser.add_argument('img1')
+    parser.add_argument('img2')
+    parser.add_argument('--methods', nargs='+', choices=METHODS, default=list(METHODS))
+    parser.add_argument('--verify', action='store_true',
+                        help="score by RANSAC inliers instead of good matches")
+    parser.add_argument('--segment', action='store_true',
+                        help="restrict extraction to the foreground mask")
+    parser.add_argument('--cache-dir', default=None,
+                        help="descriptor cache directory (disabled by default)")
+    parser.add_argument('--threshold', type=int, default=MATCH_THRESHOLD,
+                        help="minimum score every method must exceed")
+    parser.add_argument('--figure', default=None,
+                        help="write the match figure here (encoded with OpenCV)")
+    parser.add_argument('--quality-gate', action='store_true',
+                        help="reject poor captures before extraction")
+    parser.add_argument('--min-coverage', type=float, default=None,
+                        help="quality gate: minimum fraction of blocks with ridges")
+    parser.add_argument('--min-contrast', type=float, default=None,
+                        help="quality gate: minimum ridge/valley balance (0-1)")
+    parser.add_argument('--min-coherence', type=float, default=None,
+                        help="quality gate: minimum ridge orientation coherence (0-1)")
+    parser.add_argument('--json', action='store_true',
+                        help="print one JSON summary line per method")
+    parser.add_argument('--profile', default=None, metavar='MODES',
+                        help="profile the stages: comma list of sample, cprofile, memory")
+    parser.add_argument('--profile-dir', default="profiles",
+                        help="where --profile writes its output")
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+
+    if args.profile:
+        # Imported only when asked for, profiling stays out of the cold start
+        import profiling
+        try:
+            profiler = profiling.enable(profiling.parse_modes(args.profile),
+                                        args.profile_dir)
+        except ValueError as e:
+            print(f"ERROR: {e}", file=sys.stderr)
+            return 2
+        try:
+            return run(args)
+        finally:
+            for path in profiler.stop():
+                print(f"Profile written to: {path}", file=sys.stderr)
+    return run(args)
+
+
+def build_quality_gate(args):
+    """QualityGate from the CLI options, None unless one of them is given"""
+    thresholds = {name: getattr(args, name)
+                  for name in ('min_coverage', 'min_contrast', 'min_coherence')
+                  if getattr(args, name) is not None}
+    if not args.quality_gate and not thresholds:
+        return None
+    return QualityGate(**thresholds)
+
+
+def run(args) -> int:
+    pipeline = MatchingPipeline(
+        cache_dir=args.cache_dir,
+        verifier=GeometricVerifier(model='affine') if args.verify else None,
+        segment=args.segment,
+        quality_gate=build_quality_gate(args)
+    )
+    # Only run the requested methods
+    pipeline.matchers = [m for m in pipeline.matchers
+                         if f"{m.extractor.name}+{m.matcher.name}" in args.methods]
+
+    try:
+        results = pipeline.match_pair(args.img1, args.img2)
+    except ValueError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 2
+
+    rejected = [result.rejected for result in results if result.rejected is not None]
+    matched = all(result.score > args.threshold for result in results)
+
+    for result in results:
+        if args.json:
+            print(json.dumps(result.get_summary()))
+        else:
+            print(f"{result}\n")
+    if rejected:
+        # Every method sees the same images, the first reason is enough
+        print(f"REJECTED: {rejected[0]}", file=sys.stderr)
+        return 2
+    if not args.json:
+        print("MATCH" if matched else "NO MATCH")
+
+    if args.figure and pipeline.save_figure(results, args.figure):
+        print(f"Figure saved to: {args.figure}", file=sys.stderr)
+
+    return 0 if matched else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+import cv2
+import numpy as np
+from matchers import FeatureMatcher, BruteForceIndex, FlannIndex, _pad_knn
+
+
+class UInt8Codec:
+    """
+    SIFT descriptors as uint8 (128 bytes instead of 512)
+
+    OpenCV SIFT already scales and clamps every component to [0, 255], so
+    rounding loses almost nothing. No training needed.
+    """
+
+    name = "U8"
+
+    def fit(self, samples: np.ndarray):
+        return self
+
+    def encode(self, descriptors: np.ndarray) -> np.ndarray:
+        return np.clip(np.rint(descriptors), 0, 255).astype(np.uint8)
+
+    def create_index(self, codes: np.ndarray):
+        # batchDistance computes L2 on uint8 input directly
+        return EncodedQueryIndex(BruteForceIndex(codes, cv2.NORM_L2), self.encode)
+
+
+class PCACodec:
+    """
+    Project descriptors onto the top dim principal components (float32)
+
+    128 → 32 dimensions cuts memory 4× and makes the KD-tree search faster.
+    Must be fit on sample descriptors before use.
+    """
+
+    def __init__(self, dim: int = 32):
+        self.dim = dim
+        self.name = "PCA"
+        self.mean = None
+        self.components = None
+
+    def fit(self, samples: np.ndarray):
+        samples = np.asarray(samples, dtype=np.float32)
+        if len(samples) < self.dim:
+            raise ValueError(f"PCA needs at least {self.dim} sample descriptors")
+        self.mean, self.components = cv2.PCACompute(samples, mean=None,
+                                                    maxComponents=self.dim)
+        return self
+
+    def encode(self, descriptors: np.ndarray) -> np.ndarray:
+        if self.components is None:
+            raise ValueError("PCACodec must be fit before encoding")
+        centered = np.asarray(descriptors, dtype=np.float32) - self.mean
+        return np.ascontiguousarray(centered @ self.components.T)
+
+    def create_index(self, codes: np.ndarray):
+        index = FlannIndex(codes, dict(algorithm=1, trees=5), dict(checks=50),
+                           squared=True)
+        return EncodedQueryIndex(index, self.encode)
+
+
+class PQCodec:
+    """
+    Product quantization with asymmetric distance computation (ADC)
+
+    Each descriptor is split into num_subvectors chunks and every chunk is
+    replaced by the id of its nearest k-means centroid, so a 128-D SIFT
+    descriptor becomes num_subvectors bytes (16 → 32× smaller). Queries stay
+    uncompressed: distances are summed from per-query lookup tables.
+    """
+
+    def __init__(self, num_subvectors: int = 16, num_centroids: int = 256,
+                 iterations: int = 20, seed: int = 0):
+        if num_centroids > 256:
+            raise ValueError("num_centroids must fit in one byte (<= 256)")
+        self.num_subvectors = num_subvectors
+        self.num_centroids = num_centroids
+        self.iterations = iterations
+        self.seed = seed
+        self.name = "PQ"
+        # (num_subvectors, num_centroids, sub_dim) float32
+        self.centroids = None
+
+    def fit(self, samples: np.ndarray):
+        samples = np.asarray(samples, dtype=np.float32)
+        if samples.shape[1] % self.num_subvectors:
+            raise ValueError(f"Descriptor size {samples.shape[1]} is not divisible "
+                             f"by {self.num_subvectors} subvectors")
+        num_centroids = min(self.num_centroids, len(samples))
+        if num_centroids < 2:
+            raise ValueError("PQ needs at least 2 sample descriptors")
+
+        cv2.setRNGSeed(self.seed)
+        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER,
+                    self.iterations, 1e-3)
+        centroids = []
+        for chunk in self._split(samples):
+            _, _, centers = cv2.kmeans(np.ascontiguousarray(chunk), num_centroids,
+                                       None, criteria, 1, cv2.KMEANS_PP_CENTERS)
+            centroids.append(centers)
+        self.centroids = np.stack(centroids)
+        return self
+
+    def encode(self, descriptors: np.ndarray) -> np.ndarray:
+        if self.centroids is None:
+            raise ValueError("PQCodec must be fit before encoding")
+        descriptors = np.asarray(descriptors, dtype=np.float32)
+        codes = np.empty((len(descriptors), self.num_subvectors), dtype=np.uint8)
+        for j, chunk in enumerate(self._split(descriptors)):
+            if len(chunk):
+                _, nearest = cv2.batchDistance(chunk, self.centroids[j], cv2.CV_32F,
+                                               normType=cv2.NORM_L2SQR, K=1)
+                codes[:, j] = nearest[:, 0]
+        return codes
+
+    def create_index(self, codes: np.ndarray):
+        return ADCIndex(codes, self)
+
+    def distance_tables(self, query: np.ndarray) -> np.ndarray:
+        """Squared distances query chunk → centroid, (num_subvectors, n, num_centroids)"""
+        tables = []
+        for j, chunk in enumerate(self._split(np.asarray(query, dtype=np.float32))):
+            centroids = self.centroids[j]
+            # |q - c|² = |q|² + |c|² - 2 q·c, one matrix product per subspace
+            table = (np.einsum('ij,ij->i', chunk, chunk)[:, None]
+                     + np.einsum('ij,ij->i', centroids, centroids)[None, :]
+                     - 2 * chunk @ centroids.T)
+            tables.append(np.maximum(table, 0, out=table))
+        return np.stack(tables)
+
+    def _split(self, descriptors: np.ndarray) -> list:
+        return np.split(descriptors, self.num_subvectors, axis=1)
+
+
+class EncodedQueryIndex:
+    """Encodes queries with the codec, then searches the wrapped index"""
+
+    def __init__(self, index, encode):
+        self.index = index
+        self.encode = encode
+
+    def knn_search(self, query: np.ndarray, k: int) -> tuple:
+        return self.index.knn_search(self.encode(query), k)
+
+
+class ADCIndex:
+    """Exhaustive knn over PQ codes with asymmetric (raw query) distances"""
+
+    # Query rows per block, bounds the (rows × codes) distance matrix
+    MAX_BLOCK_ELEMENTS = 1 << 22
+
+    def __init__(self, codes: np.ndarray, codec: PQCodec):
+        self.codes = codes
+        self.codec = codec
+
+    def knn_search(self, query: np.ndarray, k: int) -> tuple:
+        """Returns (indices, distances) arrays of shape (len(query), k)"""
+        num_codes = len(self.codes)
+        kk = min(k, num_codes)
+        block = max(1, self.MAX_BLOCK_ELEMENTS // max(num_codes, 1))
+
+        indices = np.empty((len(query), kk), dtype=np.int32)
+        distances = np.empty((len(query), kk), dtype=np.float32)
+        for start in range(0, len(query), block):
+            tables = self.codec.distance_tables(query[start:start + block])
+
+            # Sum the looked-up chunk distances of every code
+            dist = np.zeros((tables.shape[1], num_codes), dtype=np.float32)
+            for j in range(self.codec.num_subvectors):
+                dist += tables[j][:, self.codes[:, j]]
+
+            # k smallest per row, then sort those k
+            nearest = np.argpartition(dist, kk - 1, axis=1)[:, :kk]
+            nearest_dist = np.take_along_axis(dist, nearest, axis=1)
+            order = np.argsort(nearest_dist, axis=1)
+            indices[start:start + block] = np.take_along_axis(nearest, order, axis=1)
+            distances[start:start + block] = np.take_along_axis(nearest_dist, order, axis=1)
+
+        # Squared → L2, ratio test thresholds stay comparable
+        np.sqrt(distances, out=distances)
+        return _pad_knn(indices, distances, k)
+
+
+class CompressedMatcher(FeatureMatcher):
+    """
+    Ratio-test matcher over compressed float descriptors
+
+    Train descriptors (e.g. a gallery) are stored as codec.encode() output
+    and searched in that form; queries are passed uncompressed.
+    """
+
+    def __init__(self, codec, ratio_threshold: float = 0.7):
+        super().__init__(ratio_threshold)
+        self.codec = codec
+        self.name = codec.name
+        self.binary = False
+
+    def fit(self, samples: np.ndarray):
+        """Train the codec (PCA / PQ) on representative descriptors"""
+        self.codec.fit(samples)
+        return self
+
+    def encode(self, descriptors: np.ndarray) -> np.ndarray:
+        return self.codec.encode(descriptors)
+
+    def create_index(self, train: np.ndarray):
+        return self.codec.create_index(np.ascontiguousarray(train))
@@ -9,13 +9,30 @@ class FeatureExtractor:
         self.nfeatures = nfeatures
         self.detector = None
 
-    def extract(self, image: np.ndarray) -> tuple:
-        """Extract keypoints and descriptors from image"""
+    def extract(self, image: np.ndarray, mask: np.ndarray = None) -> tuple:
+        """
+        Extract keypoints and descriptors from image
+        mask: optional foreground mask, detection only runs inside it
+        """
         if self.detector is None:
             raise NotImplementedError("Detector not initialized")
 
-        # Returns (keypoints, descriptors)
-        return self.detector.detectAndCompute(image, None)
+        if mask is None:
+            # Returns (keypoints, descriptors)
+            return self.detector.detectAndCompute(image, None)
+
+        # Crop to the mask bounding box so background pixels are not even
+        # part of the image pyramid, then shift keypoints back
+        x, y, w, h = cv2.boundingRect(mask)
+        if w == 0 or h == 0:
+            return (), None
+
+        keypoints, descriptors = self.detector.detectAndCompute(
+            image[y:y + h, x:x + w], mask[y:y + h, x:x + w]
+        )
+        for kp in keypoints:
+            kp.pt = (kp.pt[0] + x, kp.pt[1] + y)
+        return keypoints, descriptors
 
 
 class ORBExtractor(FeatureExtractor):
@@ -25,6 +42,7 @@ class ORBExtractor(FeatureExtractor):
         super().__init__(nfeatures)
         self.detector = cv2.ORB_create(nfeatures=nfeatures)
         self.name = "ORB"
+        self.binary = True
 
 
 class SIFTExtractor(FeatureExtractor):
@@ -33,4 +51,5 @@ class SIFTExtractor(FeatureExtractor):
     def __init__(self, nfeatures: int = 1000):
         super().__init__(nfeatures)
         self.detector = cv2.SIFT_create(nfeatures=nfeatures)
-        self.name = "SIFT"
\ No newline at end of file
+        self.name = "SIFT"
+        self.binary = False
\ No newline at end of file
@@ -0,0 +1,273 @@
+import time
+import numpy as np
+from image_matcher import ImageMatcher
+from matchers import _pad_knn
+from results import Candidate, IdentificationResult
+from timing import new_stage_times, stage
+
+
+class Gallery:
+    """
+    Enrolled prints for 1:N identification
+
+    Descriptors of every enrolled print are stacked into one matrix and
+    indexed once, so identifying a probe costs a single extraction plus a
+    single knn search instead of one full pairwise run per gallery print.
+    """
+
+    def __init__(self, extractor, matcher, knn: int = 4, cache=None,
+                 preprocessor=None):
+        # knn > 2 lets the ratio test find a second neighbour from the same
+        # print even when other prints sit between the two in descriptor space
+        self.image_matcher = ImageMatcher(extractor, matcher, cache=cache,
+                                          preprocessor=preprocessor)
+        self.extractor = extractor
+        self.matcher = matcher
+        self.knn = max(2, knn)
+
+        self.print_ids = []
+        self._positions = {}
+        self.descriptors = []
+        self.keypoints = []
+
+        self._index = None
+        self._owners = None
+
+    def __len__(self) -> int:
+        return len(self.print_ids)
+
+    def enroll(self, print_id: str, image_path: str) -> int:
+        """Extract and store features for one print, returns keypoint count"""
+        if print_id in self._positions:
+            raise ValueError(f"Print already enrolled: {print_id}")
+
+        kp, des = self.image_matcher.extract_features(image_path)
+        self.add_features(print_id, kp, des)
+        return len(kp) if kp else 0
+
+    def enroll_many(self, items, workers: int = 2, queue_size: int = 8) -> int:
+        """
+        Enroll an iterable of (print_id, image_path) pairs
+        Images are decoded ahead on a thread pool while features are extracted
+        """
+        items = list(items)
+        ids = [print_id for print_id, _ in items]
+
+        # Check every id before extracting anything
+        seen = set(self._positions)
+        for print_id in ids:
+            if print_id in seen:
+                raise ValueError(f"Print already enrolled: {print_id}")
+            seen.add(print_id)
+
+        features = self.image_matcher.extract_many(
+            [image_path for _, image_path in items], workers, queue_size)
+        for print_id, (kp, des) in zip(ids, features):
+            self.add_features(print_id, kp, des)
+        return len(items)
+
+    def add_features(self, print_id: str, keypoints, descriptors):
+        """Store already extracted features under print_id"""
+        if descriptors is None:
+            descriptors = np.empty((0, self._descriptor_size()),
+                                   dtype=self._descriptor_dtype())
+        else:
+            # Kept in the matcher's storage form (compressed for CompressedMatcher)
+            descriptors = self.matcher.encode(descriptors)
+
+        # Keep only the coordinates, KeyPoint objects are heavy
+        coords = np.array([kp.pt for kp in keypoints], dtype=np.float32)
+        self.add_stored(print_id, coords, descriptors)
+
+    def add_stored(self, print_id: str, coords: np.ndarray, descriptors: np.ndarray):
+        """Store features already in storage form (as returned by get_features)"""
+        if print_id in self._positions:
+            raise ValueError(f"Print already enrolled: {print_id}")
+
+        self._positions[print_id] = len(self.print_ids)
+        self.print_ids.append(print_id)
+        self.descriptors.append(np.ascontiguousarray(descriptors))
+        self.keypoints.append(np.asarray(coords, dtype=np.float32).reshape(-1, 2))
+
+        # Index is rebuilt lazily on the next search
+        self._owners = None
+
+    def remove(self, print_id: str):
+        """Drop one enrolled print, the index is rebuilt on the next search"""
+        position = self._positions.pop(print_id)
+        del self.print_ids[position]
+        del self.descriptors[position]
+        del self.keypoints[position]
+        for i in range(position, len(self.print_ids)):
+            self._positions[self.print_ids[i]] = i
+        self._owners = None
+
+    def position(self, print_id: str) -> int:
+        """Enrollment position of print_id, -1 if absent"""
+        return self._positions.get(print_id, -1)
+
+    def get_features(self, print_id: str) -> tuple:
+        """Stored (keypoint coordinates, descriptors) of one enrolled print"""
+        position = self._positions[print_id]
+        return self.keypoints[position], self.descriptors[position]
+
+    def identify(self, probe_path: str, top_k: int = 5) -> IdentificationResult:
+        """Return the top_k enrolled prints ranked by good matches"""
+        start_time = time.perf_counter()
+        stage_times = new_stage_times()
+
+        kp, des = self.image_matcher.extract_features(probe_path, stage_times)
+        with stage(stage_times, 'match'):
+            candidates = self.search(des, top_k)
+
+        return IdentificationResult(
+            method_name=f"{self.extractor.name}+{self.matcher.name}",
+            candidates=candidates,
+            num_kp_probe=len(kp) if kp else 0,
+            gallery_size=len(self),
+            processing_time=time.perf_counter() - start_time,
+            stage_times=stage_times
+        )
+
+    def search(self, descriptors: np.ndarray, top_k: int = 5) -> list:
+        """Rank gallery prints for already extracted probe descriptors"""
+        votes = self.scores(descriptors)
+        if votes is None:
+            return []
+        return self._top_candidates(votes, top_k)
+
+    def scores(self, descriptors: np.ndarray):
+        """
+        Good match count of every enrolled print (enrollment order)
+        None when there is nothing to search
+        """
+        if descriptors is None or len(descriptors) == 0 or len(self) == 0:
+            return None
+
+        if self._owners is None:
+            self._build_index()
+        if len(self._owners) < self.knn:
+            return None
+
+        if hasattr(self.matcher, 'create_gallery_index'):
+            # Matcher runs the ratio test per print itself (exact, one call)
+            return self._index.print_scores(descriptors, self.matcher.ratio_threshold)
+        # One batched knn query against the whole gallery
+        train_idx, distances = self._index.knn_search(descriptors, self.knn)
+        return self._vote(train_idx, distances)
+
+    def search_many(self, descriptor_sets: list, top_k: int = 5) -> list:
+        """
+        Rank gallery prints for several probes at once
+        Returns one candidate list per probe
+        """
+        return [[] if votes is None else self._top_candidates(votes, top_k)
+                for votes in self.scores_many(descriptor_sets)]
+
+    def scores_many(self, descriptor_sets: list) -> list:
+        """
+        scores() of several probes, one entry (or None) per probe
+        knn matchers answer all probes with a single stacked query
+        """
+        all_votes = [None for _ in descriptor_sets]
+        probes = [i for i, des in enumerate(descriptor_sets)
+                  if des is not None and len(des) > 0]
+        if not probes or len(self) == 0:
+            return all_votes
+
+        if self._owners is None:
+            self._build_index()
+        if len(self._owners) < self.knn:
+            return all_votes
+
+        if hasattr(self.matcher, 'create_gallery_index'):
+            for i in probes:
+                all_votes[i] = self.scores(descriptor_sets[i])
+            return all_votes
+
+        # One knn call for every probe descriptor, split back per probe
+        stacked = np.concatenate([descriptor_sets[i] for i in probes])
+        train_idx, distances = self._index.knn_search(stacked, self.knn)
+        bounds = np.cumsum([0] + [len(descriptor_sets[i]) for i in probes])
+        for i, start, stop in zip(probes, bounds[:-1], bounds[1:]):
+            all_votes[i] = self._vote(train_idx[start:stop], distances[start:stop])
+        return all_votes
+
+    def _build_index(self):
+        """Stack all descriptors and build one matcher index over the gallery"""
+        counts = [len(d) for d in self.descriptors]
+        self._owners = np.repeat(np.arange(len(self.print_ids)), counts)
+
+        self._index = None
+        if len(self._owners) > 0:
+            train = np.concatenate([d for d in self.descriptors if len(d)])
+            if hasattr(self.matcher, 'create_gallery_index'):
+                offsets = np.concatenate([[0], np.cumsum(counts)])
+                self._index = self.matcher.create_gallery_index(train, offsets)
+            else:
+                self._index = self.matcher.create_index(train)
+
+    def neighbours(self, descriptors: np.ndarray, k: int = None) -> tuple:
+        """
+        k (default knn) neighbours of every probe descriptor as (owners, distances)
+        owners are print positions, -1 (distance inf) for missing neighbours
+        """
+        k = k or self.knn
+        if self._owners is None:
+            self._build_index()
+        if self._index is None:
+            shape = (len(descriptors), k)
+            return np.full(shape, -1), np.full(shape, np.inf, dtype=np.float32)
+        # FLANN refuses k above the index size, ask for what exists and pad
+        train_idx, distances = self._index.knn_search(descriptors, min(k, len(self._owners)))
+        train_idx, distances = _pad_knn(train_idx, distances, k)
+        return self._owner_columns(train_idx), distances
+
+    def _vote(self, train_idx: np.ndarray, distances: np.ndarray) -> np.ndarray:
+        return count_votes(self._owner_columns(train_idx), distances,
+                           self.matcher.ratio_threshold, len(self.print_ids))
+
+    def _owner_columns(self, train_idx: np.ndarray) -> np.ndarray:
+        return np.where(train_idx >= 0, self._owners[np.maximum(train_idx, 0)], -1)
+
+    def _top_candidates(self, votes: np.ndarray, top_k: int) -> list:
+        """Pick the top_k prints by vote count (ties keep enrollment order)"""
+        order = np.argsort(-votes, kind='stable')[:top_k]
+        return [Candidate(self.print_ids[i], int(votes[i])) for i in order]
+
+    def _descriptor_size(self) -> int:
+        return self.descriptors[0].shape[1] if self.descriptors else 0
+
+    def _descriptor_dtype(self):
+        return self.descriptors[0].dtype if self.descriptors else np.float32
+
+
+def count_votes(owners: np.ndarray, distances: np.ndarray, ratio_threshold: float,
+                num_prints: int) -> np.ndarray:
+    """
+    Per-print Lowe ratio test over the knn neighbours of each descriptor
+
+    For every print appearing in a row, its nearest neighbour is compared
+    with that print's second neighbour. When the second one is not among
+    the k results, the k-th distance is used as a (conservative) bound.
+    """
+    k = owners.shape[1]
+
+    # same[q, i, j] → columns i and j belong to the same print
+    same = owners[:, :, None] == owners[:, None, :]
+    earlier = np.tril(np.ones((k, k), dtype=bool), -1)
+    later = np.triu(np.ones((k, k), dtype=bool), 1)
+
+    # Only the first (closest) column of each print may vote
+    first = ~(same & earlier).any(axis=2)
+
+    # Distance of the next column with the same print, else k-th distance
+    later_same = same & later
+    has_next = later_same.any(axis=2)
+    next_col = later_same.argmax(axis=2)
+    second = np.where(has_next,
+                      np.take_along_axis(distances, next_col, axis=1),
+                      distances[:, -1:])
+
+    good = first & (owners >= 0) & (distances < ratio_threshold * second)
+    return np.bincount(owners[good], minlength=num_prints)
@@ -1,48 +1,181 @@
 import cv2
 import time
+import numpy as np
 from preprocessor import ImagePreprocessor
-from results import MatchResult
+from loader import PrefetchLoader
+from quality import QualityError
+from results import MatchResult, draw_match_image
+from timing import new_stage_times, stage
 
 
 class ImageMatcher:
     """Combines feature extraction and matching into single pipeline"""
 
-    def __init__(self, extractor, matcher):
+    def __init__(self, extractor, matcher, cache=None, verifier=None,
+                 preprocessor=None, quality_gate=None):
         self.extractor = extractor
         self.matcher = matcher
-        self.preprocessor = ImagePreprocessor()
+        self.preprocessor = preprocessor or ImagePreprocessor()
+        # Optional DescriptorCache shared between pipelines
+        self.cache = cache
+        # Optional GeometricVerifier scoring matches by RANSAC inliers
+        self.verifier = verifier
+        # Optional QualityGate rejecting poor captures before extraction
+        self.quality_gate = quality_gate
+
+    def extract_features(self, image_path: str, stage_times: dict = None) -> tuple:
+        """
+        Load, binarize and extract (keypoints, descriptors) for one image
+        Raises QualityError (a ValueError) when the quality gate rejects it
+        """
+        if stage_times is None:
+            stage_times = new_stage_times()
+        _, kp, des = self._load_features(image_path, stage_times=stage_times)
+        return kp, des
+
+    def extract_many(self, image_paths, workers: int = 2, queue_size: int = 8):
+        """
+        Yields (keypoints, descriptors) per path, in order
+        Images are decoded ahead on a PrefetchLoader while features are extracted
+        """
+        loader = PrefetchLoader(image_paths, self.preprocessor, workers, queue_size)
+        for image_path, loaded in loader:
+            _, kp, des = self._load_features(image_path, loaded)
+            yield kp, des
+
+    def match_pairs(self, pairs, workers: int = 2, queue_size: int = 8):
+        """
+        Yields one MatchResult per (img1_path, img2_path) pair, in order
+        Both images of upcoming pairs are decoded ahead on a PrefetchLoader
+        """
+        pairs = iter(pairs)
+        # Flatten the pairs into one path stream, consumed two at a time
+        paths = (path for pair in pairs for path in pair)
+        loaded = iter(PrefetchLoader(paths, self.preprocessor, workers, queue_size))
+
+        for (img1_path, loaded1), (img2_path, loaded2) in zip(loaded, loaded):
+            yield self.match_images(img1_path, img2_path, images=(loaded1, loaded2))
+
+    def _load_features(self, image_path: str, loaded: tuple = None,
+                       stage_times: dict = None) -> tuple:
+        """
+        Returns ((binary image, scale) or None, keypoints, descriptors)
+        loaded: (binary image, scale) from preprocessor.load(), skips loading
+        stage_times: dict accumulating per-stage durations
+        Keypoints are always in full resolution coordinates.
+        Image is None when features came from the cache without decoding
+        (and none was passed in)
+        Raises QualityError when the quality gate rejects the image
+        """
+        if stage_times is None:
+            stage_times = new_stage_times()
+        prepared = self._prepare(image_path, loaded, stage_times)
+        return self._extract(prepared, stage_times)
+
+    def _prepare(self, image_path: str, loaded: tuple, stage_times: dict) -> tuple:
+        """
+        Cache lookup, else load and quality check → (loaded, cache key, cached)
+        Cache hits skip the gate: the key includes the gate settings, so an
+        entry exists only if the image passed this same gate
+        """
+        key = None
+        if self.cache is not None:
+            with stage(stage_times, 'cache'):
+                key = self.cache.make_key(image_path, self.extractor, self.preprocessor,
+                                          self.quality_gate)
+                cached = self.cache.get(key)
+            if cached is not None:
+                return loaded, key, cached
+
+        if loaded is None:
+            with stage(stage_times, 'load'):
+                loaded = self.preprocessor.load(image_path)
+
+        # Reject poor captures before the expensive extraction
+        if self.quality_gate is not None:
+            with stage(stage_times, 'quality'):
+                report = self.quality_gate.assess(loaded[0])
+            if not report.passed:
+                raise QualityError(image_path, report)
+
+        return loaded, key, None
+
+    def _extract(self, prepared: tuple, stage_times: dict) -> tuple:
+        """(loaded, cache key, cached) from _prepare() → (loaded, keypoints, descriptors)"""
+        loaded, key, cached = prepared
+        if cached is not None:
+            return loaded, cached[0], cached[1]
+        img, scale = loaded
+
+        # Foreground mask (None unless segmentation is enabled)
+        with stage(stage_times, 'segment'):
+            mask = self.preprocessor.foreground_mask(img)
+
+        with stage(stage_times, 'extract'):
+            kp, des = self.extractor.extract(img, mask)
+            self._to_full_resolution(kp, scale)
+
+        if key is not None:
+            with stage(stage_times, 'cache'):
+                self.cache.put(key, kp, des)
+
+        return loaded, kp, des
+
+    @staticmethod
+    def _to_full_resolution(keypoints, scale: float):
+        """Map keypoints from the working scale back to full resolution"""
+        if scale == 1.0:
+            return
+        for kp in keypoints:
+            kp.pt = (kp.pt[0] / scale, kp.pt[1] / scale)
+            kp.size /= scale
 
     def match_images(self, img1_path: str, img2_path: str,
-                     draw_matches: bool = True) -> MatchResult:
+                     draw_matches: bool = False, images: tuple = None) -> MatchResult:
         """
         Complete matching pipeline for two images
-        Returns MatchResult with all data
+        draw_matches: render the match image now instead of on demand
+        images: optional ((img1, scale1), (img2, scale2)) from preprocessor.load(),
+                shared between pipelines
+        Returns compact MatchResult (call render() for the visualization)
         """
-        # Start timing
-        start_time = time.time()
-
-        # Load and binarize images
-        img1 = self.preprocessor.load_and_preprocess(img1_path)
-        img2 = self.preprocessor.load_and_preprocess(img2_path)
+        # Start timing (monotonic, high resolution)
+        start_time = time.perf_counter()
+        stage_times = new_stage_times()
 
-        # Extract features (keypoints + descriptors)
-        kp1, des1 = self.extractor.extract(img1)
-        kp2, des2 = self.extractor.extract(img2)
+        # Load, binarize and extract features (skipped on cache hits)
+        loaded1, loaded2 = images if images is not None else (None, None)
+        # Both images pass the quality gate before either is extracted
+        try:
+            prepared1 = self._prepare(img1_path, loaded1, stage_times)
+            prepared2 = self._prepare(img2_path, loaded2, stage_times)
+        except QualityError as e:
+            # Short-circuit: no extraction or matching, the result carries the reason
+            return self._rejected_result(e, img1_path, img2_path, start_time,
+                                         stage_times)
+        loaded1, kp1, des1 = self._extract(prepared1, stage_times)
+        loaded2, kp2, des2 = self._extract(prepared2, stage_times)
 
-        # Match descriptors between images
-        good_matches = self.matcher.match(des1, des2)
+        # Match descriptors, keep matched coordinates, verify (optional)
+        pts1, pts2, num_inliers, inlier_ratio = self._compare(kp1, des1, kp2, des2,
+                                                              stage_times)
 
         # Draw visualization if requested
         match_img = None
-        if draw_matches and len(good_matches) > 0:
-            # Creates side-by-side image with lines connecting matches
-            match_img = cv2.drawMatches(
-                img1, kp1, img2, kp2, good_matches, None,
-                flags=cv2.DrawMatchesFlags_NOT_DRAW_SINGLE_POINTS
-            )
+        if draw_matches and len(pts1) > 0:
+            # Cache hits skip decoding, so load images only for drawing
+            with stage(stage_times, 'load'):
+                if loaded1 is None:
+                    loaded1 = self.preprocessor.load(img1_path)
+                if loaded2 is None:
+                    loaded2 = self.preprocessor.load(img2_path)
+
+            with stage(stage_times, 'draw'):
+                # Creates side-by-side image with lines connecting matches
+                match_img = draw_match_image(loaded1, pts1, loaded2, pts2)
 
         # Calculate elapsed time
-        processing_time = time.time() - start_time
+        processing_time = time.perf_counter() - start_time
 
         # Build method name (e.g., "ORB+BF")
         method_name = f"{self.extractor.name}+{self.matcher.name}"
@@ -50,9 +183,90 @@ class ImageMatcher:
         # Package results
         return MatchResult(
             method_name=method_name,
-            num_matches=len(good_matches),
+            num_matches=len(pts1),
             num_kp1=len(kp1) if kp1 else 0,
             num_kp2=len(kp2) if kp2 else 0,
             processing_time=processing_time,
-            match_image=match_img
-        )
\ No newline at end of file
+            match_image=match_img,
+            stage_times=stage_times,
+            pts1=pts1,
+            pts2=pts2,
+            img1_path=img1_path,
+            img2_path=img2_path,
+            preprocessor=self.preprocessor,
+            num_inliers=num_inliers,
+            inlier_ratio=inlier_ratio
+        )
+
+    def match_features(self, features1: tuple, features2: tuple,
+                       img1_path: str = None, img2_path: str = None,
+                       stage_times: dict = None) -> MatchResult:
+        """
+        Match already extracted (keypoints, descriptors) of two images
+        Lets callers extract once and compare the features many times
+        """
+        start_time = time.perf_counter()
+        if stage_times is None:
+            stage_times = new_stage_times()
+
+        (kp1, des1), (kp2, des2) = features1, features2
+        pts1, pts2, num_inliers, inlier_ratio = self._compare(kp1, des1, kp2, des2,
+                                                              stage_times)
+
+        return MatchResult(
+            method_name=f"{self.extractor.name}+{self.matcher.name}",
+            num_matches=len(pts1),
+            num_kp1=len(kp1) if kp1 else 0,
+            num_kp2=len(kp2) if kp2 else 0,
+            processing_time=time.perf_counter() - start_time,
+            stage_times=stage_times,
+            pts1=pts1,
+            pts2=pts2,
+            img1_path=img1_path,
+            img2_path=img2_path,
+            preprocessor=self.preprocessor,
+            num_inliers=num_inliers,
+            inlier_ratio=inlier_ratio
+        )
+
+    def _rejected_result(self, error: QualityError, img1_path: str, img2_path: str,
+                         start_time: float, stage_times: dict) -> MatchResult:
+        """Empty MatchResult for a pair with an image rejected by the quality gate"""
+        return MatchResult(
+            method_name=f"{self.extractor.name}+{self.matcher.name}",
+            num_matches=0,
+            num_kp1=0,
+            num_kp2=0,
+            processing_time=time.perf_counter() - start_time,
+            stage_times=stage_times,
+            img1_path=img1_path,
+            img2_path=img2_path,
+            preprocessor=self.preprocessor,
+            rejected=f"{error.image_path}: {error.report.reason}"
+        )
+
+    def _compare(self, kp1, des1, kp2, des2, stage_times: dict) -> tuple:
+        """Ratio-test matching plus optional verification → (pts1, pts2, inliers, ratio)"""
+        # Match descriptors between images (index/distance arrays)
+        with stage(stage_times, 'match'):
+            query_idx, train_idx, _ = self.matcher.match_arrays(des1, des2)
+
+        # Keep only matched coordinates, KeyPoint lists are dropped
+        pts1, pts2 = self._matched_points(kp1, kp2, query_idx, train_idx)
+
+        # Geometric verification of the matches (optional)
+        num_inliers = inlier_ratio = None
+        if self.verifier is not None:
+            with stage(stage_times, 'verify'):
+                num_inliers, inlier_ratio, _, _ = self.verifier.verify(pts1, pts2)
+
+        return pts1, pts2, num_inliers, inlier_ratio
+
+    @staticmethod
+    def _matched_points(kp1, kp2, query_idx, train_idx) -> tuple:
+        """Coordinates of matched keypoints as float32 (n × 2) arrays"""
+        if len(query_idx) == 0:
+            empty = np.empty((0, 2), dtype=np.float32)
+            return empty, empty.copy()
+        return (cv2.KeyPoint.convert(kp1, query_idx),
+                cv2.KeyPoint.convert(kp2, train_idx))
\ No newline at end of file
@@ -0,0 +1,65 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from preprocessor import ImagePreprocessor
+
+
+class PrefetchLoader:
+    """
+    Decodes and binarizes images ahead of the consumer
+
+    Images are loaded on a small thread pool (cv2.imread and the OpenCV
+    thresholding release the GIL), so disk I/O and decoding overlap with
+    feature extraction in the consuming thread.
+
+    At most queue_size images are decoded or waiting at any time. When the
+    consumer falls behind, no new loads are submitted until it catches up
+    (backpressure), which bounds memory for arbitrarily long path streams.
+    """
+
+    def __init__(self, paths, preprocessor=None, workers: int = 2,
+                 queue_size: int = 8):
+        """
+        Args:
+            paths: iterable of image paths, consumed lazily
+            preprocessor: ImagePreprocessor doing the load (default settings if None)
+            workers: decode threads
+            queue_size: maximum images in flight (decoding or decoded, not consumed)
+        """
+        if workers < 1 or queue_size < 1:
+            raise ValueError("workers and queue_size must be at least 1")
+
+        self.paths = paths
+        self.preprocessor = preprocessor or ImagePreprocessor()
+        self.workers = workers
+        self.queue_size = queue_size
+
+    def __iter__(self):
+        """
+        Yields (path, (binary image, scale)) in input order
+        Errors from loading (e.g. unreadable image) are raised at that item
+        """
+        paths = iter(self.paths)
+        pending = deque()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            try:
+                # Fill the queue, then submit one new load per consumed image
+                for path in paths:
+                    pending.append((path, executor.submit(self.preprocessor.load, path)))
+                    if len(pending) >= self.queue_size:
+                        break
+
+                while pending:
+                    path, future = pending.popleft()
+                    loaded = future.result()
+
+                    next_path = next(paths, None)
+                    if next_path is not None:
+                        pending.append((next_path,
+                                        executor.submit(self.preprocessor.load, next_path)))
+
+                    yield path, loaded
+            finally:
+                # Consumer stopped early (break or error): drop queued loads
+                for _, future in pending:
+                    future.cancel()
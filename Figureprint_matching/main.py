@@ -3,13 +3,12 @@ from pipeline import MatchingPipeline
 
 def main():
 
-    pipeline = MatchingPipeline()
-
     img1 = "pictures/UiA front1.png"
     img2 = "pictures/UiA front3.jpg"
 
-    # Run comparison
-    orb_result, sift_result = pipeline.compare_methods(img1, img2, save_figure=True)
+    # Run comparison, closing the results file once it is saved
+    with MatchingPipeline() as pipeline:
+        orb_result, sift_result = pipeline.compare_methods(img1, img2, save_figure=True)
 
     # Print recommendation
     print("\n" + "=" * 70)
@@ -1,29 +1,273 @@
 import cv2
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+
+class BruteForceIndex:
+    """Exhaustive knn search over a fixed descriptor matrix"""
+
+    def __init__(self, train: np.ndarray, norm_type: int):
+        self.train = train
+        self.norm_type = norm_type
+        # Hamming distances are integers, L2 distances are floats
+        self.dtype = cv2.CV_32S if norm_type == cv2.NORM_HAMMING else cv2.CV_32F
+
+    def knn_search(self, query: np.ndarray, k: int) -> tuple:
+        """Returns (indices, distances) arrays of shape (len(query), k)"""
+        distances, indices = cv2.batchDistance(
+            query, self.train, self.dtype, normType=self.norm_type, K=k
+        )
+        return _pad_knn(indices, distances, k)
+
+
+class FlannIndex:
+    """FLANN index built once, queried many times"""
+
+    def __init__(self, train: np.ndarray, index_params: dict,
+                 search_params: dict, squared: bool):
+        self.train = train
+        self.search_params = search_params
+        # KD-tree reports squared L2, sqrt keeps ratios comparable with BF
+        self.squared = squared
+        self.index = cv2.flann_Index(train, index_params)
+
+    def knn_search(self, query: np.ndarray, k: int) -> tuple:
+        """Returns (indices, distances) arrays of shape (len(query), k)"""
+        query = np.ascontiguousarray(query, dtype=self.train.dtype)
+        indices, distances = self.index.knnSearch(query, k, params=self.search_params)
+        indices, distances = _pad_knn(indices, distances, k)
+        if self.squared:
+            np.sqrt(distances, out=distances)
+        return indices, distances
+
+
+class PopcountIndex:
+    """
+    Exact Hamming search with XOR + popcount on packed 64-bit words
+
+    Binary descriptors are stored once as one contiguous (words × n) uint64
+    matrix, or taken as is from a shard's word-major section (words), so
+    memory-mapped shards stay shared. offsets (start row of every print,
+    plus the end) split it into gallery prints so print_scores() can run
+    the ratio test per print.
+    """
+
+    # Bounds the (queries × columns) intermediate of one block
+    MAX_BLOCK_ELEMENTS = 1 << 22
+
+    def __init__(self, train: np.ndarray, offsets: np.ndarray = None, threads: int = 1,
+                 words: np.ndarray = None):
+        self.train = np.ascontiguousarray(train, dtype=np.uint8)
+        # Word-major (words × n): each word row is contiguous for the XOR
+        self.words = words if words is not None else word_major(self.train)
+        self.offsets = (np.asarray(offsets, dtype=np.int64) if offsets is not None
+                        else np.array([0, len(self.train)], dtype=np.int64))
+        self.threads = max(1, threads)
+        # Larger than any possible distance, marks "no second neighbour"
+        self.sentinel = self.train.shape[1] * 8 + 1
+
+    def knn_search(self, query: np.ndarray, k: int) -> tuple:
+        """Returns (indices, distances) arrays of shape (len(query), k)"""
+        query_words = word_major(query)
+        num_train = self.words.shape[1]
+        kk = min(k, num_train)
+        rows = max(1, self.MAX_BLOCK_ELEMENTS // max(num_train, 1))
+
+        indices = np.empty((len(query), kk), dtype=np.int32)
+        distances = np.empty((len(query), kk), dtype=np.float32)
+        for start in range(0, len(query), rows):
+            dist = self._distances(query_words[:, start:start + rows], 0, num_train)
+            nearest = np.argpartition(dist, kk - 1, axis=1)[:, :kk]
+            nearest_dist = np.take_along_axis(dist, nearest, axis=1)
+            order = np.argsort(nearest_dist, axis=1, kind='stable')
+            indices[start:start + rows] = np.take_along_axis(nearest, order, axis=1)
+            distances[start:start + rows] = np.take_along_axis(nearest_dist, order, axis=1)
+
+        return _pad_knn(indices, distances, k)
+
+    def print_scores(self, query: np.ndarray, ratio_threshold: float) -> np.ndarray:
+        """
+        Ratio-test votes per print in one call
+
+        For every query descriptor and every print, the nearest and second
+        nearest descriptor of that print are compared (exact, no knn cutoff).
+        Returns int array with one vote count per print.
+        """
+        num_prints = len(self.offsets) - 1
+        votes = np.zeros(num_prints, dtype=np.int64)
+        if len(query) == 0 or self.words.shape[1] == 0:
+            return votes
+
+        query_words = word_major(query)
+        blocks = self._print_blocks(len(query))
+
+        def run(block):
+            first_print, last_print = block
+            votes[first_print:last_print] = self._block_votes(
+                query_words, first_print, last_print, ratio_threshold)
+
+        # Blocks write disjoint slices of votes, numpy releases the GIL
+        if self.threads > 1 and len(blocks) > 1:
+            with ThreadPoolExecutor(max_workers=self.threads) as executor:
+                list(executor.map(run, blocks))
+        else:
+            for block in blocks:
+                run(block)
+
+        return votes
+
+    def _print_blocks(self, num_queries: int) -> list:
+        """Group consecutive prints into (first, last) blocks of bounded width"""
+        max_columns = max(1, self.MAX_BLOCK_ELEMENTS // num_queries)
+        blocks = []
+        first = 0
+        for print_pos in range(1, len(self.offsets)):
+            width = self.offsets[print_pos] - self.offsets[first]
+            # Close the block before it overflows (one huge print stays alone)
+            if width > max_columns and print_pos - 1 > first:
+                blocks.append((first, print_pos - 1))
+                first = print_pos - 1
+        blocks.append((first, len(self.offsets) - 1))
+        return blocks
+
+    def _block_votes(self, query_words: np.ndarray, first_print: int,
+                     last_print: int, ratio_threshold: float) -> np.ndarray:
+        """Votes of prints [first_print, last_print) for every query row"""
+        starts = self.offsets[first_print:last_print]
+        lengths = np.diff(self.offsets[first_print:last_print + 1])
+        block_votes = np.zeros(len(starts), dtype=np.int64)
+
+        # reduceat needs non-empty segments, prints without descriptors get 0
+        non_empty = lengths > 0
+        if not non_empty.any():
+            return block_votes
+        start, stop = starts[0], self.offsets[last_print]
+        segments = starts[non_empty] - start
+        lengths = lengths[non_empty]
+
+        dist = self._distances(query_words, start, stop)
+
+        # Nearest descriptor of every print
+        first = np.minimum.reduceat(dist, segments, axis=1)
+        is_first = dist == np.repeat(first, lengths, axis=1)
+
+        # Second nearest: mask the nearest, ties mean second == first
+        ties = np.add.reduceat(is_first, segments, axis=1, dtype=np.int32)
+        masked = np.where(is_first, self.sentinel, dist)
+        second = np.minimum.reduceat(masked, segments, axis=1)
+        second = np.where(ties > 1, first, second)
+
+        good = (second < self.sentinel) & (first < ratio_threshold * second)
+        block_votes[non_empty] = good.sum(axis=0)
+        return block_votes
+
+    def _distances(self, query_words: np.ndarray, start: int, stop: int) -> np.ndarray:
+        """Hamming distance matrix query rows × train rows [start, stop) as uint16"""
+        train_words = self.words[:, start:stop]
+        shape = (query_words.shape[1], train_words.shape[1])
+        dist = np.zeros(shape, dtype=np.uint16)
+
+        # Scratch buffers reused for every word, no per-word allocations
+        xor = np.empty(shape, dtype=np.uint64)
+        bits = np.empty(shape, dtype=np.uint8)
+        for w in range(len(train_words)):
+            np.bitwise_xor(query_words[w, :, None], train_words[w, None, :], out=xor)
+            dist += _popcount(xor, out=bits)
+        return dist
+
+
+def _pack_words(descriptors: np.ndarray) -> np.ndarray:
+    """uint8 (n × bytes) → uint64 (n × words), zero padded to 8-byte multiples"""
+    descriptors = np.ascontiguousarray(descriptors, dtype=np.uint8)
+    padding = -descriptors.shape[1] % 8
+    if padding:
+        descriptors = np.pad(descriptors, ((0, 0), (0, padding)))
+    return np.ascontiguousarray(descriptors).view(np.uint64)
+
+
+def word_major(descriptors: np.ndarray) -> np.ndarray:
+    """uint8 (n × bytes) → contiguous uint64 (words × n), the PopcountIndex layout"""
+    return np.ascontiguousarray(_pack_words(descriptors).T)
+
+
+# Bits set in every byte value, fallback for numpy < 2.0 (no bitwise_count)
+_BYTE_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1)
+
+
+def _popcount(words: np.ndarray, out: np.ndarray) -> np.ndarray:
+    """Bits set in every uint64 element, written to the uint8 array out"""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(words, out=out)
+    counts = _BYTE_POPCOUNT[words.view(np.uint8)].reshape(*words.shape, 8)
+    return counts.sum(axis=-1, dtype=np.uint8, out=out)
+
+
+def _pad_knn(indices: np.ndarray, distances: np.ndarray, k: int) -> tuple:
+    """Normalize knn output: int32 indices, float32 distances, missing → -1/inf"""
+    indices = np.asarray(indices, dtype=np.int32).reshape(len(indices), -1)
+    distances = np.asarray(distances, dtype=np.float32).reshape(len(indices), -1)
+
+    # Fewer than k train descriptors → pad missing neighbours
+    if indices.shape[1] < k:
+        missing = k - indices.shape[1]
+        indices = np.pad(indices, ((0, 0), (0, missing)), constant_values=-1)
+        distances = np.pad(distances, ((0, 0), (0, missing)), constant_values=np.inf)
+
+    distances[indices < 0] = np.inf
+    return indices, distances
 
 
 class FeatureMatcher:
 
     def __init__(self, ratio_threshold: float = 0.7):
         self.ratio_threshold = ratio_threshold
-        self.matcher = None
 
-    def match(self, des1: np.ndarray, des2: np.ndarray) -> list:
-        if des1 is None or des2 is None:
-            return []
+    def create_index(self, train: np.ndarray):
+        """Build a reusable knn index over (encoded) train descriptors"""
+        raise NotImplementedError("Index not implemented")
+
+    def encode(self, descriptors: np.ndarray) -> np.ndarray:
+        """Storage form of train descriptors (compressed matchers override)"""
+        return descriptors
+
+    def knn_search(self, des1: np.ndarray, des2: np.ndarray, k: int = 2) -> tuple:
+        """k nearest des2 rows for every des1 row as (indices, distances)"""
+        return self.create_index(self.encode(des2)).knn_search(des1, k)
+
+    def match_arrays(self, des1: np.ndarray, des2: np.ndarray) -> tuple:
+        """
+        Ratio-test matching without DMatch objects
+        Returns (query_idx, train_idx, distances) as contiguous arrays
+        """
+        if des1 is None or des2 is None or len(des1) == 0 or len(des2) == 0:
+            return (np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32),
+                    np.empty(0, dtype=np.float32))
 
         # Find 2 best matches for each descriptor
-        matches = self.matcher.knnMatch(des1, des2, k=2)
+        indices, distances = self.knn_search(des1, des2, k=2)
+        return self.ratio_test(indices, distances)
+
+    def ratio_test(self, indices: np.ndarray, distances: np.ndarray) -> tuple:
+        """Lowe ratio test on (n × 2) knn arrays → (query_idx, train_idx, distances)"""
+        # m.distance < 0.7 * n.distance → reliable match (one vector op)
+        good = ((indices[:, 1] >= 0)
+                & (distances[:, 0] < self.ratio_threshold * distances[:, 1]))
+
+        query_idx = np.flatnonzero(good).astype(np.int32)
+        return (query_idx,
+                np.ascontiguousarray(indices[good, 0]),
+                np.ascontiguousarray(distances[good, 0]))
 
-        good_matches = []
-        for match_pair in matches:
-            if len(match_pair) == 2:
-                m, n = match_pair
-                # m.distance < 0.7 * n.distance → reliable match
-                if m.distance < self.ratio_threshold * n.distance:
-                    good_matches.append(m)
+    def match(self, des1: np.ndarray, des2: np.ndarray) -> list:
+        """Ratio-test matching returning cv2.DMatch list (for drawing)"""
+        return self.to_dmatches(*self.match_arrays(des1, des2))
 
-        return good_matches
+    @staticmethod
+    def to_dmatches(query_idx: np.ndarray, train_idx: np.ndarray,
+                    distances: np.ndarray) -> list:
+        """Build cv2.DMatch objects from match arrays"""
+        return [cv2.DMatch(int(q), int(t), float(d))
+                for q, t, d in zip(query_idx, train_idx, distances)]
 
 
 class BFMatcher(FeatureMatcher):
@@ -31,8 +275,12 @@ class BFMatcher(FeatureMatcher):
     def __init__(self, ratio_threshold: float = 0.7):
         super().__init__(ratio_threshold)
         # NORM_HAMMING for binary descriptors (counts bit differences)
-        self.matcher = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=False)
+        self.norm_type = cv2.NORM_HAMMING
         self.name = "BF"
+        self.binary = True
+
+    def create_index(self, train: np.ndarray):
+        return BruteForceIndex(train, self.norm_type)
 
 
 class FLANNMatcher(FeatureMatcher):
@@ -42,5 +290,66 @@ class FLANNMatcher(FeatureMatcher):
         # KD-tree algorithm for fast approximate search
         index_params = dict(algorithm=1, trees=5)
         search_params = dict(checks=50)
-        self.matcher = cv2.FlannBasedMatcher(index_params, search_params)
-        self.name = "FLANN"
\ No newline at end of file
+        self.index_params = index_params
+        self.search_params = search_params
+        self.name = "FLANN"
+        self.binary = False
+
+    def create_index(self, train: np.ndarray):
+        # KD-tree needs float32 input
+        train = np.ascontiguousarray(train, dtype=np.float32)
+        return FlannIndex(train, self.index_params, self.search_params, squared=True)
+
+
+class LSHMatcher(FeatureMatcher):
+    """
+    Approximate Hamming search for binary descriptors (ORB)
+
+    FLANN multi-probe LSH: descriptors are hashed into table_number tables
+    using key_size bits each. More tables / probe levels raise recall, fewer
+    make the search faster. checks bounds candidates visited per query.
+    """
+
+    def __init__(self, ratio_threshold: float = 0.7, table_number: int = 6,
+                 key_size: int = 12, multi_probe_level: int = 1, checks: int = 50):
+        super().__init__(ratio_threshold)
+        # LSH algorithm for binary descriptors
+        index_params = dict(algorithm=6, table_number=table_number,
+                            key_size=key_size, multi_probe_level=multi_probe_level)
+        search_params = dict(checks=checks)
+        self.index_params = index_params
+        self.search_params = search_params
+        self.name = "LSH"
+        self.binary = True
+
+    def create_index(self, train: np.ndarray):
+        # LSH hashes raw bytes, descriptors must stay uint8
+        train = np.ascontiguousarray(train, dtype=np.uint8)
+        return FlannIndex(train, self.index_params, self.search_params, squared=False)
+
+
+class PopcountMatcher(FeatureMatcher):
+    """
+    Exact Hamming matcher in NumPy (XOR + popcount) for binary descriptors
+
+    Pairwise it behaves like BFMatcher. For galleries it keeps every print's
+    descriptors in one matrix with owner offsets and scores all prints in
+    one call (see PopcountIndex.print_scores), split across threads.
+    """
+
+    def __init__(self, ratio_threshold: float = 0.7, threads: int = 1):
+        super().__init__(ratio_threshold)
+        self.threads = threads
+        self.name = "POPCOUNT"
+        self.binary = True
+
+    def create_index(self, train: np.ndarray):
+        return PopcountIndex(train, threads=self.threads)
+
+    def create_gallery_index(self, train: np.ndarray, offsets: np.ndarray,
+                             words: np.ndarray = None):
+        """
+        One index over all prints' descriptors, offsets = start row per print + end
+        words: train already in word_major() layout (shard section), not copied
+        """
+        return PopcountIndex(train, offsets, threads=self.threads, words=words)
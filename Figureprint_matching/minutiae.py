@@ -0,0 +1,351 @@
+import cv2
+import numpy as np
+from extractors import FeatureExtractor
+from matchers import FeatureMatcher
+
+# Minutia types, the crossing number of the skeleton pixel
+ENDING = 1
+BIFURCATION = 3
+
+# Neighbour offsets (dy, dx) in Zhang-Suen order P2..P9, clockwise from north
+NEIGHBOURS = ((-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1))
+
+
+def _lookup_tables() -> tuple:
+    """Zhang-Suen deletion tests and crossing numbers for every 8-bit neighbourhood"""
+    codes = np.arange(256)
+    bits = (codes[:, None] >> np.arange(8)) & 1            # P2..P9 per code
+    count = bits.sum(axis=1)
+    # 0 → 1 transitions around the cycle P2, P3, ..., P9, P2
+    transitions = ((bits == 0) & (np.roll(bits, -1, axis=1) == 1)).sum(axis=1)
+    p2, p4, p6, p8 = bits[:, 0], bits[:, 2], bits[:, 4], bits[:, 6]
+
+    candidate = (count >= 2) & (count <= 6) & (transitions == 1)
+    first = candidate & (p2 * p4 * p6 == 0) & (p4 * p6 * p8 == 0)
+    second = candidate & (p2 * p4 * p8 == 0) & (p2 * p6 * p8 == 0)
+    crossing = np.abs(bits - np.roll(bits, -1, axis=1)).sum(axis=1) // 2
+    return first, second, crossing.astype(np.uint8)
+
+
+DELETE_FIRST, DELETE_SECOND, CROSSING_NUMBER = _lookup_tables()
+
+
+# filter2D kernel summing neighbour bits: weight 2^k at the position of P(k+2)
+CODE_KERNEL = np.zeros((3, 3), dtype=np.float32)
+for _bit, (_dy, _dx) in enumerate(NEIGHBOURS):
+    CODE_KERNEL[1 + _dy, 1 + _dx] = 1 << _bit
+
+
+def neighbour_codes(image: np.ndarray) -> np.ndarray:
+    """8-bit code of every pixel's foreground neighbours (0/1 image, bit k = P(k+2))"""
+    # One 3×3 correlation, exact in uint8 since the weights sum to 255
+    return cv2.filter2D(image, cv2.CV_8U, CODE_KERNEL, borderType=cv2.BORDER_CONSTANT)
+
+
+def thin(binary: np.ndarray, max_iterations: int = 100) -> np.ndarray:
+    """
+    Zhang-Suen thinning to a one pixel wide skeleton
+    Every sub-iteration tests all pixels at once through the lookup tables,
+    restricted to the box around the deletions of the previous two
+    sub-iterations: only pixels next to a deletion can change their test.
+    Returns uint8 array with 1 on the skeleton
+    """
+    # One background pixel around the image gives every box its neighbours
+    skeleton = np.pad((binary > 0).astype(np.uint8), 1)
+    tables = [table.astype(np.uint8) for table in (DELETE_FIRST, DELETE_SECOND)]
+    height, width = skeleton.shape
+    full = (1, 1, width - 1, height - 1)
+    # Deletion boxes (x0, y0, x1, y1) of the last two sub-iterations
+    recent = [full, full]
+    for step in range(2 * max_iterations):
+        boxes = [box for box in recent if box is not None]
+        if not boxes:
+            break
+        # Union of the recent deletions grown by one pixel, inside the padding
+        x0 = max(min(box[0] for box in boxes) - 1, 1)
+        y0 = max(min(box[1] for box in boxes) - 1, 1)
+        x1 = min(max(box[2] for box in boxes) + 1, width - 1)
+        y1 = min(max(box[3] for box in boxes) + 1, height - 1)
+
+        codes = neighbour_codes(skeleton[y0 - 1:y1 + 1, x0 - 1:x1 + 1])[1:-1, 1:-1]
+        region = skeleton[y0:y1, x0:x1]
+        # 1 where the pixel is set and its neighbourhood is deletable
+        delete = cv2.LUT(codes, tables[step % 2]) & region
+        x, y, w, h = cv2.boundingRect(delete)
+        if w:
+            region -= delete
+        recent = [recent[1], (x0 + x, y0 + y, x0 + x + w, y0 + y + h) if w else None]
+    return skeleton[1:-1, 1:-1]
+
+
+class MinutiaeExtractor(FeatureExtractor):
+    """
+    Ridge endings and bifurcations of the thinned binary print
+
+    The Otsu binary image is thinned, and every skeleton pixel's crossing
+    number (CN) is read from its 8-neighbourhood code: CN 1 is a ridge
+    ending, CN 3 a bifurcation. Minutiae near the print border or packed
+    closer than min_distance (spurs, bridges, broken ridges) are dropped.
+
+    Descriptors are a compact float32 array, one row per minutia:
+    (x, y, angle, type) at the working scale, angle in radians. That is 16
+    bytes per minutia instead of 32 (ORB) or 512 (SIFT) per keypoint, and
+    a print has tens of minutiae rather than 1000 keypoints. Keypoints
+    carry the same positions (class_id = type) for drawing/verification.
+    Beyond nfeatures, the minutiae in the most coherent ridge flow are kept.
+
+    Thinning takes one pass per pixel of half width of the widest
+    foreground region: ~5ms for a 320 × 320 print, but ~0.1s or more for a
+    large photo with solid regions, where ORB stays around 0.03s.
+    """
+
+    def __init__(self, nfeatures: int = 1000, smoothing: int = 3,
+                 orientation_sigma: float = 5.0, window: int = 7,
+                 border: int = 12, min_distance: float = 6.0):
+        super().__init__(nfeatures)
+        self.smoothing = smoothing
+        self.orientation_sigma = orientation_sigma
+        self.window = window
+        self.border = border
+        self.min_distance = min_distance
+        self.name = "MINUTIAE"
+        # Minutiae arrays: neither binary nor float keypoint descriptors
+        self.binary = None
+
+    def extract(self, image: np.ndarray, mask: np.ndarray = None) -> tuple:
+        """Returns (keypoints, minutiae array), ((), None) when none are found"""
+        # Median filter removes isolated pixels that would become spurs
+        binary = cv2.medianBlur(image, self.smoothing) if self.smoothing > 1 else image
+        skeleton = thin(binary)
+
+        crossing = CROSSING_NUMBER[neighbour_codes(skeleton)]
+        candidates = (skeleton == 1) & ((crossing == ENDING) | (crossing == BIFURCATION))
+        candidates &= self._valid_region(binary, mask)
+        ys, xs = np.nonzero(candidates)
+        if len(xs) == 0:
+            return (), None
+
+        types = crossing[ys, xs]
+        keep = self._isolated(xs, ys, skeleton.shape)
+        xs, ys, types = xs[keep], ys[keep], types[keep]
+        if len(xs) == 0:
+            return (), None
+        if len(xs) > self.nfeatures:
+            # Most reliable first: minutiae in the clearest ridge flow
+            order = np.argsort(-self._coherence(binary, xs, ys), kind='stable')
+            order = np.sort(order[:self.nfeatures])
+            xs, ys, types = xs[order], ys[order], types[order]
+
+        angles = self._angles(binary, skeleton, xs, ys)
+        minutiae = np.column_stack([xs, ys, angles, types]).astype(np.float32)
+        keypoints = tuple(cv2.KeyPoint(float(x), float(y), float(2 * self.window),
+                                       float(np.degrees(a)), 1.0, 0, int(t))
+                          for x, y, a, t in minutiae)
+        return keypoints, minutiae
+
+    def _valid_region(self, binary: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        """Print area shrunk by border pixels, ridge ends at its edge are not minutiae"""
+        size = 2 * self.border + 1
+        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (size, size))
+        region = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
+        if mask is not None:
+            region = cv2.bitwise_and(region, mask)
+        # Image edge counts as background too
+        region = np.pad(region, 1)
+        region = cv2.erode(region, kernel)[1:-1, 1:-1]
+        return region > 0
+
+    def _isolated(self, xs: np.ndarray, ys: np.ndarray, shape: tuple) -> np.ndarray:
+        """
+        False for minutiae with another one closer than min_distance
+        Neighbours are counted by one disk filter over a candidate image, so
+        memory stays at image size however many candidates a noisy capture has
+        """
+        points = np.zeros(shape, dtype=np.float32)
+        points[ys, xs] = 1.0
+        radius = int(np.ceil(self.min_distance))
+        offsets = np.arange(-radius, radius + 1)
+        disk = (offsets[:, None] ** 2 + offsets[None, :] ** 2
+                < self.min_distance ** 2).astype(np.float32)
+        counts = cv2.filter2D(points, -1, disk, borderType=cv2.BORDER_CONSTANT)
+        # Only the minutia itself inside its disk (large kernels filter via DFT)
+        return counts[ys, xs] < 1.5
+
+    def _coherence(self, binary: np.ndarray, xs: np.ndarray, ys: np.ndarray,
+                   block: int = 16) -> np.ndarray:
+        """Structure tensor coherence of the block holding each minutia (0 noise, 1 clear)"""
+        image = binary.astype(np.float32) / 255.0
+        gx = cv2.Sobel(image, cv2.CV_32F, 1, 0, ksize=3)
+        gy = cv2.Sobel(image, cv2.CV_32F, 0, 1, ksize=3)
+        height, width = binary.shape
+        grid = (max(1, width // block), max(1, height // block))
+        # INTER_AREA resize = mean over each block
+        gxx, gyy, gxy = (cv2.resize(g, grid, interpolation=cv2.INTER_AREA)
+                         for g in (gx * gx, gy * gy, gx * gy))
+        coherence = np.sqrt((gxx - gyy) ** 2 + 4 * gxy ** 2) / np.maximum(gxx + gyy, 1e-6)
+        rows = np.minimum(ys * grid[1] // height, grid[1] - 1)
+        cols = np.minimum(xs * grid[0] // width, grid[0] - 1)
+        return coherence[rows, cols]
+
+    def _angles(self, binary: np.ndarray, skeleton: np.ndarray,
+                xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """
+        Ridge direction at each minutia, pointing from the ridge to the minutia
+        Orientation (mod π) comes from the Gaussian weighted structure tensor,
+        the direction from the centroid of nearby skeleton pixels. Both are
+        computed on patches around the minutiae only, not the whole image.
+        """
+        image = binary.astype(np.float32) / 255.0
+        gx = _patches(cv2.Sobel(image, cv2.CV_32F, 1, 0, ksize=3), xs, ys,
+                      int(3 * self.orientation_sigma))
+        gy = _patches(cv2.Sobel(image, cv2.CV_32F, 0, 1, ksize=3), xs, ys,
+                      int(3 * self.orientation_sigma))
+        gauss = cv2.getGaussianKernel(gx.shape[1], self.orientation_sigma)
+        weights = (gauss @ gauss.T)[None].astype(np.float32)
+        gxx = (gx * gx * weights).sum(axis=(1, 2))
+        gyy = (gy * gy * weights).sum(axis=(1, 2))
+        gxy = (gx * gy * weights).sum(axis=(1, 2))
+        # Gradient orientation + 90° = ridge orientation
+        orientation = 0.5 * np.arctan2(2 * gxy, gxx - gyy) + np.pi / 2
+
+        # Mean offset of skeleton pixels in the window points into the ridge
+        ridge = _patches(skeleton, xs, ys, self.window).astype(np.float32)
+        offsets = np.arange(-self.window, self.window + 1, dtype=np.float32)
+        count = ridge.sum(axis=(1, 2))
+        to_x = -(ridge * offsets[None, None, :]).sum(axis=(1, 2)) / count
+        to_y = -(ridge * offsets[None, :, None]).sum(axis=(1, 2)) / count
+
+        # Flip the orientation by π where it points into the ridge
+        flip = np.cos(orientation) * to_x + np.sin(orientation) * to_y < 0
+        return np.mod(orientation + np.pi * flip, 2 * np.pi)
+
+
+class MinutiaeMatcher(FeatureMatcher):
+    """
+    Minutiae set matching by Hough alignment
+
+    Every (probe, reference) minutia pair votes for the rotation and
+    translation that would superimpose them. The best voted alignments are
+    applied to the probe set, and minutiae that land within
+    distance_tolerance pixels and angle_tolerance radians of each other
+    (mutual nearest) are paired. The pairing of the best alignment is the
+    match, so num_matches counts corresponding minutiae.
+    """
+
+    def __init__(self, ratio_threshold: float = 0.7, distance_tolerance: float = 10.0,
+                 angle_tolerance: float = np.pi / 9, max_rotation: float = np.pi,
+                 alignments: int = 3):
+        # ratio_threshold is unused, kept for the common matcher signature
+        super().__init__(ratio_threshold)
+        self.distance_tolerance = distance_tolerance
+        self.angle_tolerance = angle_tolerance
+        self.max_rotation = max_rotation
+        self.alignments = alignments
+        self.name = "HOUGH"
+        self.binary = None
+
+    def match_arrays(self, des1: np.ndarray, des2: np.ndarray) -> tuple:
+        """
+        Pair des1 minutiae with des2 minutiae under the best alignment
+        Returns (query_idx, train_idx, distances) as contiguous arrays
+        """
+        empty = (np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32),
+                 np.empty(0, dtype=np.float32))
+        if des1 is None or des2 is None or len(des1) == 0 or len(des2) == 0:
+            return empty
+
+        best = empty
+        for rotation, shift in self._candidate_alignments(des1, des2):
+            pairs = self._pair(des1, des2, rotation, shift)
+            if len(pairs[0]) > len(best[0]):
+                best = pairs
+        return best
+
+    def create_gallery_index(self, train: np.ndarray, offsets: np.ndarray):
+        return MinutiaeGalleryIndex(self, train, offsets)
+
+    def _candidate_alignments(self, des1: np.ndarray, des2: np.ndarray) -> list:
+        """Best (rotation, shift) bins of the pairwise Hough vote, refined by their mean"""
+        rotation = _wrap(des2[None, :, 2] - des1[:, None, 2]).ravel()
+        cos, sin = np.cos(rotation), np.sin(rotation)
+        x1 = np.repeat(des1[:, 0], len(des2))
+        y1 = np.repeat(des1[:, 1], len(des2))
+        x2 = np.tile(des2[:, 0], len(des1))
+        y2 = np.tile(des2[:, 1], len(des1))
+        shift_x = x2 - (cos * x1 - sin * y1)
+        shift_y = y2 - (sin * x1 + cos * y1)
+
+        # Only same-type pairs within the allowed rotation vote
+        same_type = (des1[:, None, 3] == des2[None, :, 3]).ravel()
+        voting = same_type & (np.abs(rotation) <= self.max_rotation)
+        if not voting.any():
+            return []
+        rotation, shift_x, shift_y = rotation[voting], shift_x[voting], shift_y[voting]
+
+        # Bin keys: rotation by angle tolerance, shift by distance tolerance,
+        # packed into one integer so the vote is a 1-D unique/count
+        keys = np.zeros(len(rotation), dtype=np.int64)
+        for values, width in ((rotation, self.angle_tolerance),
+                              (shift_x, self.distance_tolerance),
+                              (shift_y, self.distance_tolerance)):
+            bins = np.floor(values / width).astype(np.int64)
+            bins -= bins.min()
+            keys = keys * (bins.max() + 1) + bins
+        _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+
+        alignments = []
+        for b in np.argsort(-counts, kind='stable')[:self.alignments]:
+            members = inverse == b
+            angle = np.arctan2(np.sin(rotation[members]).mean(),
+                               np.cos(rotation[members]).mean())
+            alignments.append((angle, (shift_x[members].mean(), shift_y[members].mean())))
+        return alignments
+
+    def _pair(self, des1: np.ndarray, des2: np.ndarray, rotation: float,
+              shift: tuple) -> tuple:
+        """Mutual nearest pairs of aligned des1 and des2 within the tolerances"""
+        cos, sin = np.cos(rotation), np.sin(rotation)
+        x = cos * des1[:, 0] - sin * des1[:, 1] + shift[0]
+        y = sin * des1[:, 0] + cos * des1[:, 1] + shift[1]
+        distances = np.hypot(x[:, None] - des2[None, :, 0], y[:, None] - des2[None, :, 1])
+        angle_diff = np.abs(_wrap(des1[:, None, 2] + rotation - des2[None, :, 2]))
+
+        distances = np.where((distances < self.distance_tolerance)
+                             & (angle_diff < self.angle_tolerance), distances, np.inf)
+        nearest2 = distances.argmin(axis=1)
+        nearest1 = distances.argmin(axis=0)
+        query_idx = np.flatnonzero((nearest1[nearest2] == np.arange(len(des1)))
+                                   & np.isfinite(distances.min(axis=1))).astype(np.int32)
+        train_idx = nearest2[query_idx].astype(np.int32)
+        return (query_idx, train_idx,
+                distances[query_idx, train_idx].astype(np.float32))
+
+
+class MinutiaeGalleryIndex:
+    """Gallery scoring for MinutiaeMatcher: paired minutiae count per print"""
+
+    def __init__(self, matcher: MinutiaeMatcher, train: np.ndarray, offsets: np.ndarray):
+        self.matcher = matcher
+        self.train = train
+        self.offsets = offsets
+
+    def print_scores(self, query: np.ndarray, ratio: float = None) -> np.ndarray:
+        """Number of paired minutiae with every print (ratio is unused)"""
+        scores = np.zeros(len(self.offsets) - 1, dtype=np.int64)
+        for i, (start, stop) in enumerate(zip(self.offsets[:-1], self.offsets[1:])):
+            if stop > start:
+                scores[i] = len(self.matcher.match_arrays(query, self.train[start:stop])[0])
+        return scores
+
+
+def _patches(image: np.ndarray, xs: np.ndarray, ys: np.ndarray, radius: int) -> np.ndarray:
+    """(n, 2r+1, 2r+1) windows of image centred on the points, zero outside"""
+    padded = np.pad(image, radius)
+    offsets = np.arange(2 * radius + 1)
+    return padded[ys[:, None, None] + offsets[None, :, None],
+                  xs[:, None, None] + offsets[None, None, :]]
+
+
+def _wrap(angles: np.ndarray) -> np.ndarray:
+    """Angles to [-π, π)"""
+    return np.mod(angles + np.pi, 2 * np.pi) - np.pi
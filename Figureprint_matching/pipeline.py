@@ -1,28 +1,58 @@
 import cv2
-import matplotlib.pyplot as plt
+import time
 from pathlib import Path
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from extractors import ORBExtractor, SIFTExtractor
 from matchers import BFMatcher, FLANNMatcher
 from image_matcher import ImageMatcher
+from cache import DescriptorCache
+from preprocessor import ImagePreprocessor
+from results import compose_figure, save_image
+from store import ResultStore
 
 
 class MatchingPipeline:
     """Runs both matching methods and compares results"""
 
-    def __init__(self):
+    def __init__(self, cache_dir: str = None, concurrent: bool = False,
+                 verifier=None, segment: bool = False, results_dir: str = "results",
+                 quality_gate=None):
+        # One descriptor cache shared by both pipelines (disabled if None)
+        self.cache = DescriptorCache(cache_dir) if cache_dir else None
+
+        # Run methods on a thread pool (OpenCV releases the GIL)
+        self.concurrent = concurrent
+        # Shared by all methods (segment → foreground mask for extractors)
+        self.preprocessor = ImagePreprocessor(segment=segment)
+        self._executor = None
+
+        # Append-only JSON lines store, opened on the first saved comparison
+        self.results_dir = results_dir
+        self.store = None
+
         # Create ORB+BF pipeline
         self.orb_bf = ImageMatcher(
             extractor=ORBExtractor(nfeatures=1000),
-            matcher=BFMatcher(ratio_threshold=0.7)
+            matcher=BFMatcher(ratio_threshold=0.7),
+            cache=self.cache,
+            verifier=verifier,
+            preprocessor=self.preprocessor,
+            quality_gate=quality_gate
         )
 
         # Create SIFT+FLANN pipeline
         self.sift_flann = ImageMatcher(
             extractor=SIFTExtractor(nfeatures=1000),
-            matcher=FLANNMatcher(ratio_threshold=0.7)
+            matcher=FLANNMatcher(ratio_threshold=0.7),
+            cache=self.cache,
+            verifier=verifier,
+            preprocessor=self.preprocessor,
+            quality_gate=quality_gate
         )
 
+        # Every configured pipeline, in reporting order
+        self.matchers = [self.orb_bf, self.sift_flann]
+
     def compare_methods(self, img1_path: str, img2_path: str,
                         save_figure: bool = True, save_results: bool = True):
         """
@@ -33,13 +63,15 @@ class MatchingPipeline:
         print(f"Comparing: {Path(img1_path).name} vs {Path(img2_path).name}")
         print(f"{'=' * 70}\n")
 
-        # Run ORB+BF
-        orb_result = self.orb_bf.match_images(img1_path, img2_path)
-        print(orb_result)
+        # Run ORB+BF and SIFT+FLANN (in parallel when concurrent is set)
+        start_time = time.perf_counter()
+        orb_result, sift_result = self.match_pair(img1_path, img2_path)
+        wall_time = time.perf_counter() - start_time
 
-        # Run SIFT+FLANN
-        sift_result = self.sift_flann.match_images(img1_path, img2_path)
+        print(orb_result)
         print(f"\n{sift_result}")
+        if self.concurrent:
+            print(f"\nWall-clock (concurrent): {wall_time:.4f}s")
 
         # Print analysis
         self._print_analysis(orb_result, sift_result)
@@ -54,6 +86,37 @@ class MatchingPipeline:
 
         return orb_result, sift_result
 
+    def match_pair(self, img1_path: str, img2_path: str,
+                   draw_matches: bool = False) -> list:
+        """Run every configured method on one pair without printing or saving"""
+        if not self.concurrent:
+            return [matcher.match_images(img1_path, img2_path, draw_matches=draw_matches)
+                    for matcher in self.matchers]
+
+        # Decode and binarize each image once, shared by all methods
+        start_time = time.perf_counter()
+        images = (self.preprocessor.load(img1_path),
+                  self.preprocessor.load(img2_path))
+        load_time = time.perf_counter() - start_time
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=len(self.matchers))
+
+        # Each method times itself inside its own thread
+        futures = [
+            self._executor.submit(matcher.match_images, img1_path, img2_path,
+                                  draw_matches, images)
+            for matcher in self.matchers
+        ]
+        results = [future.result() for future in futures]
+
+        # Every method depends on the shared decode, so count it for each
+        for result in results:
+            result.processing_time += load_time
+            result.stage_times['load'] += load_time
+
+        return results
+
     def _print_analysis(self, orb_result, sift_result):
         """Compare and print performance analysis"""
         print(f"\n{'=' * 70}")
@@ -80,12 +143,19 @@ class MatchingPipeline:
         print(f"Quality: SIFT+FLANN uses floating-point (accurate)")
 
     def _visualize_results(self, orb_result, sift_result, img1_path, img2_path):
-        """Create and save visualization figure"""
+        """Create, save and show the matplotlib figure"""
+        # Imported here so headless use never loads matplotlib
+        import matplotlib.pyplot as plt
+
         fig, axes = plt.subplots(2, 1, figsize=(16, 12))
 
+        # Match images are rendered lazily, draw each once
+        orb_image = orb_result.render()
+        sift_image = sift_result.render()
+
         # Plot ORB+BF results
-        if orb_result.match_image is not None:
-            axes[0].imshow(cv2.cvtColor(orb_result.match_image, cv2.COLOR_BGR2RGB))
+        if orb_image is not None:
+            axes[0].imshow(cv2.cvtColor(orb_image, cv2.COLOR_BGR2RGB))
             axes[0].set_title(
                 f"ORB+BF: {orb_result.num_matches} matches "
                 f"in {orb_result.processing_time:.3f}s",
@@ -94,8 +164,8 @@ class MatchingPipeline:
             axes[0].axis('off')
 
         # Plot SIFT+FLANN results
-        if sift_result.match_image is not None:
-            axes[1].imshow(cv2.cvtColor(sift_result.match_image, cv2.COLOR_BGR2RGB))
+        if sift_image is not None:
+            axes[1].imshow(cv2.cvtColor(sift_image, cv2.COLOR_BGR2RGB))
             axes[1].set_title(
                 f"SIFT+FLANN: {sift_result.num_matches} matches "
                 f"in {sift_result.processing_time:.3f}s",
@@ -114,63 +184,36 @@ class MatchingPipeline:
         plt.savefig(output_name, dpi=150, bbox_inches='tight')
         print(f"\nImage saved to: {output_name}")
         plt.show()
-    def _save_to_file(self, orb_result, sift_result, img1_path, img2_path):
-        """Save results to text file"""
-        # Create results directory if it doesn't exist
-        results_dir = Path("results")
-        results_dir.mkdir(exist_ok=True)
 
-        # Generate filename with timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = results_dir / f"matching_results_{timestamp}.txt"
-
-        # Write results to file
-        with open(filename, 'w') as f:
-            f.write("=" * 70 + "\n")
-            f.write("IMAGE MATCHING RESULTS\n")
-            f.write("=" * 70 + "\n\n")
-
-            f.write(f"Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write(f"Image 1: {Path(img1_path).name}\n")
-            f.write(f"Image 2: {Path(img2_path).name}\n\n")
-
-            f.write("-" * 70 + "\n")
-            f.write("ORB + BF MATCHER RESULTS:\n")
-            f.write("-" * 70 + "\n")
-            f.write(f"Keypoints (img1): {orb_result.num_kp1}\n")
-            f.write(f"Keypoints (img2): {orb_result.num_kp2}\n")
-            f.write(f"Good Matches: {orb_result.num_matches}\n")
-            f.write(f"Processing Time: {orb_result.processing_time:.4f}s\n\n")
-
-            f.write("-" * 70 + "\n")
-            f.write("SIFT + FLANN MATCHER RESULTS:\n")
-            f.write("-" * 70 + "\n")
-            f.write(f"Keypoints (img1): {sift_result.num_kp1}\n")
-            f.write(f"Keypoints (img2): {sift_result.num_kp2}\n")
-            f.write(f"Good Matches: {sift_result.num_matches}\n")
-            f.write(f"Processing Time: {sift_result.processing_time:.4f}s\n\n")
-
-            # Comparison
-            f.write("-" * 70 + "\n")
-            f.write("COMPARISON:\n")
-            f.write("-" * 70 + "\n")
-
-            speed_diff = abs(orb_result.processing_time - sift_result.processing_time)
-            faster = "ORB+BF" if orb_result.processing_time < sift_result.processing_time else "SIFT+FLANN"
-            f.write(f"Speed Winner: {faster} (by {speed_diff:.4f}s)\n")
-
-            match_winner = "ORB+BF" if orb_result.num_matches > sift_result.num_matches else "SIFT+FLANN"
-            match_diff = abs(orb_result.num_matches - sift_result.num_matches)
-            f.write(f"More Matches: {match_winner} (+{match_diff} matches)\n\n")
-
-            # Recommendation
-            f.write("-" * 70 + "\n")
-            f.write("RECOMMENDATION:\n")
-            f.write("-" * 70 + "\n")
-            if orb_result.num_matches > 10 and sift_result.num_matches > 10:
-                f.write("Both methods successfully matched the images.\n")
-                f.write(f"Best choice: {faster} (faster)\n")
-            else:
-                f.write("Low match count. Consider adjusting parameters.\n")
-
-        print(f"Results saved to: {filename}")
\ No newline at end of file
+    def save_figure(self, results: list, output_name: str):
+        """Write the stacked match images of results without matplotlib"""
+        figure = compose_figure(results)
+        if figure is None:
+            return None
+        save_image(output_name, figure)
+        return output_name
+
+    def _save_to_file(self, orb_result, sift_result, img1_path, img2_path):
+        """Append both results to this run's results store"""
+        if self.store is None:
+            self.store = ResultStore(self.results_dir)
+        for result in (orb_result, sift_result):
+            self.store.append(result, img1_path, img2_path)
+        # Interactive runs are short, make every comparison durable at once
+        self.store.flush()
+        print(f"Results saved to: {self.store.path}")
+
+    def close(self):
+        """Close the results store and stop the method thread pool"""
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -9,30 +9,75 @@ class ImagePreprocessor:
     Used to prepare images before feature extraction
     """
 
-    @staticmethod
-    def load_and_preprocess(image_path: str) -> np.ndarray:
+    # imread flags that let the codec decode at 1/2, 1/4, 1/8 size
+    # (JPEG skips DCT work, other formats are downsampled after decoding)
+    REDUCED_FLAGS = {
+        1: cv2.IMREAD_GRAYSCALE,
+        2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+        4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+        8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+    }
+
+    def __init__(self, segment: bool = False, block_size: int = 16,
+                 min_ridge_variance: float = 0.1, border_blocks: int = 0,
+                 reduce_factor: int = 1, target_ridge_period: float = None):
+        """
+        Args:
+            segment: compute a foreground mask so extractors skip background
+            block_size: segmentation block size in pixels
+            min_ridge_variance: minimum block variance p*(1-p) of the binary
+                image (p = ridge pixel fraction) to count as foreground
+            border_blocks: erode the mask by this many blocks (drops the
+                ragged print border)
+            reduce_factor: decode at 1/reduce_factor size (1, 2, 4 or 8)
+            target_ridge_period: if set, downsample further until ridges
+                repeat every ~target_ridge_period pixels (never upsamples)
+        """
+        if reduce_factor not in self.REDUCED_FLAGS:
+            raise ValueError(f"reduce_factor must be one of {list(self.REDUCED_FLAGS)}")
+
+        self.segment = segment
+        self.block_size = block_size
+        self.min_ridge_variance = min_ridge_variance
+        self.border_blocks = border_blocks
+        self.reduce_factor = reduce_factor
+        self.target_ridge_period = target_ridge_period
+
+    def load_and_preprocess(self, image_path: str) -> np.ndarray:
+        """
+        Load image from disk and apply Otsu's binarization
+        Returns binary image at the working scale (see load())
+        """
+        return self.load(image_path)[0]
+
+    def load(self, image_path: str) -> tuple:
         """
         Load image from disk and apply Otsu's binarization
 
         Process:
-        1. Load image in grayscale mode
+        1. Load image in grayscale mode (optionally at reduced size)
         2. Apply automatic threshold using Otsu's method
         3. Invert binary image (ridges white, background black)
+        4. Optionally downsample to the target ridge period
 
         Args:
             image_path: Path to image file (str or Path object)
 
         Returns:
+            (binary image, scale)
             Binary image as numpy array (height × width, uint8)
             Values: 0 (black) or 255 (white)
+            scale: working size / full size, divide keypoint coordinates
+            by it to get full resolution coordinates
 
         Raises:
             ValueError: If image cannot be loaded from path
         """
         # === Step 1: Load image in grayscale ===
         # cv2.IMREAD_GRAYSCALE → loads image as single channel (no colors)
+        # IMREAD_REDUCED_GRAYSCALE_N → same, decoded at 1/N size
         # Result: 2D array of pixel intensities (0-255)
-        img = cv2.imread(str(image_path), cv2.IMREAD_GRAYSCALE)
+        img = cv2.imread(str(image_path), self.REDUCED_FLAGS[self.reduce_factor])
 
         # === Step 2: Validate image loaded successfully ===
         if img is None:
@@ -62,8 +107,107 @@ class ImagePreprocessor:
             255,  # max value
             cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU  # method flags
         )
+        scale = 1.0 / self.reduce_factor
+
+        # === Step 4: Match working scale to ridge frequency ===
+        if self.target_ridge_period:
+            img_binary, ridge_scale = self._rescale_to_ridge_period(img_binary)
+            scale *= ridge_scale
+
+        return img_binary, scale
+
+    def estimate_ridge_period(self, img_binary: np.ndarray):
+        """
+        Average ridge period (pixels) of a binarized print, None if unknown
+
+        Counts ridge/valley transitions along rows and columns over the
+        foreground area. For ridges of period p at a uniformly distributed
+        orientation, transitions per pixel (rows + columns) average 8/(π·p).
+        """
+        ridges = img_binary > 0
+        transitions = (np.count_nonzero(ridges[:, 1:] != ridges[:, :-1])
+                       + np.count_nonzero(ridges[1:, :] != ridges[:-1, :]))
+
+        # Foreground area from the block map (background has no transitions)
+        blocks = self._ridge_blocks(img_binary)
+        area = np.count_nonzero(blocks) / blocks.size * img_binary.size
+
+        if transitions == 0 or area == 0:
+            return None
+        return 8.0 * area / (np.pi * transitions)
+
+    def _rescale_to_ridge_period(self, img_binary: np.ndarray) -> tuple:
+        """Downsample binary image so ridges repeat every target_ridge_period px"""
+        period = self.estimate_ridge_period(img_binary)
+        if period is None or period <= self.target_ridge_period:
+            return img_binary, 1.0
+
+        ridge_scale = self.target_ridge_period / period
+        # Skip tiny changes, resampling costs more than it saves
+        if ridge_scale > 0.9:
+            return img_binary, 1.0
+
+        height, width = img_binary.shape
+        size = (max(1, round(width * ridge_scale)), max(1, round(height * ridge_scale)))
+        small = cv2.resize(img_binary, size, interpolation=cv2.INTER_AREA)
+        _, small = cv2.threshold(small, 127, 255, cv2.THRESH_BINARY)
+
+        # Actual scale after rounding to whole pixels
+        return small, size[0] / width
+
+    def foreground_mask(self, img_binary: np.ndarray):
+        """
+        Foreground (ridge area) mask of a binarized print, None if disabled
+
+        Process:
+        1. Average the binary image over blocks → ridge fraction p per block
+        2. Ridge areas mix ridges and valleys, so p*(1-p) is high there;
+           empty background or solid blobs give ~0
+        3. Clean the block map with morphology (close holes, open specks)
+        4. Scale back up to image size (255 = foreground)
+        """
+        if not self.segment:
+            return None
+
+        block_mask = self._ridge_blocks(img_binary)
+        if self.border_blocks > 0:
+            kernel = np.ones((3, 3), dtype=np.uint8)
+            block_mask = cv2.erode(block_mask, kernel, iterations=self.border_blocks)
+
+        height, width = img_binary.shape
+        return cv2.resize(block_mask, (width, height),
+                          interpolation=cv2.INTER_NEAREST)
+
+    def _ridge_blocks(self, img_binary: np.ndarray) -> np.ndarray:
+        """Block-level foreground map (255 = ridge area), one pixel per block"""
+        height, width = img_binary.shape
+        blocks_y = max(1, height // self.block_size)
+        blocks_x = max(1, width // self.block_size)
+
+        # INTER_AREA resize = mean over each block (fast block statistics)
+        ridge_fraction = cv2.resize(
+            img_binary.astype(np.float32) / 255.0, (blocks_x, blocks_y),
+            interpolation=cv2.INTER_AREA
+        )
+        variance = ridge_fraction * (1.0 - ridge_fraction)
+        block_mask = (variance >= self.min_ridge_variance).astype(np.uint8) * 255
 
-        return img_binary
+        kernel = np.ones((3, 3), dtype=np.uint8)
+        block_mask = cv2.morphologyEx(block_mask, cv2.MORPH_CLOSE, kernel)
+        return cv2.morphologyEx(block_mask, cv2.MORPH_OPEN, kernel)
+
+    def get_params(self) -> dict:
+        """Settings that change the preprocessed output (used as cache key)"""
+        params = {'threshold': 'otsu', 'invert': True}
+        if self.reduce_factor != 1:
+            params['reduce_factor'] = self.reduce_factor
+        if self.target_ridge_period:
+            params['target_ridge_period'] = self.target_ridge_period
+        if self.segment:
+            params['segment'] = {'block_size': self.block_size,
+                                 'min_ridge_variance': self.min_ridge_variance,
+                                 'border_blocks': self.border_blocks}
+        return params
 """
 === Libraries Used ===
 
@@ -79,6 +223,18 @@ cv2 (OpenCV):
       Flag for imread() to load image in grayscale mode
       Result: 2D array (height × width) instead of 3D (height × width × 3)
 
+- cv2.IMREAD_REDUCED_GRAYSCALE_2 / _4 / _8
+      Grayscale load at 1/2, 1/4 or 1/8 size
+      JPEG decodes directly at the smaller size (much less work)
+
+- cv2.resize(src, dsize, interpolation)
+      Resizes image to dsize (width, height)
+      INTER_AREA: averages source pixels (block means, downsampling)
+      INTER_NEAREST: copies nearest pixel (keeps mask values 0/255)
+
+- cv2.morphologyEx(src, op, kernel)
+      MORPH_CLOSE fills small holes, MORPH_OPEN removes small specks
+
 - cv2.threshold(src, thresh, maxval, type)
       Applies fixed-level threshold to image
       Inputs:
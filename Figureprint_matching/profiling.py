@@ -0,0 +1,196 @@
+import os
+import sys
+import json
+import atexit
+import cProfile
+import threading
+import tracemalloc
+from pathlib import Path
+from collections import Counter
+from datetime import datetime
+import timing
+
+MODES = ('sample', 'cprofile', 'memory')
+
+
+class Profiler:
+    """
+    Opt-in profiling of the timed pipeline stages
+
+    Hooks into timing.stage(), so every cache/load/quality/segment/extract/
+    match/verify/draw block is covered wherever it runs. Modes:
+      sample    a background thread samples the Python stack of every
+                thread inside a stage; written as collapsed stacks
+                ("stage;file:function;... count") for flame graph tools
+      cprofile  deterministic cProfile of the stages of one thread (.pstats)
+      memory    tracemalloc peak allocation per stage plus the top
+                allocation sites (.memory.json)
+
+    When no profiler is enabled stage() only checks one global, so the
+    pipeline pays nothing measurable.
+    """
+
+    def __init__(self, modes=('sample',), directory: str = "profiles",
+                 interval: float = 0.005):
+        modes = tuple(modes)
+        for mode in modes:
+            if mode not in MODES:
+                raise ValueError(f"Unknown profiling mode: {mode} (choose from {MODES})")
+        self.modes = modes
+        self.directory = Path(directory)
+        self.interval = interval
+        self.prefix = f"profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.getpid()}"
+
+        self._lock = threading.Lock()
+        # Thread id → stages currently entered by that thread
+        self._active = {}
+
+        self.samples = Counter()
+        self._sampler = None
+        self._stop = threading.Event()
+
+        self._cprofile = None
+        self._cprofile_thread = None
+
+        # Stage name → [calls, peak bytes sum, peak bytes max]
+        self.memory = {}
+        self._memory_stack = []
+
+    def start(self):
+        if 'memory' in self.modes and not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+        if 'cprofile' in self.modes:
+            self._cprofile = cProfile.Profile()
+        if 'sample' in self.modes:
+            self._sampler = threading.Thread(target=self._sample, daemon=True,
+                                             name="stage-sampler")
+            self._sampler.start()
+        timing.set_profiler(self)
+        return self
+
+    def stop(self) -> list:
+        """Unhook, write the outputs and return their paths"""
+        timing.set_profiler(None)
+        if self._sampler is not None:
+            self._stop.set()
+            self._sampler.join()
+            self._sampler = None
+        return self.write()
+
+    def enter(self, name: str):
+        """Called by timing.stage() when a stage starts"""
+        thread_id = threading.get_ident()
+        with self._lock:
+            stages = self._active.setdefault(thread_id, [])
+            stages.append(name)
+            if self._cprofile is not None and self._cprofile_thread in (None, thread_id):
+                # cProfile follows one thread, the first one to enter a stage
+                if self._cprofile_thread is None:
+                    self._cprofile_thread = thread_id
+                    self._cprofile.enable()
+            if 'memory' in self.modes:
+                self._fold_peak()
+                current, _ = tracemalloc.get_traced_memory()
+                self._memory_stack.append([name, current, 0])
+
+    def exit(self, name: str):
+        """Called by timing.stage() when a stage ends"""
+        thread_id = threading.get_ident()
+        with self._lock:
+            stages = self._active.get(thread_id)
+            if stages:
+                stages.pop()
+                if not stages:
+                    del self._active[thread_id]
+            if self._cprofile_thread == thread_id and not stages:
+                self._cprofile.disable()
+                self._cprofile_thread = None
+            if 'memory' in self.modes:
+                self._fold_peak()
+                for i in range(len(self._memory_stack) - 1, -1, -1):
+                    if self._memory_stack[i][0] == name:
+                        _, start, peak = self._memory_stack.pop(i)
+                        stats = self.memory.setdefault(name, [0, 0, 0])
+                        stats[0] += 1
+                        stats[1] += peak - start
+                        stats[2] = max(stats[2], peak - start)
+                        break
+
+    def write(self) -> list:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        paths = []
+
+        if 'sample' in self.modes:
+            path = self.directory / f"{self.prefix}.collapsed"
+            with open(path, 'w') as f:
+                for stack, count in self.samples.most_common():
+                    f.write(f"{stack} {count}\n")
+            paths.append(path)
+
+        if self._cprofile is not None:
+            path = self.directory / f"{self.prefix}.pstats"
+            self._cprofile.dump_stats(path)
+            paths.append(path)
+
+        if 'memory' in self.modes:
+            path = self.directory / f"{self.prefix}.memory.json"
+            report = {
+                'stages': {name: {'calls': calls, 'peak_mean_bytes': total // calls,
+                                  'peak_max_bytes': peak}
+                           for name, (calls, total, peak) in self.memory.items()},
+                'top_allocations': [
+                    {'site': str(stat.traceback[0]), 'size_bytes': stat.size,
+                     'count': stat.count}
+                    for stat in tracemalloc.take_snapshot().statistics('lineno')[:25]
+                ] if tracemalloc.is_tracing() else []
+            }
+            path.write_text(json.dumps(report, indent=2))
+            paths.append(path)
+
+        return paths
+
+    def _fold_peak(self):
+        """Credit the peak since the last reset to every open stage, then reset"""
+        _, peak = tracemalloc.get_traced_memory()
+        for entry in self._memory_stack:
+            entry[2] = max(entry[2], peak)
+        tracemalloc.reset_peak()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                active = [(thread_id, stages[-1]) for thread_id, stages in self._active.items()]
+            for thread_id, name in active:
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                # Stage as root frame, then outermost → innermost call
+                self.samples[";".join([name, *reversed(stack)])] += 1
+
+
+def enable(modes=('sample',), directory: str = "profiles",
+           interval: float = 0.005) -> Profiler:
+    """Start profiling every stage of this process"""
+    return Profiler(modes, directory, interval).start()
+
+
+def parse_modes(value: str) -> tuple:
+    """'sample,memory' → ('sample', 'memory'), '1' → ('sample',)"""
+    modes = tuple(mode.strip() for mode in value.split(',') if mode.strip())
+    return ('sample',) if modes in ((), ('1',)) else modes
+
+
+def enable_from_env():
+    """
+    FP_PROFILE=sample,cprofile,memory profiles the whole process
+    Output goes to FP_PROFILE_DIR (default profiles/) at exit
+    """
+    profiler = enable(parse_modes(os.environ['FP_PROFILE']),
+                      os.environ.get('FP_PROFILE_DIR', "profiles"),
+                      float(os.environ.get('FP_PROFILE_INTERVAL_MS', 5)) / 1000)
+    atexit.register(profiler.stop)
+    return profiler
@@ -0,0 +1,118 @@
+import cv2
+import numpy as np
+
+
+class QualityError(ValueError):
+    """Capture rejected by the quality gate, report holds the measurements"""
+
+    def __init__(self, image_path: str, report):
+        super().__init__(f"Rejected {image_path}: {report.reason}")
+        self.image_path = image_path
+        self.report = report
+
+
+class QualityReport:
+    """Quality measurements of one binarized capture"""
+
+    __slots__ = ('coverage', 'contrast', 'coherence', 'reason')
+
+    def __init__(self, coverage: float, contrast: float, coherence: float,
+                 reason: str = None):
+        self.coverage = coverage
+        self.contrast = contrast
+        self.coherence = coherence
+        # None when the capture passed
+        self.reason = reason
+
+    @property
+    def passed(self) -> bool:
+        return self.reason is None
+
+    def get_summary(self) -> dict:
+        return {'coverage': self.coverage, 'contrast': self.contrast,
+                'coherence': self.coherence, 'rejected': self.reason}
+
+
+class QualityGate:
+    """
+    Cheap capture quality check between binarization and extraction
+
+    All measures come from block statistics of the binary image, taken with
+    INTER_AREA resizes (one pixel per block), so a check costs about a
+    millisecond instead of a full detectAndCompute + knn match:
+      coverage   fraction of blocks containing ridges (blank / partial)
+      contrast   mean ridge/valley balance 2·sqrt(p(1-p)) of those blocks,
+                 1.0 for equal ridge and valley area (smudged, over-inked)
+      coherence  mean structure tensor coherence of those blocks, 1.0 for
+                 parallel ridges, ~0 for noise (smeared, scratched)
+    Captures below any threshold are rejected with the failing measure.
+
+    The defaults were set on synthetic prints only (coherence 0.88-0.95,
+    contrast 0.87-0.99). Degraded copies stay below them: blurred 0.24 and
+    over-inked 0.33 contrast, noise 0.13 coherence, partial 0.03 coverage.
+    The building photos in pictures/ used by main.py are not prints and
+    fail on coherence (0.41 and 0.49). Re-check min_coherence on real
+    sensor captures before relying on it.
+    """
+
+    def __init__(self, min_coverage: float = 0.2, min_contrast: float = 0.5,
+                 min_coherence: float = 0.5, block_size: int = 24,
+                 downsample: int = 2, min_ink: float = 0.05):
+        """
+        Args:
+            min_coverage, min_contrast, min_coherence: rejection thresholds
+            block_size: block size in working-scale pixels
+            downsample: gradients are computed at 1/downsample size
+            min_ink: ridge pixel fraction for a block to count as print area
+        """
+        self.min_coverage = min_coverage
+        self.min_contrast = min_contrast
+        self.min_coherence = min_coherence
+        self.block_size = block_size
+        self.downsample = downsample
+        self.min_ink = min_ink
+
+    def assess(self, img_binary: np.ndarray) -> QualityReport:
+        """Measure one binary image (ridges 255) and decide"""
+        height, width = img_binary.shape
+        grid = (max(1, width // self.block_size), max(1, height // self.block_size))
+        image = img_binary.astype(np.float32) / 255.0
+
+        # Ridge fraction per block (INTER_AREA resize = block mean)
+        ridge_fraction = cv2.resize(image, grid, interpolation=cv2.INTER_AREA)
+        # Float rounding can push a solid block just past 1, sqrt would give NaN
+        np.clip(ridge_fraction, 0.0, 1.0, out=ridge_fraction)
+        area = ridge_fraction >= self.min_ink
+        coverage = float(area.mean())
+        if not area.any():
+            return self._decide(coverage, 0.0, 0.0)
+        contrast = float((2 * np.sqrt(ridge_fraction * (1 - ridge_fraction)))[area].mean())
+
+        # Structure tensor per block on the downsampled image
+        if self.downsample > 1:
+            small = (max(1, width // self.downsample), max(1, height // self.downsample))
+            image = cv2.resize(image, small, interpolation=cv2.INTER_AREA)
+        gx = cv2.Sobel(image, cv2.CV_32F, 1, 0, ksize=3)
+        gy = cv2.Sobel(image, cv2.CV_32F, 0, 1, ksize=3)
+        gxx, gyy, gxy = (cv2.resize(g, grid, interpolation=cv2.INTER_AREA)
+                         for g in (gx * gx, gy * gy, gx * gy))
+        energy = gxx + gyy
+        coherence_map = np.sqrt((gxx - gyy) ** 2 + 4 * gxy ** 2) / np.maximum(energy, 1e-6)
+        coherence = float(coherence_map[area].mean())
+
+        return self._decide(coverage, contrast, coherence)
+
+    def get_params(self) -> dict:
+        return {'min_coverage': self.min_coverage, 'min_contrast': self.min_contrast,
+                'min_coherence': self.min_coherence, 'block_size': self.block_size,
+                'downsample': self.downsample, 'min_ink': self.min_ink}
+
+    def _decide(self, coverage: float, contrast: float, coherence: float) -> QualityReport:
+        reason = None
+        for name, value, threshold in (('coverage', coverage, self.min_coverage),
+                                       ('contrast', contrast, self.min_contrast),
+                                       ('coherence', coherence, self.min_coherence)):
+            if value < threshold:
+                reason = f"{name} {value:.2f} < {threshold:.2f}"
+                break
+        return QualityReport(coverage, contrast, coherence, reason)
@@ -1,7 +1,22 @@
+import cv2
 import numpy as np
+from pathlib import Path
+from preprocessor import ImagePreprocessor
 
 
 class MatchResult:
+    """
+    Compact record of one comparison
+
+    Only the matched keypoint coordinates are kept (pts1[i] ↔ pts2[i]);
+    the side-by-side match image is rendered on demand from the image paths.
+    """
+
+    # No per-instance __dict__, keeps millions of results cheap
+    __slots__ = ('method_name', 'num_matches', 'num_kp1', 'num_kp2',
+                 'processing_time', 'stage_times', 'pts1', 'pts2',
+                 'img1_path', 'img2_path', 'preprocessor', '_match_image',
+                 'num_inliers', 'inlier_ratio', 'rejected')
 
     def __init__(self,
                  method_name: str,
@@ -9,27 +24,259 @@ class MatchResult:
                  num_kp1: int,
                  num_kp2: int,
                  processing_time: float,
-                 match_image: np.ndarray = None):
+                 match_image: np.ndarray = None,
+                 stage_times: dict = None,
+                 pts1: np.ndarray = None,
+                 pts2: np.ndarray = None,
+                 img1_path: str = None,
+                 img2_path: str = None,
+                 preprocessor=None,
+                 num_inliers: int = None,
+                 inlier_ratio: float = None,
+                 rejected: str = None):
         self.method_name = method_name
         self.num_matches = num_matches
         self.num_kp1 = num_kp1
         self.num_kp2 = num_kp2
         self.processing_time = processing_time
-        self.match_image = match_image
+        # Seconds per pipeline stage (cache, load, extract, match, draw)
+        self.stage_times = stage_times or {}
+        # Matched keypoint coordinates, float32 (num_matches × 2)
+        self.pts1 = pts1
+        self.pts2 = pts2
+        # Needed to render the visualization later
+        self.img1_path = img1_path
+        self.img2_path = img2_path
+        self.preprocessor = preprocessor
+        # Only set when drawing was requested eagerly
+        self._match_image = match_image
+        # RANSAC verification, None when no verifier was used
+        self.num_inliers = num_inliers
+        self.inlier_ratio = inlier_ratio
+        # Quality gate reason when an image was rejected before extraction
+        self.rejected = rejected
+
+    @property
+    def score(self) -> int:
+        """Decision score: verified inliers if available, else good matches"""
+        return self.num_inliers if self.num_inliers is not None else self.num_matches
+
+    @property
+    def match_image(self):
+        """Side-by-side match visualization (rendered on each access if lazy)"""
+        if self._match_image is not None:
+            return self._match_image
+        return self.render()
+
+    def render(self):
+        """Draw matches between the two binarized images, None if nothing to draw"""
+        if self._match_image is not None:
+            return self._match_image
+        if self.num_matches == 0 or self.pts1 is None or self.img1_path is None:
+            return None
+
+        preprocessor = self.preprocessor or ImagePreprocessor()
+        return draw_match_image(preprocessor.load(self.img1_path), self.pts1,
+                                preprocessor.load(self.img2_path), self.pts2)
 
     def __str__(self) -> str:
+        if self.rejected is not None:
+            return (
+                f"{self.method_name}:\n"
+                f"  Rejected: {self.rejected}\n"
+                f"  Time: {self.processing_time:.4f}s"
+                f"{format_stage_times(self.stage_times)}"
+            )
         return (
             f"{self.method_name}:\n"
             f"  Keypoints: {self.num_kp1} vs {self.num_kp2}\n"
             f"  Good Matches: {self.num_matches}\n"
+            f"{self._format_inliers()}"
             f"  Time: {self.processing_time:.4f}s"
+            f"{format_stage_times(self.stage_times)}"
         )
 
+    def _format_inliers(self) -> str:
+        if self.num_inliers is None:
+            return ""
+        return f"  Inliers: {self.num_inliers} ({self.inlier_ratio:.0%})\n"
+
     def get_summary(self) -> dict:
-        return {
+        summary = {
             'method': self.method_name,
             'matches': self.num_matches,
             'keypoints_img1': self.num_kp1,
             'keypoints_img2': self.num_kp2,
             'time_seconds': self.processing_time
-        }
\ No newline at end of file
+        }
+        if self.num_inliers is not None:
+            summary['inliers'] = self.num_inliers
+            summary['inlier_ratio'] = self.inlier_ratio
+        if self.rejected is not None:
+            summary['rejected'] = self.rejected
+        # Flat time_<stage> columns, easy to aggregate
+        for name, seconds in self.stage_times.items():
+            summary[f"time_{name}"] = seconds
+        return summary
+
+
+def draw_match_image(loaded1: tuple, pts1: np.ndarray,
+                     loaded2: tuple, pts2: np.ndarray) -> np.ndarray:
+    """
+    Side-by-side image with lines connecting pts1[i] ↔ pts2[i]
+    loaded: (binary image, scale) from ImagePreprocessor.load(),
+    points are full resolution and get scaled to the working image
+    """
+    (img1, scale1), (img2, scale2) = loaded1, loaded2
+
+    # Rebuild only the matched keypoints, match i connects kp1[i] ↔ kp2[i]
+    kp1 = cv2.KeyPoint.convert(pts1 * scale1)
+    kp2 = cv2.KeyPoint.convert(pts2 * scale2)
+    matches = [cv2.DMatch(i, i, 0.0) for i in range(len(kp1))]
+
+    return cv2.drawMatches(
+        img1, kp1, img2, kp2, matches, None,
+        flags=cv2.DrawMatchesFlags_NOT_DRAW_SINGLE_POINTS
+    )
+
+
+def compose_figure(results: list) -> np.ndarray:
+    """
+    Match images of several results stacked vertically, each under a title bar
+    OpenCV only, so saving a figure never needs matplotlib
+    """
+    panels = []
+    for result in results:
+        image = result.render()
+        if image is None:
+            continue
+        title = np.full((40, image.shape[1], 3), 255, dtype=np.uint8)
+        cv2.putText(title, f"{result.method_name}: {result.num_matches} matches "
+                           f"in {result.processing_time:.3f}s",
+                    (10, 28), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 0), 2, cv2.LINE_AA)
+        panels.extend((title, image))
+
+    if not panels:
+        return None
+
+    # Pad every panel to the widest one before stacking
+    width = max(panel.shape[1] for panel in panels)
+    panels = [cv2.copyMakeBorder(panel, 0, 0, 0, width - panel.shape[1],
+                                 cv2.BORDER_CONSTANT, value=(255, 255, 255))
+              for panel in panels]
+    return np.vstack(panels)
+
+
+def save_image(path, image: np.ndarray):
+    """Encode with cv2.imencode (format from the extension) and write the bytes"""
+    path = Path(path)
+    ok, buffer = cv2.imencode(path.suffix or '.png', image)
+    if not ok:
+        raise ValueError(f"Cannot encode image as {path.suffix}")
+    # imencode + write_bytes also handles non-ASCII paths, unlike imwrite
+    path.write_bytes(buffer.tobytes())
+
+
+def format_stage_times(stage_times: dict) -> str:
+    """One indented line listing stage durations in milliseconds"""
+    if not stage_times:
+        return ""
+    stages = ", ".join(f"{name} {seconds * 1000:.1f}ms"
+                       for name, seconds in stage_times.items())
+    return f"\n  Stages: {stages}"
+
+
+class Candidate:
+    """One gallery print returned by an identification search"""
+
+    def __init__(self, print_id: str, num_matches: int):
+        self.print_id = print_id
+        self.num_matches = num_matches
+
+    def __repr__(self) -> str:
+        return f"Candidate({self.print_id!r}, matches={self.num_matches})"
+
+
+class IdentificationResult:
+    """Top-k candidates for one probe searched against a gallery"""
+
+    def __init__(self,
+                 method_name: str,
+                 candidates: list,
+                 num_kp_probe: int,
+                 gallery_size: int,
+                 processing_time: float,
+                 stage_times: dict = None,
+                 missing_shards: list = None):
+        self.method_name = method_name
+        self.candidates = candidates
+        self.num_kp_probe = num_kp_probe
+        self.gallery_size = gallery_size
+        self.processing_time = processing_time
+        self.stage_times = stage_times or {}
+        # Shards that did not answer a scatter-gather search in time
+        self.missing_shards = missing_shards or []
+
+    @property
+    def best(self):
+        return self.candidates[0] if self.candidates else None
+
+    @property
+    def partial(self) -> bool:
+        return bool(self.missing_shards)
+
+    def __str__(self) -> str:
+        lines = [
+            f"{self.method_name} identification:",
+            f"  Probe keypoints: {self.num_kp_probe}",
+            f"  Gallery size: {self.gallery_size}",
+            f"  Time: {self.processing_time:.4f}s{format_stage_times(self.stage_times)}",
+        ]
+        if self.partial:
+            lines.append(f"  Partial result, missing shards: {', '.join(self.missing_shards)}")
+        for rank, candidate in enumerate(self.candidates, start=1):
+            lines.append(f"  #{rank} {candidate.print_id}: "
+                         f"{candidate.num_matches} matches")
+        return "\n".join(lines)
+
+    def get_summary(self) -> dict:
+        summary = {
+            'method': self.method_name,
+            'keypoints_probe': self.num_kp_probe,
+            'gallery_size': self.gallery_size,
+            'candidates': [(c.print_id, c.num_matches) for c in self.candidates],
+            'time_seconds': self.processing_time
+        }
+        if self.partial:
+            summary['missing_shards'] = self.missing_shards
+        for name, seconds in self.stage_times.items():
+            summary[f"time_{name}"] = seconds
+        return summary
+
+
+class CascadeResult(IdentificationResult):
+    """Identification result with per-stage candidate and timing statistics"""
+
+    def __init__(self, *args, stage_stats: list = None,
+                 time_saved: float = 0.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        # One dict per cascade stage: name, candidates_in, kept, dropped, time
+        self.stage_stats = stage_stats or []
+        # Refine time avoided for dropped candidates minus the screen cost
+        # (seconds), negative when screening did not pay for itself
+        self.time_saved = time_saved
+
+    def __str__(self) -> str:
+        lines = [super().__str__(), "  Cascade:"]
+        for stats in self.stage_stats:
+            lines.append(f"    {stats['name']}: {stats['candidates_in']} in, "
+                         f"{stats['dropped']} dropped, {stats['kept']} kept "
+                         f"({stats['time'] * 1000:.1f}ms)")
+        lines.append(f"    Estimated net time saved: {self.time_saved:.4f}s")
+        return "\n".join(lines)
+
+    def get_summary(self) -> dict:
+        summary = super().get_summary()
+        summary['cascade'] = self.stage_stats
+        summary['time_saved'] = self.time_saved
+        return summary
@@ -0,0 +1,433 @@
+import os
+import sys
+import json
+import time
+import secrets
+import argparse
+import threading
+import multiprocessing
+from pathlib import Path
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client, wait
+from gallery import Gallery
+from image_matcher import ImageMatcher
+from results import Candidate, IdentificationResult
+from shard import ShardGallery, write_shard
+from service import METHODS
+from timing import new_stage_times, stage
+
+# Connections are pickle based: whoever holds the key can run code in the
+# worker. There is no built-in default, keys come from FP_SCATTER_AUTHKEY
+# or are generated per session
+AUTHKEY = os.environ.get('FP_SCATTER_AUTHKEY', '').encode() or None
+
+
+def partition_gallery(gallery: Gallery, num_shards: int, directory: str,
+                      prefix: str = "shard") -> list:
+    """
+    Split a gallery round-robin into num_shards shard files
+    Returns the shard paths, one per worker
+    """
+    if num_shards < 1:
+        raise ValueError("num_shards must be at least 1")
+    parts = [Gallery(gallery.extractor, gallery.matcher, knn=gallery.knn)
+             for _ in range(num_shards)]
+    for position, print_id in enumerate(gallery.print_ids):
+        parts[position % num_shards].add_stored(print_id, *gallery.get_features(print_id))
+
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i, part in enumerate(parts):
+        path = directory / f"{prefix}_{i:03d}.fpgs"
+        write_shard(path, part)
+        paths.append(str(path))
+    return paths
+
+
+def serve_worker(shard_path: str, method: str = 'ORB+BF', nfeatures: int = 1000,
+                 address=("127.0.0.1", 0), authkey: bytes = AUTHKEY, ready=None):
+    """
+    Serve searches over one shard until the process is stopped
+
+    Requests are ('search', request_id, descriptor_sets, top_k), answered
+    with ('ok', request_id, rankings) or ('error', request_id, message).
+    Every connection first receives a hello with the shard size and method.
+    ready receives ('ok', address) once listening, or ('error', message)
+    when the shard, method or address cannot be served.
+    """
+    try:
+        _check_authkey(authkey)
+        if method not in METHODS:
+            raise ValueError(f"Unknown method: {method}")
+        extractor_cls, matcher_cls = METHODS[method]
+        gallery = ShardGallery(shard_path, extractor_cls(nfeatures=nfeatures),
+                               matcher_cls(ratio_threshold=0.7))
+        gallery._build_index()
+        listener = Listener(address, authkey=authkey)
+    except Exception as e:
+        if ready is None:
+            raise
+        # The parent reports the cause instead of a bare exit code
+        ready.send(('error', f"{type(e).__name__}: {e}"))
+        ready.close()
+        return
+    # One search at a time, OpenCV indexes are not shared between threads
+    search_lock = threading.Lock()
+
+    def handle(conn):
+        with conn:
+            conn.send({'prints': len(gallery), 'method': method, 'shard': shard_path})
+            while True:
+                try:
+                    op, request_id, descriptor_sets, top_k = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    if op != 'search':
+                        raise ValueError(f"Unknown op: {op}")
+                    with search_lock:
+                        rankings = gallery.search_many(descriptor_sets, top_k)
+                    reply = ('ok', request_id,
+                             [[(c.print_id, c.num_matches) for c in candidates]
+                              for candidates in rankings])
+                except (ValueError, KeyError) as e:
+                    reply = ('error', request_id, str(e))
+                try:
+                    conn.send(reply)
+                except OSError:
+                    return
+
+    with listener:
+        if ready is not None:
+            # Port 0 picks a free port, the parent learns it here
+            ready.send(('ok', listener.address))
+            ready.close()
+        while True:
+            try:
+                conn = listener.accept()
+            except (AuthenticationError, EOFError, OSError):
+                # Wrong key or dropped handshake, keep serving the others
+                continue
+            threading.Thread(target=handle, args=(conn,), daemon=True).start()
+
+
+def start_workers(shard_paths: list, method: str = 'ORB+BF', nfeatures: int = 1000,
+                  authkey: bytes = AUTHKEY) -> list:
+    """
+    Start one local worker process per shard, returns [(process, address)]
+    Coordinators must connect with the same authkey
+    """
+    _check_authkey(authkey)
+    # Spawned, not forked: the parent may already run OpenCV and threads
+    context = multiprocessing.get_context('spawn')
+    workers = []
+    for shard_path in shard_paths:
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=serve_worker, daemon=True,
+                                  args=(str(shard_path), method, nfeatures,
+                                        ("127.0.0.1", 0), authkey, sender))
+        process.start()
+        sender.close()
+        workers.append((process, receiver, shard_path))
+
+    started = []
+    for process, receiver, shard_path in workers:
+        try:
+            status, value = receiver.recv()
+        except EOFError:
+            process.join(1.0)
+            status, value = 'error', f"exited with code {process.exitcode}"
+        if status != 'ok':
+            for other, _, _ in workers:
+                other.terminate()
+            raise ValueError(f"Worker for {shard_path} failed to start: {value}")
+        started.append((process, value))
+    return started
+
+
+class GatherResult:
+    """Merged rankings of one scatter-gather search"""
+
+    def __init__(self, rankings: list, answered: list, missing: list, errors: dict):
+        self.rankings = rankings
+        self.answered = answered
+        self.missing = missing
+        self.errors = errors
+
+    @property
+    def partial(self) -> bool:
+        return bool(self.missing)
+
+
+class ShardedGallery:
+    """
+    Coordinator for a gallery partitioned across worker processes
+
+    The probe is extracted once here; its descriptors are sent to every
+    shard worker at the same time, each worker searches its own partition
+    (memory-mapped shard, own process and core) and returns its top-k.
+    The coordinator merges the candidate lists by vote count.
+
+    Workers that do not answer before the deadline, fail or are down are
+    reported as missing and the result is built from the shards that did
+    answer. Late answers are discarded on the next search. Votes of exact
+    per-print matchers (POPCOUNT) do not depend on the partitioning; knn
+    voting matchers rank within each shard's own neighbours.
+    """
+
+    def __init__(self, addresses: list, extractor, matcher, timeout: float = 1.0,
+                 authkey: bytes = AUTHKEY, cache=None, preprocessor=None):
+        self.image_matcher = ImageMatcher(extractor, matcher, cache=cache,
+                                          preprocessor=preprocessor)
+        self.extractor = extractor
+        self.matcher = matcher
+        self.addresses = [tuple(address) for address in addresses]
+        self.timeout = timeout
+        _check_authkey(authkey)
+        self.authkey = authkey
+        self.processes = []
+
+        self._connections = [None] * len(self.addresses)
+        self._sizes = [0] * len(self.addresses)
+        self._next_id = 0
+        for shard in range(len(self.addresses)):
+            self._connect(shard)
+
+    @classmethod
+    def local(cls, shard_paths: list, method: str = 'ORB+BF', nfeatures: int = 1000,
+              timeout: float = 1.0, **kwargs):
+        """Start one worker process per shard file and coordinate them"""
+        # Fresh random key per session unless the caller shares one
+        authkey = kwargs.pop('authkey', None) or os.urandom(32)
+        workers = start_workers(shard_paths, method, nfeatures, authkey)
+        extractor_cls, matcher_cls = METHODS[method]
+        gallery = cls([address for _, address in workers], extractor_cls(nfeatures=nfeatures),
+                      matcher_cls(ratio_threshold=0.7), timeout=timeout,
+                      authkey=authkey, **kwargs)
+        gallery.processes = [process for process, _ in workers]
+        return gallery
+
+    def __len__(self) -> int:
+        """Prints on the shards currently connected"""
+        return sum(size for size, conn in zip(self._sizes, self._connections) if conn)
+
+    def identify(self, probe_path: str, top_k: int = 5,
+                 timeout: float = None) -> IdentificationResult:
+        """Return the top_k prints over every shard that answered in time"""
+        start_time = time.perf_counter()
+        stage_times = new_stage_times()
+
+        kp, des = self.image_matcher.extract_features(probe_path, stage_times)
+        with stage(stage_times, 'match'):
+            gathered = self.gather([des], top_k, timeout)
+
+        return IdentificationResult(
+            method_name=f"{self.extractor.name}+{self.matcher.name}",
+            candidates=gathered.rankings[0],
+            num_kp_probe=len(kp) if kp else 0,
+            gallery_size=sum(self._sizes[shard] for shard in gathered.answered),
+            processing_time=time.perf_counter() - start_time,
+            stage_times=stage_times,
+            missing_shards=[self._name(shard) for shard in gathered.missing]
+        )
+
+    def search(self, descriptors, top_k: int = 5) -> list:
+        return self.gather([descriptors], top_k).rankings[0]
+
+    def search_many(self, descriptor_sets: list, top_k: int = 5) -> list:
+        return self.gather(descriptor_sets, top_k).rankings
+
+    def gather(self, descriptor_sets: list, top_k: int = 5,
+               timeout: float = None) -> GatherResult:
+        """Scatter the probes to every shard, merge what arrives before the deadline"""
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        self._next_id += 1
+        request_id = self._next_id
+
+        # Scatter: every shard gets the request before any answer is read
+        pending, errors = {}, {}
+        for shard in range(len(self.addresses)):
+            conn = self._connections[shard] or self._connect(shard)
+            if conn is None:
+                errors[shard] = "not connected"
+                continue
+            try:
+                conn.send(('search', request_id, descriptor_sets, top_k))
+                pending[conn] = shard
+            except OSError as e:
+                self._drop(shard)
+                errors[shard] = str(e)
+
+        # Gather until every shard answered or the deadline passed
+        answers = {}
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            for conn in wait(list(pending), remaining):
+                shard = pending[conn]
+                try:
+                    status, reply_id, payload = conn.recv()
+                except (EOFError, OSError) as e:
+                    del pending[conn]
+                    self._drop(shard)
+                    errors[shard] = str(e) or "connection closed"
+                    continue
+                if reply_id != request_id:
+                    # Late answer to an earlier request that missed its deadline
+                    continue
+                del pending[conn]
+                if status == 'ok':
+                    answers[shard] = payload
+                else:
+                    errors[shard] = payload
+
+        answered = sorted(answers)
+        missing = sorted(set(range(len(self.addresses))) - set(answers))
+        for shard in pending.values():
+            errors.setdefault(shard, "deadline exceeded")
+
+        rankings = []
+        for i in range(len(descriptor_sets)):
+            # Stable sort: ties keep shard order, then each shard's own ranking
+            merged = [candidate for shard in answered for candidate in answers[shard][i]]
+            merged.sort(key=lambda candidate: -candidate[1])
+            rankings.append([Candidate(print_id, votes) for print_id, votes in merged[:top_k]])
+        return GatherResult(rankings, answered, missing,
+                            {self._name(shard): error for shard, error in errors.items()})
+
+    def close(self):
+        """Close connections and stop workers started by local()"""
+        for shard in range(len(self.addresses)):
+            self._drop(shard)
+        for process in self.processes:
+            process.terminate()
+            process.join()
+        self.processes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _connect(self, shard: int):
+        """Open (or reopen) the connection to one worker, None when it is down"""
+        try:
+            conn = Client(self.addresses[shard], authkey=self.authkey)
+            hello = conn.recv()
+        except (OSError, EOFError):
+            return None
+        except AuthenticationError:
+            raise ValueError(f"Worker {self._name(shard)} rejected the authkey")
+        if hello['method'] != f"{self.extractor.name}+{self.matcher.name}":
+            conn.close()
+            raise ValueError(f"Worker {self._name(shard)} serves {hello['method']}, "
+                             f"not {self.extractor.name}+{self.matcher.name}")
+        self._connections[shard] = conn
+        self._sizes[shard] = hello['prints']
+        return conn
+
+    def _drop(self, shard: int):
+        conn, self._connections[shard] = self._connections[shard], None
+        if conn is not None:
+            conn.close()
+
+    def _name(self, shard: int) -> str:
+        host, port = self.addresses[shard]
+        return f"{host}:{port}"
+
+
+def _address(value: str) -> tuple:
+    host, _, port = value.rpartition(':')
+    return host or "127.0.0.1", int(port)
+
+
+def _check_authkey(authkey: bytes):
+    if not authkey:
+        raise ValueError("No scatter authkey: set FP_SCATTER_AUTHKEY or pass authkey")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sharded scatter-gather identification")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    partition = commands.add_parser('partition', help="split a gallery shard into N shards")
+    partition.add_argument('shard')
+    partition.add_argument('output_dir')
+    partition.add_argument('--shards', type=int, default=os.cpu_count() or 1)
+    partition.add_argument('--method', choices=list(METHODS), default='ORB+BF')
+
+    worker = commands.add_parser('worker', help="serve one shard on a local socket")
+    worker.add_argument('shard')
+    worker.add_argument('--host', default="127.0.0.1")
+    worker.add_argument('--port', type=int, required=True)
+    worker.add_argument('--method', choices=list(METHODS), default='ORB+BF')
+    worker.add_argument('--nfeatures', type=int, default=1000)
+
+    identify = commands.add_parser('identify', help="search every shard for a probe")
+    identify.add_argument('probe')
+    targets = identify.add_mutually_exclusive_group(required=True)
+    targets.add_argument('--shards', nargs='+', help="start one local worker per shard file")
+    targets.add_argument('--workers', nargs='+',
+                         help="running workers as host:port (needs FP_SCATTER_AUTHKEY)")
+    identify.add_argument('--method', choices=list(METHODS), default='ORB+BF')
+    identify.add_argument('--nfeatures', type=int, default=1000)
+    identify.add_argument('--top-k', type=int, default=5)
+    identify.add_argument('--timeout', type=float, default=1.0,
+                          help="seconds to wait for shard answers")
+    identify.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    extractor_cls, matcher_cls = METHODS[args.method]
+
+    if args.command == 'partition':
+        gallery = ShardGallery(args.shard, extractor_cls(), matcher_cls())
+        paths = partition_gallery(gallery, args.shards, args.output_dir)
+        print("\n".join(paths))
+        return 0
+
+    if args.command == 'worker':
+        authkey = AUTHKEY
+        if authkey is None:
+            # Coordinators pass this key back through FP_SCATTER_AUTHKEY
+            authkey = secrets.token_hex(16).encode()
+            print(f"FP_SCATTER_AUTHKEY={authkey.decode()}", file=sys.stderr)
+        print(f"Serving {args.shard} on {args.host}:{args.port}")
+        try:
+            serve_worker(args.shard, args.method, args.nfeatures, (args.host, args.port),
+                         authkey)
+        except ValueError as e:
+            print(f"ERROR: {e}", file=sys.stderr)
+            return 2
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    if not args.shards and AUTHKEY is None:
+        print("ERROR: set FP_SCATTER_AUTHKEY to the key the workers print", file=sys.stderr)
+        return 2
+    try:
+        if args.shards:
+            gallery = ShardedGallery.local(args.shards, args.method, args.nfeatures,
+                                           args.timeout)
+        else:
+            gallery = ShardedGallery([_address(w) for w in args.workers],
+                                     extractor_cls(nfeatures=args.nfeatures),
+                                     matcher_cls(ratio_threshold=0.7), timeout=args.timeout)
+    except ValueError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 2
+    with gallery:
+        try:
+            result = gallery.identify(args.probe, args.top_k)
+        except ValueError as e:
+            print(f"ERROR: {e}", file=sys.stderr)
+            return 2
+    print(json.dumps(result.get_summary(), indent=2) if args.json else result)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
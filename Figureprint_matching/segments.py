@@ -0,0 +1,346 @@
+import time
+import threading
+import numpy as np
+from gallery import Gallery, count_votes
+from results import Candidate, IdentificationResult
+from timing import new_stage_times, stage
+
+
+class SegmentedGallery:
+    """
+    Gallery that accepts enrollments and deletions while it is searched
+
+    Prints live in two segments: the main gallery, indexed once, and a small
+    delta gallery holding recent enrollments. Deleting a main print only
+    records a tombstone. Every search queries both segments and merges their
+    votes without the tombstoned prints, so enroll and delete never touch
+    the main index and cost milliseconds whatever the gallery size.
+
+    Compaction rebuilds the main gallery from its live prints plus the delta
+    on a background thread and swaps it in when ready. It starts on its own
+    once the delta or the tombstones reach max_delta prints. With
+    compact_path the rebuilt main gallery is written as a shard there and
+    served memory-mapped.
+    """
+
+    # Most extra knn columns fetched to look past tombstoned neighbours
+    MAX_TOMBSTONE_COLUMNS = 32
+
+    def __init__(self, main: Gallery, max_delta: int = 256, compact_path: str = None):
+        if max_delta < 1:
+            raise ValueError("max_delta must be at least 1")
+        self.main = main
+        self.extractor = main.extractor
+        self.matcher = main.matcher
+        self.image_matcher = main.image_matcher
+        self.knn = main.knn
+        self.max_delta = max_delta
+        self.compact_path = compact_path
+
+        self.delta = self._new_gallery()
+        # Tombstoned positions of the main gallery
+        self._dead = set()
+
+        self._lock = threading.RLock()
+        self._compaction = None
+        # Ids deleted while a compaction runs, replayed on its result
+        self._pending_deletes = []
+        self.compactions = 0
+
+        # Main index is built up front, searches only read it
+        self._ensure_index(self.main)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self.main) - len(self._dead) + len(self.delta)
+
+    def enroll(self, print_id: str, image_path: str) -> int:
+        """Extract and store features for one print, returns keypoint count"""
+        if self._is_live(print_id):
+            raise ValueError(f"Print already enrolled: {print_id}")
+
+        # Extraction runs outside the lock, searches are not held up
+        kp, des = self.image_matcher.extract_features(image_path)
+        self.add_features(print_id, kp, des)
+        return len(kp) if kp else 0
+
+    def enroll_many(self, items, workers: int = 2, queue_size: int = 8) -> int:
+        """Enroll an iterable of (print_id, image_path) pairs into the delta"""
+        items = list(items)
+        seen = set()
+        for print_id, _ in items:
+            if print_id in seen or self._is_live(print_id):
+                raise ValueError(f"Print already enrolled: {print_id}")
+            seen.add(print_id)
+
+        features = self.image_matcher.extract_many(
+            [image_path for _, image_path in items], workers, queue_size)
+        for (print_id, _), (kp, des) in zip(items, features):
+            self.add_features(print_id, kp, des)
+        return len(items)
+
+    def add_features(self, print_id: str, keypoints, descriptors):
+        """Store already extracted features in the delta segment"""
+        with self._lock:
+            if self._is_live(print_id):
+                raise ValueError(f"Print already enrolled: {print_id}")
+            self.delta.add_features(print_id, keypoints, descriptors)
+            self._maybe_compact()
+
+    def delete(self, print_id: str):
+        """Remove one print: dropped from the delta or tombstoned in main"""
+        with self._lock:
+            if self.delta.position(print_id) >= 0:
+                self.delta.remove(print_id)
+            else:
+                position = self.main.position(print_id)
+                if position < 0 or position in self._dead:
+                    raise KeyError(f"Print not enrolled: {print_id}")
+                self._dead.add(position)
+
+            if self._compaction is not None:
+                self._pending_deletes.append(print_id)
+            self._maybe_compact()
+
+    def get_features(self, print_id: str) -> tuple:
+        """Stored (keypoint coordinates, descriptors) of one live print"""
+        with self._lock:
+            if self.delta.position(print_id) >= 0:
+                return self.delta.get_features(print_id)
+            position = self.main.position(print_id)
+            if position < 0 or position in self._dead:
+                raise KeyError(f"Print not enrolled: {print_id}")
+            return self.main.get_features(print_id)
+
+    def identify(self, probe_path: str, top_k: int = 5) -> IdentificationResult:
+        """Return the top_k live prints ranked by good matches"""
+        start_time = time.perf_counter()
+        stage_times = new_stage_times()
+
+        kp, des = self.image_matcher.extract_features(probe_path, stage_times)
+        with stage(stage_times, 'match'):
+            candidates = self.search(des, top_k)
+
+        return IdentificationResult(
+            method_name=f"{self.extractor.name}+{self.matcher.name}",
+            candidates=candidates,
+            num_kp_probe=len(kp) if kp else 0,
+            gallery_size=len(self),
+            processing_time=time.perf_counter() - start_time,
+            stage_times=stage_times
+        )
+
+    def search(self, descriptors: np.ndarray, top_k: int = 5) -> list:
+        """Rank live prints of both segments for probe descriptors"""
+        return self.search_many([descriptors], top_k)[0]
+
+    def search_many(self, descriptor_sets: list, top_k: int = 5) -> list:
+        """Rank live prints for several probes, one query per segment"""
+        rankings = [[] for _ in descriptor_sets]
+        probes = [i for i, des in enumerate(descriptor_sets)
+                  if des is not None and len(des) > 0]
+        if not probes:
+            return rankings
+        exact = hasattr(self.matcher, 'create_gallery_index')
+        stacked = None if exact else np.concatenate([descriptor_sets[i] for i in probes])
+
+        with self._lock:
+            main, dead = self.main, np.array(sorted(self._dead), dtype=np.int64)
+            delta_ids = list(self.delta.print_ids)
+            # Delta is small, its index is rebuilt here when it changed
+            if exact:
+                delta_result = self.delta.scores_many([descriptor_sets[i] for i in probes])
+            elif delta_ids:
+                delta_result = self.delta.neighbours(stacked)
+            else:
+                delta_result = None
+
+        # Main is never modified in place, it is searched without the lock
+        num_main = len(main)
+        if exact:
+            # Per-print scores do not depend on other prints, segments just concatenate
+            main_scores = main.scores_many([descriptor_sets[i] for i in probes])
+            all_votes = [self._concat_scores(votes, extra, num_main, len(delta_ids))
+                         for votes, extra in zip(main_scores, delta_result)]
+        else:
+            all_votes = self._merged_votes(main, dead, delta_result, stacked,
+                                           [len(descriptor_sets[i]) for i in probes],
+                                           num_main + len(delta_ids))
+
+        for i, votes in zip(probes, all_votes):
+            if votes is None:
+                continue
+            votes = votes.astype(np.int64)
+            votes[dead] = -1
+            # Ties keep enrollment order: main prints first, then the delta
+            order = np.argsort(-votes, kind='stable')[:top_k]
+            rankings[i] = [Candidate(main.print_ids[j] if j < num_main
+                                     else delta_ids[j - num_main], int(votes[j]))
+                           for j in order if votes[j] >= 0]
+        return rankings
+
+    def compact(self, wait: bool = True):
+        """
+        Rebuild the main gallery from its live prints plus the delta
+        Enroll, delete and search keep working on the old segments meanwhile
+        With wait, a compaction already running is joined first and the
+        changes made after its snapshot are compacted by a new one
+        """
+        joined = False
+        while True:
+            with self._lock:
+                started = self._compaction is None
+                if started:
+                    if joined and not len(self.delta) and not self._dead:
+                        return
+                    snapshot = (self.main, set(self._dead),
+                                [(print_id, *self.delta.get_features(print_id))
+                                 for print_id in self.delta.print_ids])
+                    self._pending_deletes = []
+                    self._compaction = threading.Thread(target=self._compact,
+                                                        args=snapshot, daemon=True)
+                    self._compaction.start()
+                thread = self._compaction
+            if not wait:
+                return
+            thread.join()
+            if started:
+                return
+            joined = True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'main': len(self.main), 'delta': len(self.delta),
+                    'tombstones': len(self._dead), 'compactions': self.compactions,
+                    'compacting': self._compaction is not None}
+
+    def _compact(self, main, dead: set, delta_items: list):
+        try:
+            rebuilt = self._new_gallery()
+            for position, print_id in enumerate(main.print_ids):
+                if position not in dead:
+                    rebuilt.add_stored(print_id, *main.get_features(print_id))
+            for print_id, coords, descriptors in delta_items:
+                rebuilt.add_stored(print_id, coords, descriptors)
+
+            if self.compact_path:
+                # Imported here, shard.py is only needed for on-disk compaction
+                from shard import write_shard, ShardGallery
+                write_shard(self.compact_path, rebuilt)
+                rebuilt = ShardGallery(self.compact_path, self.extractor, self.matcher,
+                                       knn=self.knn, cache=self.image_matcher.cache,
+                                       preprocessor=self.image_matcher.preprocessor)
+            self._ensure_index(rebuilt)
+
+            with self._lock:
+                self._swap(rebuilt, delta_items)
+        finally:
+            with self._lock:
+                self._compaction = None
+                self._pending_deletes = []
+
+    def _swap(self, rebuilt: Gallery, delta_items: list):
+        """Install the rebuilt main, keep what changed during compaction"""
+        # Delta entries enrolled after the snapshot stay in the new delta
+        merged = {print_id: descriptors for print_id, _, descriptors in delta_items}
+        delta = self._new_gallery()
+        for print_id in self.delta.print_ids:
+            coords, descriptors = self.delta.get_features(print_id)
+            if merged.get(print_id) is not descriptors:
+                delta.add_stored(print_id, coords, descriptors)
+
+        # Deletions during compaction become tombstones in the new main
+        dead = set()
+        for print_id in self._pending_deletes:
+            position = rebuilt.position(print_id)
+            if position >= 0:
+                dead.add(position)
+
+        self.main, self.delta, self._dead = rebuilt, delta, dead
+        self.compactions += 1
+
+    def _maybe_compact(self):
+        if self._compaction is None and (len(self.delta) >= self.max_delta
+                                         or len(self._dead) >= self.max_delta):
+            self.compact(wait=False)
+
+    def _is_live(self, print_id: str) -> bool:
+        with self._lock:
+            if self.delta.position(print_id) >= 0:
+                return True
+            position = self.main.position(print_id)
+            return position >= 0 and position not in self._dead
+
+    def _merged_votes(self, main: Gallery, dead: np.ndarray, delta_result,
+                      stacked: np.ndarray, counts: list, num_prints: int) -> list:
+        """
+        Merge both segments' knn lists by distance before the ratio test
+        The vote then sees the same neighbours as one index over all prints
+        """
+        owners = distances = None
+        if len(main):
+            owners, distances = self._live_neighbours(main, dead, stacked)
+
+        if delta_result is not None:
+            delta_owners, delta_distances = delta_result
+            delta_owners = np.where(delta_owners >= 0, delta_owners + len(main), -1)
+            if owners is None:
+                owners, distances = delta_owners, delta_distances
+            else:
+                owners = np.hstack([owners, delta_owners])
+                distances = np.hstack([distances, delta_distances])
+                nearest = np.argsort(distances, axis=1, kind='stable')[:, :self.knn]
+                owners = np.take_along_axis(owners, nearest, axis=1)
+                distances = np.take_along_axis(distances, nearest, axis=1)
+        # Fewer live descriptors than knn, a single index would not vote either
+        if owners is None or np.isinf(distances[:, -1]).any():
+            return [None for _ in counts]
+
+        bounds = np.cumsum([0] + counts)
+        return [count_votes(owners[start:stop], distances[start:stop],
+                            self.matcher.ratio_threshold, num_prints)
+                for start, stop in zip(bounds[:-1], bounds[1:])]
+
+    def _live_neighbours(self, main: Gallery, dead: np.ndarray, stacked: np.ndarray) -> tuple:
+        """
+        knn neighbours in main without the tombstoned prints
+
+        Tombstoned prints still sit in the index, so extra columns are fetched
+        and the nearest knn live ones kept. Rows with fewer live columns are
+        padded with owner -1 at the last fetched distance: the next live
+        neighbour is at least that far, so the ratio test stays conservative
+        and never sees an infinite second-neighbour bound.
+        """
+        if not len(dead):
+            return main.neighbours(stacked)
+        extra = min(self.knn * len(dead), self.MAX_TOMBSTONE_COLUMNS)
+        owners, distances = main.neighbours(stacked, self.knn + extra)
+
+        live = (owners >= 0) & ~np.isin(owners, dead)
+        # Live columns first, each group still in distance order
+        order = np.argsort(~live, axis=1, kind='stable')[:, :self.knn]
+        bound = distances[:, -1:]
+        live = np.take_along_axis(live, order, axis=1)
+        owners = np.where(live, np.take_along_axis(owners, order, axis=1), -1)
+        distances = np.where(live, np.take_along_axis(distances, order, axis=1), bound)
+        return owners, distances
+
+    @staticmethod
+    def _concat_scores(main_votes, delta_votes, num_main: int, num_delta: int):
+        if main_votes is None and delta_votes is None:
+            return None
+        if main_votes is None:
+            main_votes = np.zeros(num_main, dtype=np.int64)
+        if delta_votes is None:
+            delta_votes = np.zeros(num_delta, dtype=np.int64)
+        return np.concatenate([main_votes, delta_votes])
+
+    def _new_gallery(self) -> Gallery:
+        return Gallery(self.extractor, self.matcher, knn=self.knn,
+                       cache=self.image_matcher.cache,
+                       preprocessor=self.image_matcher.preprocessor)
+
+    @staticmethod
+    def _ensure_index(gallery: Gallery):
+        if gallery._owners is None and len(gallery):
+            gallery._build_index()
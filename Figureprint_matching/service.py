@@ -0,0 +1,450 @@
+import sys
+import time
+import json
+import socket
+import asyncio
+import argparse
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from extractors import ORBExtractor, SIFTExtractor
+from matchers import BFMatcher, FLANNMatcher, PopcountMatcher
+from minutiae import MinutiaeExtractor, MinutiaeMatcher
+from image_matcher import ImageMatcher
+from gallery import Gallery
+from segments import SegmentedGallery
+from cache import DescriptorCache
+from verification import GeometricVerifier
+from quality import QualityGate
+from batch import IMAGE_EXTENSIONS
+from timing import new_stage_times
+
+METHODS = {
+    'ORB+BF': (ORBExtractor, BFMatcher),
+    'SIFT+FLANN': (SIFTExtractor, FLANNMatcher),
+    'ORB+POPCOUNT': (ORBExtractor, PopcountMatcher),
+    'MINUTIAE+HOUGH': (MinutiaeExtractor, MinutiaeMatcher),
+}
+
+
+class MicroBatcher:
+    """
+    Groups concurrent requests into one handler call
+
+    The first queued request opens a batch; it is closed when max_batch_size
+    requests are collected or max_wait seconds have passed, whichever comes
+    first. So a lone request waits at most max_wait, and under load every
+    handler call serves up to max_batch_size requests.
+
+    handler(items) runs on executor and returns one result (or exception)
+    per item, in order. If the handler itself raises, the items are retried
+    one by one so only the failing requests get the error.
+    """
+
+    def __init__(self, handler, executor, max_batch_size: int = 16,
+                 max_wait: float = 0.005):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.handler = handler
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = None
+        self._task = None
+        # Totals for the stats request
+        self.batches = 0
+        self.items = 0
+
+    async def submit(self, item):
+        """Queue one item and wait for its result"""
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+
+            # Collect more until the batch is full or the wait is over
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            self.batches += 1
+            self.items += len(batch)
+            results = await self._handle([item for item, _ in batch])
+
+            for (_, future), result in zip(batch, results):
+                if future.cancelled():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    async def _handle(self, items: list) -> list:
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self.executor, self.handler, items)
+        except Exception as e:
+            if len(items) == 1:
+                return [e]
+        # One bad item must not fail the whole batch
+        return [(await self._handle([item]))[0] for item in items]
+
+    def stats(self) -> dict:
+        return {'batches': self.batches, 'requests': self.items,
+                'mean_batch_size': self.items / self.batches if self.batches else 0.0}
+
+
+class MatchingService:
+    """
+    Long-running matcher with warm extractors and gallery index
+
+    Requests are JSON lines over TCP: {"id": 1, "op": "verify", ...}
+    answered with {"id": 1, "ok": true, "result": {...}}. Concurrent
+    verify and identify requests are micro-batched: every image in a batch
+    is extracted once and all identify probes share one gallery search.
+
+    Operations:
+      verify   {"img1", "img2"}        → match summary with score
+      identify {"probe", "top_k"}      → ranked candidates
+      enroll   {"print_id", "image"}   → keypoint count
+      delete   {"print_id"}            → removed print id
+      stats    {}                      → batching and gallery counters
+
+    The gallery is served as a SegmentedGallery: enroll and delete only
+    touch a small delta segment and tombstones, compaction into the main
+    index runs in the background.
+    """
+
+    def __init__(self, image_matcher: ImageMatcher, gallery: Gallery = None,
+                 max_batch_size: int = 16, max_wait: float = 0.005,
+                 max_delta: int = 256):
+        self.image_matcher = image_matcher
+        gallery = gallery or Gallery(image_matcher.extractor, image_matcher.matcher,
+                                     cache=image_matcher.cache,
+                                     preprocessor=image_matcher.preprocessor)
+        if not isinstance(gallery, SegmentedGallery):
+            gallery = SegmentedGallery(gallery, max_delta=max_delta)
+        self.gallery = gallery
+
+        # All OpenCV work on one thread, detectors are not shared between threads
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self.verify_batcher = MicroBatcher(self._verify_batch, self._executor,
+                                           max_batch_size, max_wait)
+        self.identify_batcher = MicroBatcher(self._identify_batch, self._executor,
+                                             max_batch_size, max_wait)
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8765):
+        """Accept connections until cancelled"""
+        server = await asyncio.start_server(self._handle_connection, host, port)
+        async with server:
+            await server.serve_forever()
+
+    async def handle_request(self, request: dict) -> dict:
+        """Run one decoded request, every error becomes {"ok": false}"""
+        if not isinstance(request, dict):
+            return {'id': None, 'ok': False, 'error': "Request must be a JSON object"}
+        response = {'id': request.get('id')}
+        try:
+            response['result'] = await self._dispatch(request)
+            response['ok'] = True
+        except (ValueError, KeyError) as e:
+            response['ok'] = False
+            response['error'] = str(e)
+        except Exception as e:
+            # OpenCV and other failures still answer, the client never hangs
+            response['ok'] = False
+            response['error'] = f"{type(e).__name__}: {e}"
+        return response
+
+    async def _dispatch(self, request: dict):
+        op = request.get('op')
+        if op == 'verify':
+            return await self.verify_batcher.submit((request['img1'], request['img2']))
+        if op == 'identify':
+            return await self.identify_batcher.submit((request['probe'],
+                                                       int(request.get('top_k', 5))))
+        if op == 'enroll':
+            loop = asyncio.get_running_loop()
+            num_kp = await loop.run_in_executor(self._executor, self.gallery.enroll,
+                                                request['print_id'], request['image'])
+            return {'print_id': request['print_id'], 'keypoints': num_kp}
+        if op == 'delete':
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self._executor, self.gallery.delete,
+                                       request['print_id'])
+            return {'print_id': request['print_id']}
+        if op == 'stats':
+            return {'gallery_size': len(self.gallery),
+                    'segments': self.gallery.stats(),
+                    'verify': self.verify_batcher.stats(),
+                    'identify': self.identify_batcher.stats()}
+        raise ValueError(f"Unknown op: {op}")
+
+    async def _handle_connection(self, reader, writer):
+        """Requests on one connection may be pipelined, answers carry the id"""
+        write_lock = asyncio.Lock()
+        tasks = set()
+
+        async def respond(line):
+            try:
+                response = await self.handle_request(json.loads(line))
+            except json.JSONDecodeError as e:
+                response = {'id': None, 'ok': False, 'error': f"Invalid JSON: {e}"}
+            async with write_lock:
+                writer.write((json.dumps(response) + "\n").encode())
+                await writer.drain()
+
+        try:
+            while line := await reader.readline():
+                task = asyncio.create_task(respond(line))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def _extract_unique(self, paths, timings: dict = None) -> dict:
+        """
+        Extract every distinct path once, failures are kept as exceptions
+        timings: filled with (stage_times, seconds) per path when given
+        """
+        features = {}
+        for path in dict.fromkeys(paths):
+            stage_times = new_stage_times()
+            start_time = time.perf_counter()
+            try:
+                features[path] = self.image_matcher.extract_features(path, stage_times)
+            except Exception as e:
+                features[path] = e
+            if timings is not None:
+                timings[path] = (stage_times, time.perf_counter() - start_time)
+        return features
+
+    def _verify_batch(self, items: list) -> list:
+        timings = {}
+        features = self._extract_unique((path for pair in items for path in pair), timings)
+
+        results = []
+        for img1_path, img2_path in items:
+            f1, f2 = features[img1_path], features[img2_path]
+            failed = f1 if isinstance(f1, Exception) else f2
+            if isinstance(failed, Exception):
+                results.append(failed)
+                continue
+            # Extraction is shared within the batch, but every pair reports
+            # it like match_images would, so latency matches the CLI
+            stage_times = new_stage_times()
+            extract_time = 0.0
+            for path in (img1_path, img2_path):
+                path_times, seconds = timings[path]
+                for name, value in path_times.items():
+                    stage_times[name] += value
+                extract_time += seconds
+            try:
+                result = self.image_matcher.match_features(f1, f2, img1_path, img2_path,
+                                                           stage_times)
+            except Exception as e:
+                results.append(e)
+                continue
+            result.processing_time += extract_time
+            results.append({**result.get_summary(), 'score': result.score})
+        return results
+
+    def _identify_batch(self, items: list) -> list:
+        features = self._extract_unique(probe for probe, _ in items)
+        probes = list(features)
+
+        # Every probe of the batch in one gallery search
+        top_k = max(k for _, k in items)
+        descriptor_sets = [None if isinstance(features[p], Exception) else features[p][1]
+                           for p in probes]
+        try:
+            rankings = dict(zip(probes, self.gallery.search_many(descriptor_sets, top_k)))
+        except Exception:
+            # Search probe by probe so only the failing ones report the error
+            rankings = {probe: self._search_one(des, top_k)
+                        for probe, des in zip(probes, descriptor_sets)}
+
+        results = []
+        for probe, k in items:
+            failed = features[probe] if isinstance(features[probe], Exception) else rankings[probe]
+            if isinstance(failed, Exception):
+                results.append(failed)
+                continue
+            kp = features[probe][0]
+            results.append({
+                'method': f"{self.gallery.extractor.name}+{self.gallery.matcher.name}",
+                'keypoints_probe': len(kp) if kp else 0,
+                'gallery_size': len(self.gallery),
+                'candidates': [(c.print_id, c.num_matches) for c in rankings[probe][:k]]
+            })
+        return results
+
+    def _search_one(self, descriptors, top_k: int):
+        """Candidates of one probe, or the exception its search raised"""
+        try:
+            return self.gallery.search(descriptors, top_k)
+        except Exception as e:
+            return e
+
+
+class ServiceClient:
+    """Blocking client for MatchingService, one request at a time"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8765, timeout: float = 30.0):
+        self._socket = socket.create_connection((host, port), timeout=timeout)
+        self._reader = self._socket.makefile('r')
+        self._next_id = 0
+
+    def request(self, op: str, **params) -> dict:
+        """Send one request, raise ValueError if the service reports an error"""
+        self._next_id += 1
+        message = {'id': self._next_id, 'op': op, **params}
+        self._socket.sendall((json.dumps(message) + "\n").encode())
+        response = json.loads(self._reader.readline())
+        if not response['ok']:
+            raise ValueError(response['error'])
+        return response['result']
+
+    def verify(self, img1_path: str, img2_path: str) -> dict:
+        # The service resolves paths in its own working directory
+        return self.request('verify', img1=str(Path(img1_path).resolve()),
+                            img2=str(Path(img2_path).resolve()))
+
+    def identify(self, probe_path: str, top_k: int = 5) -> dict:
+        return self.request('identify', probe=str(Path(probe_path).resolve()), top_k=top_k)
+
+    def enroll(self, print_id: str, image_path: str) -> dict:
+        return self.request('enroll', print_id=print_id,
+                            image=str(Path(image_path).resolve()))
+
+    def delete(self, print_id: str) -> dict:
+        return self.request('delete', print_id=print_id)
+
+    def stats(self) -> dict:
+        return self.request('stats')
+
+    def close(self):
+        self._reader.close()
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def build_service(method: str = 'ORB+BF', nfeatures: int = 1000, verify: bool = False,
+                  cache_dir: str = None, max_batch_size: int = 16,
+                  max_wait: float = 0.005, shard_path: str = None,
+                  quality_gate=None) -> MatchingService:
+    extractor_cls, matcher_cls = METHODS[method]
+    image_matcher = ImageMatcher(
+        extractor=extractor_cls(nfeatures=nfeatures),
+        matcher=matcher_cls(ratio_threshold=0.7),
+        cache=DescriptorCache(cache_dir) if cache_dir else None,
+        verifier=GeometricVerifier(model='affine') if verify else None,
+        quality_gate=quality_gate
+    )
+    gallery = None
+    if shard_path:
+        # Imported here, shard.py imports this module for its command line
+        from shard import ShardGallery
+        gallery = ShardGallery(shard_path, image_matcher.extractor, image_matcher.matcher,
+                               cache=image_matcher.cache,
+                               preprocessor=image_matcher.preprocessor)
+    return MatchingService(image_matcher, gallery, max_batch_size=max_batch_size,
+                           max_wait=max_wait)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fingerprint matching service")
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=8765)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve = commands.add_parser('serve', help="run the service")
+    serve.add_argument('--method', choices=list(METHODS), default='ORB+BF')
+    serve.add_argument('--nfeatures', type=int, default=1000)
+    serve.add_argument('--verify', action='store_true',
+                       help="score verify requests by RANSAC inliers")
+    serve.add_argument('--cache-dir', default=None)
+    serve.add_argument('--gallery', default=None,
+                       help="enroll every image in this directory (id = file stem)")
+    serve.add_argument('--shard', default=None,
+                       help="serve identify from this memory-mapped gallery shard")
+    serve.add_argument('--quality-gate', action='store_true',
+                       help="reject poor captures before extraction (default thresholds)")
+    serve.add_argument('--max-batch', type=int, default=16)
+    serve.add_argument('--max-wait-ms', type=float, default=5.0)
+
+    verify = commands.add_parser('verify', help="compare two images")
+    verify.add_argument('img1')
+    verify.add_argument('img2')
+    identify = commands.add_parser('identify', help="search the gallery")
+    identify.add_argument('probe')
+    identify.add_argument('--top-k', type=int, default=5)
+    enroll = commands.add_parser('enroll', help="add one print to the gallery")
+    enroll.add_argument('print_id')
+    enroll.add_argument('image')
+    delete = commands.add_parser('delete', help="remove one print from the gallery")
+    delete.add_argument('print_id')
+    commands.add_parser('stats', help="batching and gallery counters")
+
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        service = build_service(args.method, args.nfeatures, args.verify, args.cache_dir,
+                                args.max_batch, args.max_wait_ms / 1000, args.shard,
+                                QualityGate() if args.quality_gate else None)
+        if args.gallery:
+            images = sorted(p for p in Path(args.gallery).iterdir()
+                            if p.suffix.lower() in IMAGE_EXTENSIONS)
+            service.gallery.enroll_many((p.stem, str(p)) for p in images)
+            # Start serving from one indexed main segment
+            service.gallery.compact()
+            print(f"Enrolled {len(service.gallery)} prints")
+        print(f"Serving {args.method} on {args.host}:{args.port}")
+        try:
+            asyncio.run(service.serve(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    with ServiceClient(args.host, args.port) as client:
+        try:
+            if args.command == 'verify':
+                result = client.verify(args.img1, args.img2)
+            elif args.command == 'identify':
+                result = client.identify(args.probe, args.top_k)
+            elif args.command == 'enroll':
+                result = client.enroll(args.print_id, args.image)
+            elif args.command == 'delete':
+                result = client.delete(args.print_id)
+            else:
+                result = client.stats()
+        except ValueError as e:
+            print(f"ERROR: {e}", file=sys.stderr)
+            return 2
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,285 @@
+import os
+import sys
+import mmap
+import json
+import struct
+import argparse
+import numpy as np
+from pathlib import Path
+from gallery import Gallery
+from matchers import PopcountMatcher, word_major
+
+# File layout: header, config JSON, section table, 64-byte aligned sections
+MAGIC = b"FPGS"
+VERSION = 2
+HEADER = struct.Struct("<4sHHIIQQ")  # magic, version, dtype, cols, config bytes, prints, descriptors
+SECTION = struct.Struct("<QQ")       # offset, nbytes
+SECTIONS = ('offsets', 'owners', 'keypoints', 'descriptors',
+            'id_offsets', 'id_blob', 'id_order', 'words')
+DTYPES = {0: np.uint8, 1: np.float32}
+ALIGNMENT = 64
+
+
+def write_shard(path: str, gallery: Gallery):
+    """
+    Write every enrolled print of gallery to one shard file
+
+    Descriptors are stored in the gallery's storage form (compressed for
+    CompressedMatcher, whose codebook is not part of the shard). POPCOUNT
+    shards also hold them word-major (words section, same size again) so
+    the XOR scan runs on contiguous rows straight from the mapping.
+    """
+    descriptors = [d for d in gallery.descriptors if len(d)]
+    cols = gallery.descriptors[0].shape[1] if gallery.descriptors else 0
+    dtype = descriptors[0].dtype if descriptors else np.dtype(np.uint8)
+    dtype_code = next((code for code, t in DTYPES.items() if np.dtype(t) == dtype), None)
+    if dtype_code is None:
+        raise ValueError(f"Unsupported descriptor dtype: {dtype}")
+
+    counts = np.array([len(d) for d in gallery.descriptors], dtype=np.int64)
+    encoded_ids = [print_id.encode() for print_id in gallery.print_ids]
+
+    arrays = {
+        'offsets': np.concatenate([[0], np.cumsum(counts)]).astype(np.int64),
+        'owners': np.repeat(np.arange(len(counts), dtype=np.int32), counts),
+        'keypoints': (np.concatenate(gallery.keypoints).astype(np.float32)
+                      if gallery.keypoints else np.empty((0, 2), dtype=np.float32)),
+        'descriptors': (np.concatenate(descriptors).astype(dtype) if descriptors
+                        else np.empty((0, cols), dtype=dtype)),
+        'id_offsets': np.concatenate([[0], np.cumsum([len(e) for e in encoded_ids])]
+                                     ).astype(np.int64),
+        'id_blob': np.frombuffer(b"".join(encoded_ids), dtype=np.uint8),
+        # Positions sorted by id, for binary search by print_id
+        'id_order': np.array(sorted(range(len(encoded_ids)), key=encoded_ids.__getitem__),
+                             dtype=np.int64),
+    }
+    arrays['words'] = (word_major(arrays['descriptors'])
+                       if isinstance(gallery.matcher, PopcountMatcher)
+                       else np.empty((0, 0), dtype=np.uint64))
+
+    if len(arrays['keypoints']) != len(arrays['descriptors']):
+        raise ValueError("Every stored descriptor needs its keypoint coordinates")
+
+    config = json.dumps({
+        'extractor': gallery.extractor.name,
+        'nfeatures': gallery.extractor.nfeatures,
+        'matcher': gallery.matcher.name
+    }).encode()
+
+    # Place sections after header, config and section table
+    position = _align(HEADER.size + len(config) + SECTION.size * len(SECTIONS))
+    table = []
+    for name in SECTIONS:
+        nbytes = arrays[name].nbytes
+        table.append((position, nbytes))
+        position = _align(position + nbytes)
+
+    # Write to temp file first so readers never map a partial shard
+    path = Path(path)
+    tmp_path = path.with_suffix(f".tmp{os.getpid()}")
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, dtype_code, cols, len(config),
+                            len(counts), int(counts.sum())))
+        f.write(config)
+        for offset, nbytes in table:
+            f.write(SECTION.pack(offset, nbytes))
+        for name, (offset, _) in zip(SECTIONS, table):
+            f.seek(offset)
+            f.write(np.ascontiguousarray(arrays[name]).tobytes())
+        f.truncate(position)
+    os.replace(tmp_path, path)
+
+
+def _align(position: int) -> int:
+    return -(-position // ALIGNMENT) * ALIGNMENT
+
+
+class ShardIds:
+    """Read-only sequence of print ids decoded on access from the shard"""
+
+    def __init__(self, id_offsets: np.ndarray, id_blob: np.ndarray, id_order: np.ndarray):
+        self._offsets = id_offsets
+        self._blob = id_blob
+        self._order = id_order
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, position: int) -> str:
+        if not -len(self) <= position < len(self):
+            raise IndexError(position)
+        position %= len(self)
+        start, stop = self._offsets[position], self._offsets[position + 1]
+        return self._blob[start:stop].tobytes().decode()
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def position(self, print_id: str) -> int:
+        """Binary search over the sorted id order, -1 if absent"""
+        key = print_id.encode()
+        low, high = 0, len(self._order)
+        while low < high:
+            middle = (low + high) // 2
+            candidate = self[int(self._order[middle])].encode()
+            if candidate < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self._order) and self[int(self._order[low])] == print_id:
+            return int(self._order[low])
+        return -1
+
+
+class ShardGallery(Gallery):
+    """
+    Read-only gallery backed by a memory-mapped shard file
+
+    Opening maps the file and reads only the fixed-size header, so it takes
+    constant time whatever the gallery size. Descriptor, keypoint and owner
+    arrays are zero-copy views of the mapping: every process opening the
+    same shard shares the same physical pages. Exact matchers (BF, POPCOUNT)
+    search the mapped matrix in place; FLANN/LSH build their own index per
+    process.
+    """
+
+    def __init__(self, path: str, extractor, matcher, knn: int = 4, cache=None,
+                 preprocessor=None):
+        super().__init__(extractor, matcher, knn=knn, cache=cache,
+                         preprocessor=preprocessor)
+        self.path = Path(path)
+
+        with open(self.path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, dtype_code, cols, config_size, num_prints, num_descriptors = \
+            HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Not a gallery shard: {self.path}")
+        if version != VERSION:
+            raise ValueError(f"Unsupported shard version {version} (expected {VERSION})")
+
+        self.config = json.loads(self._mmap[HEADER.size:HEADER.size + config_size])
+        if (self.config['extractor'] != extractor.name
+                or self.config['matcher'] != matcher.name):
+            raise ValueError(f"Shard was built with {self.config['extractor']}+"
+                             f"{self.config['matcher']}, not {extractor.name}+{matcher.name}")
+
+        table_start = HEADER.size + config_size
+        sections = {name: SECTION.unpack_from(self._mmap, table_start + i * SECTION.size)
+                    for i, name in enumerate(SECTIONS)}
+
+        def view(name, dtype, shape):
+            offset, nbytes = sections[name]
+            count = nbytes // np.dtype(dtype).itemsize
+            return np.frombuffer(self._mmap, dtype=dtype, count=count,
+                                 offset=offset).reshape(shape)
+
+        self.offsets = view('offsets', np.int64, (num_prints + 1,))
+        self.matrix = view('descriptors', DTYPES[dtype_code], (num_descriptors, cols))
+        self.points = view('keypoints', np.float32, (num_descriptors, 2))
+        self.print_ids = ShardIds(view('id_offsets', np.int64, (num_prints + 1,)),
+                                  view('id_blob', np.uint8, (-1,)),
+                                  view('id_order', np.int64, (num_prints,)))
+        self._shard_owners = view('owners', np.int32, (num_descriptors,))
+        # Word-major copy of the descriptors, POPCOUNT shards only
+        self.words = (view('words', np.uint64, (-1, num_descriptors))
+                      if sections['words'][1] and num_descriptors else None)
+
+        # Per-print lists are never materialized for shards
+        self.descriptors = None
+        self.keypoints = None
+
+    def enroll(self, print_id: str, image_path: str) -> int:
+        raise ValueError("Shard galleries are read-only")
+
+    def enroll_many(self, items, workers: int = 2, queue_size: int = 8) -> int:
+        raise ValueError("Shard galleries are read-only")
+
+    def add_features(self, print_id: str, keypoints, descriptors):
+        raise ValueError("Shard galleries are read-only")
+
+    def add_stored(self, print_id: str, coords: np.ndarray, descriptors: np.ndarray):
+        raise ValueError("Shard galleries are read-only")
+
+    def remove(self, print_id: str):
+        raise ValueError("Shard galleries are read-only")
+
+    def position(self, print_id: str) -> int:
+        return self.print_ids.position(print_id)
+
+    def get_features(self, print_id: str) -> tuple:
+        """Stored (keypoint coordinates, descriptors) of one print, zero-copy"""
+        position = self.print_ids.position(print_id)
+        if position < 0:
+            raise KeyError(print_id)
+        start, stop = self.offsets[position], self.offsets[position + 1]
+        return self.points[start:stop], self.matrix[start:stop]
+
+    def _build_index(self):
+        """Index the mapped matrix in place (owners come from the shard)"""
+        self._owners = self._shard_owners
+        self._index = None
+        if len(self._owners) > 0:
+            if self.words is not None:
+                self._index = self.matcher.create_gallery_index(self.matrix, self.offsets,
+                                                                words=self.words)
+            elif hasattr(self.matcher, 'create_gallery_index'):
+                self._index = self.matcher.create_gallery_index(self.matrix, self.offsets)
+            else:
+                self._index = self.matcher.create_index(self.matrix)
+
+    def close(self):
+        """Drop the index and views, then unmap the file"""
+        self._index = None
+        self._owners = self._shard_owners = None
+        self.offsets = self.matrix = self.points = self.print_ids = self.words = None
+        try:
+            self._mmap.close()
+        except BufferError:
+            # Views returned by get_features() still alive, unmapped when freed
+            pass
+
+
+def main():
+    # Imported here, only the command line needs the method table
+    from service import METHODS
+    from batch import IMAGE_EXTENSIONS
+
+    parser = argparse.ArgumentParser(description="Build or inspect gallery shards")
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help="enroll an image directory into a shard")
+    build.add_argument('images', help="directory of images (print id = file stem)")
+    build.add_argument('output')
+    build.add_argument('--method', choices=list(METHODS), default='ORB+BF')
+    build.add_argument('--nfeatures', type=int, default=1000)
+    info = commands.add_parser('info', help="print shard header")
+    info.add_argument('shard')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        extractor_cls, matcher_cls = METHODS[args.method]
+        gallery = Gallery(extractor_cls(nfeatures=args.nfeatures), matcher_cls())
+        images = sorted(p for p in Path(args.images).iterdir()
+                        if p.suffix.lower() in IMAGE_EXTENSIONS)
+        gallery.enroll_many((p.stem, str(p)) for p in images)
+        write_shard(args.output, gallery)
+        print(f"Wrote {len(gallery)} prints to {args.output}")
+        return 0
+
+    with open(args.shard, 'rb') as f:
+        header = f.read(HEADER.size)
+        magic, version, dtype_code, cols, config_size, num_prints, num_descriptors = \
+            HEADER.unpack(header)
+        if magic != MAGIC:
+            print(f"Not a gallery shard: {args.shard}", file=sys.stderr)
+            return 1
+        config = json.loads(f.read(config_size))
+    print(json.dumps({'version': version, 'prints': num_prints,
+                      'descriptors': num_descriptors, 'columns': cols,
+                      'dtype': np.dtype(DTYPES[dtype_code]).name, **config}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,218 @@
+import sys
+import json
+import math
+import argparse
+from pathlib import Path
+from datetime import datetime
+import numpy as np
+
+
+class ResultStore:
+    """
+    Append-only JSON lines store, one file per run
+
+    Every record is one MatchResult.get_summary() (all time_<stage> columns
+    included) plus the image paths and a timestamp. Records are buffered and
+    written batch_size at a time, so storing a result costs no file I/O.
+    """
+
+    def __init__(self, directory: str = "results", run_id: str = None,
+                 batch_size: int = 256):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.run_id = run_id or datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        self.path = self.directory / f"run_{self.run_id}.jsonl"
+        self.batch_size = batch_size
+        self._buffer = []
+        self._file = None
+
+    def append(self, result, img1_path: str = None, img2_path: str = None):
+        """Store one MatchResult (or summary dict), paths default to the result's"""
+        record = result if isinstance(result, dict) else result.get_summary()
+        record = {
+            'img1': img1_path or getattr(result, 'img1_path', None),
+            'img2': img2_path or getattr(result, 'img2_path', None),
+            'timestamp': datetime.now().isoformat(timespec='milliseconds'),
+            **record
+        }
+        self._buffer.append(json.dumps(record))
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def append_error(self, img1_path: str, img2_path: str, error: str):
+        """Store a failed comparison so it is counted by summarize()"""
+        self._buffer.append(json.dumps({
+            'img1': img1_path, 'img2': img2_path,
+            'timestamp': datetime.now().isoformat(timespec='milliseconds'),
+            'error': error
+        }))
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write buffered records with one write call"""
+        if not self._buffer:
+            return
+        if self._file is None:
+            # Append mode: never rewrites what is already on disk
+            self._file = open(self.path, 'a')
+        self._file.write("\n".join(self._buffer) + "\n")
+        self._file.flush()
+        self._buffer.clear()
+
+    def close(self):
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class LatencyHistogram:
+    """
+    Streaming percentile estimate with log-spaced buckets
+
+    Memory is constant regardless of row count, relative error is below
+    10^(1/buckets_per_decade) - 1 (~6% with the default 40 per decade).
+    """
+
+    def __init__(self, min_seconds: float = 1e-6, max_seconds: float = 1e3,
+                 buckets_per_decade: int = 40):
+        self.min_log = math.log10(min_seconds)
+        self.buckets_per_decade = buckets_per_decade
+        num_buckets = int((math.log10(max_seconds) - self.min_log) * buckets_per_decade) + 1
+        self.counts = np.zeros(num_buckets + 1, dtype=np.int64)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        # Bucket 0 holds zero and anything below min_seconds
+        if seconds <= 0:
+            bucket = 0
+        else:
+            bucket = int((math.log10(seconds) - self.min_log) * self.buckets_per_decade) + 1
+            bucket = min(max(bucket, 0), len(self.counts) - 1)
+        self.counts[bucket] += 1
+
+    def percentile(self, p: float) -> float:
+        """Upper edge of the bucket holding the p-th percentile"""
+        if self.count == 0:
+            return 0.0
+        bucket = int(np.searchsorted(np.cumsum(self.counts), math.ceil(self.count * p / 100)))
+        if bucket == 0:
+            return 0.0
+        return 10 ** (self.min_log + bucket / self.buckets_per_decade)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+def read_records(paths):
+    """Stream records from .jsonl files or directories of them"""
+    for path in paths:
+        path = Path(path)
+        files = sorted(path.glob("*.jsonl")) if path.is_dir() else [path]
+        for file_path in files:
+            with open(file_path) as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+
+
+def summarize(records, method: str = None, percentiles=(50, 95, 99)) -> dict:
+    """
+    Aggregate latency and match counts per method in a single pass
+    Returns {method: {'count', 'matches': {...}, 'latency': {stage: {...}}}},
+    failed comparisons are counted under 'errors'
+    """
+    methods = {}
+    errors = 0
+
+    for record in records:
+        if 'error' in record:
+            errors += 1
+            continue
+        if method is not None and record['method'] != method:
+            continue
+
+        stats = methods.setdefault(record['method'], {
+            'count': 0, 'matches_sum': 0, 'matches_min': None, 'matches_max': None,
+            'inliers_sum': 0, 'inliers_count': 0, 'histograms': {}
+        })
+        stats['count'] += 1
+        matches = record['matches']
+        stats['matches_sum'] += matches
+        if stats['matches_min'] is None or matches < stats['matches_min']:
+            stats['matches_min'] = matches
+        if stats['matches_max'] is None or matches > stats['matches_max']:
+            stats['matches_max'] = matches
+        if record.get('inliers') is not None:
+            stats['inliers_sum'] += record['inliers']
+            stats['inliers_count'] += 1
+
+        for key, value in record.items():
+            if key.startswith('time_'):
+                name = 'total' if key == 'time_seconds' else key[len('time_'):]
+                stats['histograms'].setdefault(name, LatencyHistogram()).add(value)
+
+    summary = {'errors': errors}
+    for name, stats in methods.items():
+        summary[name] = {
+            'count': stats['count'],
+            'matches': {
+                'mean': stats['matches_sum'] / stats['count'],
+                'min': stats['matches_min'],
+                'max': stats['matches_max']
+            },
+            'latency': {
+                stage_name: {'mean': hist.mean,
+                             **{f"p{p}": hist.percentile(p) for p in percentiles}}
+                for stage_name, hist in stats['histograms'].items()
+            }
+        }
+        if stats['inliers_count']:
+            summary[name]['inliers_mean'] = stats['inliers_sum'] / stats['inliers_count']
+
+    return summary
+
+
+def format_summary(summary: dict) -> str:
+    """Human readable table of summarize() output (milliseconds)"""
+    lines = []
+    for name, stats in summary.items():
+        if name == 'errors':
+            continue
+        matches = stats['matches']
+        lines.append(f"{name} ({stats['count']} results): matches mean "
+                     f"{matches['mean']:.1f} (min {matches['min']}, max {matches['max']})"
+                     + (f", inliers mean {stats['inliers_mean']:.1f}"
+                        if 'inliers_mean' in stats else ""))
+        for stage_name, points in stats['latency'].items():
+            values = "  ".join(f"{p}={v * 1000:.2f}ms" for p, v in points.items())
+            lines.append(f"  {stage_name:<8} {values}")
+    lines.append(f"Errors: {summary['errors']}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize stored match results")
+    parser.add_argument('paths', nargs='+', help=".jsonl files or result directories")
+    parser.add_argument('--method', default=None, help="only this method, e.g. ORB+BF")
+    parser.add_argument('--json', action='store_true', help="print the summary as JSON")
+    args = parser.parse_args()
+
+    summary = summarize(read_records(args.paths), args.method)
+    print(json.dumps(summary, indent=2) if args.json else format_summary(summary))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
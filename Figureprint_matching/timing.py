@@ -0,0 +1,82 @@
+import os
+import time
+from contextlib import contextmanager
+import numpy as np
+
+# Pipeline stages in execution order
+STAGES = ('cache', 'load', 'quality', 'segment', 'extract', 'match', 'verify', 'draw')
+
+# Set by profiling.Profiler.start(), None keeps stage() free of profiling
+_profiler = None
+
+
+def set_profiler(profiler):
+    """Route stage enter/exit events to profiler (None disables)"""
+    global _profiler
+    _profiler = profiler
+
+
+def new_stage_times() -> dict:
+    """Empty stage timing dict with every stage present"""
+    return dict.fromkeys(STAGES, 0.0)
+
+
+@contextmanager
+def stage(stage_times: dict, name: str):
+    """Add the duration of the with-block to stage_times[name] (seconds)"""
+    profiler = _profiler
+    if profiler is not None:
+        profiler.enter(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_times[name] = stage_times.get(name, 0.0) + time.perf_counter() - start
+        if profiler is not None:
+            profiler.exit(name)
+
+
+def latency_percentiles(summaries, percentiles=(50, 95, 99)) -> dict:
+    """
+    Aggregate per-stage latency percentiles from result summaries
+
+    summaries: iterable of MatchResult.get_summary() dicts
+    Returns {method: {'count': n, 'total': {'p50': ...}, 'load': {...}, ...}}
+    """
+    # Collect every time_* column per method
+    columns = {}
+    for summary in summaries:
+        method_columns = columns.setdefault(summary['method'], {})
+        for key, value in summary.items():
+            if key.startswith('time_'):
+                method_columns.setdefault(key, []).append(value)
+
+    stats = {}
+    for method, method_columns in columns.items():
+        method_stats = {'count': len(method_columns.get('time_seconds', []))}
+        for key, values in method_columns.items():
+            name = 'total' if key == 'time_seconds' else key[len('time_'):]
+            points = np.percentile(np.asarray(values, dtype=np.float64), percentiles)
+            method_stats[name] = {f"p{p}": float(v) for p, v in zip(percentiles, points)}
+        stats[method] = method_stats
+
+    return stats
+
+
+def format_percentiles(stats: dict) -> str:
+    """Human readable table of latency_percentiles() output (milliseconds)"""
+    lines = []
+    for method, method_stats in stats.items():
+        lines.append(f"{method} ({method_stats['count']} results):")
+        for name, points in method_stats.items():
+            if name == 'count':
+                continue
+            values = "  ".join(f"{p}={v * 1000:.2f}ms" for p, v in points.items())
+            lines.append(f"  {name:<8} {values}")
+    return "\n".join(lines)
+
+
+# FP_PROFILE=sample,cprofile,memory profiles every stage of the process
+if os.environ.get('FP_PROFILE'):
+    from profiling import enable_from_env
+    enable_from_env()
@@ -0,0 +1,119 @@
+import cv2
+import numpy as np
+
+
+class GeometricVerifier:
+    """
+    RANSAC geometric verification of ratio-test matches
+
+    Fits an affine (rotation, scale, shear, shift) or homography model
+    between matched keypoints and scores the pair by its inlier count.
+    Affine RANSAC evaluates hypotheses in vectorized batches and stops as
+    soon as early_stop_inliers are found or the adaptive iteration bound
+    for the requested confidence is reached.
+    """
+
+    MODELS = ('affine', 'homography')
+
+    def __init__(self, model: str = 'affine', reproj_threshold: float = 8.0,
+                 early_stop_inliers: int = 30, max_iters: int = 1000,
+                 confidence: float = 0.99, batch_size: int = 64, seed: int = 0):
+        if model not in self.MODELS:
+            raise ValueError(f"Unknown model: {model} (use one of {self.MODELS})")
+
+        self.model = model
+        self.reproj_threshold = reproj_threshold
+        self.early_stop_inliers = early_stop_inliers
+        self.max_iters = max_iters
+        self.confidence = confidence
+        self.batch_size = batch_size
+        self.rng = np.random.default_rng(seed)
+
+    def verify(self, pts1: np.ndarray, pts2: np.ndarray) -> tuple:
+        """
+        Fit model mapping pts1 → pts2
+        Returns (num_inliers, inlier_ratio, matrix or None, inlier mask)
+        """
+        n = len(pts1)
+        min_samples = 3 if self.model == 'affine' else 4
+        if n < min_samples:
+            return 0, 0.0, None, np.zeros(n, dtype=bool)
+
+        if self.model == 'affine':
+            matrix, mask = self._ransac_affine(pts1.astype(np.float64),
+                                               pts2.astype(np.float64))
+        else:
+            matrix, mask = self._ransac_homography(pts1, pts2)
+
+        num_inliers = int(mask.sum())
+        return num_inliers, num_inliers / n, matrix, mask
+
+    def _ransac_affine(self, pts1: np.ndarray, pts2: np.ndarray) -> tuple:
+        n = len(pts1)
+        src = np.hstack([pts1, np.ones((n, 1))])  # homogeneous (n × 3)
+        threshold_sq = self.reproj_threshold ** 2
+
+        best_count = 0
+        best_mask = np.zeros(n, dtype=bool)
+        needed_iters = self.max_iters
+        iters = 0
+
+        while iters < min(needed_iters, self.max_iters):
+            # Batch of 3-point samples, degenerate (repeated/collinear) dropped
+            samples = self.rng.integers(0, n, size=(self.batch_size, 3))
+            iters += self.batch_size
+
+            a = src[samples]  # (B × 3 × 3)
+            valid = np.abs(np.linalg.det(a)) > 1e-6
+            if not valid.any():
+                continue
+
+            # Solve a @ m = dst for every hypothesis at once, m is (3 × 2)
+            models = np.linalg.solve(a[valid], pts2[samples[valid]])
+
+            # Reprojection error of every point under every hypothesis
+            projected = src @ models  # (B × n × 2)
+            errors = ((projected - pts2) ** 2).sum(axis=2)
+            counts = (errors < threshold_sq).sum(axis=1)
+
+            best = int(counts.argmax())
+            if counts[best] > best_count:
+                best_count = int(counts[best])
+                best_mask = errors[best] < threshold_sq
+                needed_iters = self._needed_iters(best_count / n, 3)
+
+            # Enough support for a confident decision → stop early
+            if best_count >= self.early_stop_inliers:
+                break
+
+        if best_count < 3:
+            return None, np.zeros(n, dtype=bool)
+
+        # Refine on all inliers with least squares, then recount
+        model, *_ = np.linalg.lstsq(src[best_mask], pts2[best_mask], rcond=None)
+        errors = ((src @ model - pts2) ** 2).sum(axis=1)
+        mask = errors < threshold_sq
+        if mask.sum() < best_count:
+            mask = best_mask
+
+        return model.T.astype(np.float32), mask
+
+    def _ransac_homography(self, pts1: np.ndarray, pts2: np.ndarray) -> tuple:
+        # OpenCV RANSAC already stops adaptively at the given confidence
+        matrix, mask = cv2.findHomography(
+            pts1.astype(np.float32), pts2.astype(np.float32), cv2.RANSAC,
+            self.reproj_threshold, maxIters=self.max_iters,
+            confidence=self.confidence
+        )
+        if matrix is None:
+            return None, np.zeros(len(pts1), dtype=bool)
+        return matrix, mask.ravel().astype(bool)
+
+    def _needed_iters(self, inlier_ratio: float, sample_size: int) -> int:
+        """Standard RANSAC bound: iterations to hit confidence at this ratio"""
+        p_good = inlier_ratio ** sample_size
+        if p_good >= 1.0:
+            return 0
+        if p_good <= 0.0:
+            return self.max_iters
+        return int(np.ceil(np.log(1 - self.confidence) / np.log(1 - p_good)))